@@ -0,0 +1,234 @@
+"""
+Client overhead benchmark for every `DockerClient` API, run against the fake
+Docker Engine so that regressions in `utils.api_call` and friends show up
+without dockerd's own latency in the way.
+
+Reports ops/sec, p50/p99 latency and allocations per request: the peak memory
+allocated while making one request, and the number of memory blocks still
+allocated afterwards which should be ~0 unless something is leaking or
+growing a cache. The peak includes the 256KiB buffer asyncio allocates for
+every socket read.
+
+    $ python benchmarks/bench_client.py [--requests N] [--concurrency C]
+                                        [--latency SECONDS] [--only NAME]
+                                        [--metrics]
+
+With `--metrics` the client records every request to an `InMemoryMetrics`
+sink, compare against a run without to see the instrumentation overhead.
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.config import ContainerConfig, ExecConfig  # noqa: E402
+from ufaas_dockerapi.metrics import InMemoryMetrics  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+Op = Callable[[DockerClient, int], Awaitable[object]]
+Setup = Callable[[DockerClient, int], Awaitable[None]]
+
+CONFIG = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False,
+                         env={"FUNCTION": "bench"})
+EXEC = ExecConfig(cmd=["true"], tty=False)
+
+EXEC_IDS: Dict[int, str] = {}
+
+
+async def start_engine(path: str, latency: float) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        "--latency", str(latency), "--payload-size", "1024", env=env,
+        stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+async def create_containers(client: DockerClient, n: int) -> None:
+    async for res in client.container.create_many(
+            (("bench-%d" % i, CONFIG) for i in range(n))):
+        pass
+
+
+async def start_containers(client: DockerClient, n: int) -> None:
+    await create_containers(client, n)
+    async for res in client.container.start_many(
+            "bench-%d" % i for i in range(n)):
+        pass
+
+
+async def pull_images(client: DockerClient, n: int) -> None:
+    for i in range(n):
+        await client.image.pull("img%d" % i, tag="1")
+
+
+async def create_execs(client: DockerClient, n: int) -> None:
+    await start_containers(client, 1)
+    for i in range(n):
+        _, res = await client.exec.exec_create("bench-0", EXEC)
+        EXEC_IDS[i] = res["Id"]  # type: ignore
+
+
+async def attach(client: DockerClient, i: int) -> object:
+    stream = await client.container.attach("bench-%d" % i)
+    return await stream.read()
+
+
+async def attach_websocket(client: DockerClient, i: int) -> object:
+    ws = await client.container.attach_websocket("bench-%d" % i,
+                                                 attach_stdin=True)
+    await ws.send_str("echo\n")
+    msg = await ws.receive()
+    await ws.close()
+    return msg
+
+
+async def pull_stream(client: DockerClient, i: int) -> object:
+    return [m async for m in client.image.pull_stream("alpine", tag="3.8")]
+
+
+async def exec_start_stream(client: DockerClient, i: int) -> object:
+    stream = await client.exec.exec_start_stream(EXEC_IDS[i])
+    return await stream.read()
+
+
+async def exec_run(client: DockerClient, i: int) -> object:
+    output = await client.exec.run("bench-0", EXEC)
+    return await output.read()
+
+
+# name: (setup, operation)
+BENCHMARKS: List[Tuple[str, Optional[Setup], Op]] = [
+    ("system.version", None, lambda c, i: c.system.version()),
+    ("image.pull", None, lambda c, i: c.image.pull("alpine", tag="3.8")),
+    ("image.pull_stream", None, pull_stream),
+    ("image.remove", pull_images,
+     lambda c, i: c.image.remove("img%d:1" % i)),
+    ("container.create", None,
+     lambda c, i: c.container.create("bench-%d" % i, CONFIG)),
+    ("container.start", create_containers,
+     lambda c, i: c.container.start("bench-%d" % i)),
+    ("container.stop", start_containers,
+     lambda c, i: c.container.stop("bench-%d" % i)),
+    ("container.restart", create_containers,
+     lambda c, i: c.container.restart("bench-%d" % i)),
+    ("container.delete", create_containers,
+     lambda c, i: c.container.delete("bench-%d" % i)),
+    ("container.attach", create_containers, attach),
+    ("container.attach_websocket", create_containers, attach_websocket),
+    ("exec.exec_create", lambda c, n: start_containers(c, 1),
+     lambda c, i: c.exec.exec_create("bench-0", EXEC)),
+    ("exec.exec_start_stream", create_execs, exec_start_stream),
+    ("exec.run", lambda c, n: start_containers(c, 1), exec_run),
+]
+
+
+def percentile(samples: List[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[int(round((p / 100) * (len(samples) - 1)))]
+
+
+async def run_op(client: DockerClient, op: Op, n: int, concurrency: int
+                 ) -> Tuple[float, List[float]]:
+    latencies: List[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with sem:
+            start = time.perf_counter()
+            await op(client, i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(n)])
+    return time.perf_counter() - start, latencies
+
+
+async def measure_alloc(client: DockerClient, op: Op, offset: int,
+                        n: int) -> Tuple[float, float]:
+    """
+    Average (peak KiB, retained blocks) for a single request. Uses the `2n`
+    request indexes from `offset`.
+    """
+    # Blocks are counted without tracemalloc, which allocates on its own.
+    # Counting starts after one request, which frees what was left behind by
+    # the timed run.
+    await op(client, offset)
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    for i in range(offset + 1, offset + n):
+        await op(client, i)
+    gc.collect()
+    retained = (sys.getallocatedblocks() - blocks) / (n - 1)
+
+    tracemalloc.start()
+    total = 0
+    for i in range(offset + n, offset + 2 * n):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        await op(client, i)
+        _, peak = tracemalloc.get_traced_memory()
+        total += peak - base
+    tracemalloc.stop()
+    return total / n / 1024, retained
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    n = args.requests
+    alloc_n = max(2, min(50, n // 10))
+    print("%d requests per API, concurrency %d, %.1fms engine latency%s" % (
+        n, args.concurrency, args.latency * 1000,
+        ", with metrics" if args.metrics else ""))
+    print("%-28s %10s %10s %10s %14s %12s" % (
+        "API", "ops/sec", "p50 (ms)", "p99 (ms)", "peak KiB/req",
+        "blocks/req"))
+    for name, setup, op in BENCHMARKS:
+        if args.only and args.only not in name:
+            continue
+        # A fresh engine per API so that state doesn't leak between them.
+        with tempfile.TemporaryDirectory() as tmp:
+            sock = os.path.join(tmp, "docker.sock")
+            engine = await start_engine(sock, args.latency)
+            try:
+                metrics = InMemoryMetrics() if args.metrics else None
+                async with DockerClient(DockerSock(sock),
+                                        metrics=metrics) as client:
+                    if setup is not None:
+                        await setup(client, n + 2 * alloc_n)
+                    elapsed, latencies = await run_op(
+                        client, op, n, args.concurrency)
+                    peak, blocks = await measure_alloc(client, op, n,
+                                                       alloc_n)
+            finally:
+                engine.terminate()
+                await engine.wait()
+        print("%-28s %10.0f %10.3f %10.3f %14.1f %12.1f" % (
+            name, n / elapsed, percentile(latencies, 50) * 1000,
+            percentile(latencies, 99) * 1000, peak, blocks))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--only", help="Only run APIs containing this.")
+    parser.add_argument("--metrics", action="store_true")
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
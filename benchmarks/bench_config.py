@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of config serialization: the original
+`strip_nulls(asdict(config, dict_factory=config_dict_factory))` against the
+cached per-class `serialize_config`, and the latter encoded as a request
+body with the default codec, see `ufaas_dockerapi.codec`.
+
+    $ python benchmarks/bench_config.py [--number N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from dataclasses import asdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402,F401
+from ufaas_dockerapi.codec import default_codec  # noqa: E402
+from ufaas_dockerapi.config import (ContainerConfig, ExecConfig,  # noqa: E402
+                                    HostConfig, config_dict_factory,
+                                    serialize_config)
+from ufaas_dockerapi.utils import strip_nulls  # noqa: E402
+
+CONTAINER = ContainerConfig(
+    image="alpine:3.8", hostname="fn", cmd=["/bin/ash", "-c", "serve"],
+    tty=False, attach_stdin=True, attach_stdout=True, attach_stderr=True,
+    open_stdin=True, stdin_once=True, working_dir="/srv",
+    env={"FUNCTION": "resize", "MEMORY": 128, "TIMEOUT": 2.5},
+    labels={"ufaas.function": "resize", "ufaas.version": "3"},
+    host_config=HostConfig())
+
+EXEC = ExecConfig(cmd=["python", "-m", "handler"], tty=False,
+                  attach_stdout=True, attach_stderr=True,
+                  env={"REQUEST_ID": "42"}, working_dir="/srv")
+
+
+CODEC = default_codec()
+
+
+def old(config: object) -> object:
+    return strip_nulls(asdict(config, dict_factory=config_dict_factory))
+
+
+def body(config: object) -> bytes:
+    return CODEC.dumps(serialize_config(config))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+    print("%-16s %-18s %12s" % ("config", "path", "us/call"))
+    for name, config in (("ContainerConfig", CONTAINER), ("ExecConfig", EXEC)):
+        assert old(config) == serialize_config(config)
+        for path, fn in (("asdict", old),
+                         ("serialize_config", serialize_config),
+                         ("%s body" % CODEC.name, body)):
+            elapsed = timeit.timeit(lambda: fn(config), number=args.number)
+            print("%-16s %-18s %12.2f" % (name, path,
+                                          elapsed / args.number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Throughput of the stdout/stderr demultiplexer for large exec outputs, in MB/s.
+
+Measures the parser on its own against a naive bytes-concatenating parser, and
+end to end through `ExecAPI.exec_start_stream` over a Unix socket.
+
+    $ python benchmarks/bench_demux.py [--size MB] [--frame KB] [--chunk KB]
+"""
+
+import argparse
+import asyncio
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.streams import StreamDemuxer  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+HEADER = struct.Struct(">BxxxL")
+
+
+def make_output(size: int, frame_size: int) -> bytes:
+    payload = b"x" * frame_size
+    frames = []
+    for i in range(size // frame_size):
+        # Mostly stdout with the odd line of stderr.
+        frames.append(HEADER.pack(2 if i % 10 == 0 else 1, frame_size))
+        frames.append(payload)
+    return b"".join(frames)
+
+
+def chunked(data: bytes, chunk_size: int) -> List[bytes]:
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def naive_demux(chunks: List[bytes]) -> List[Tuple[int, bytes]]:
+    """
+    Buffer everything and slice frames off the front, a common first attempt.
+    """
+    buf = b""
+    frames = []
+    for chunk in chunks:
+        buf += chunk
+        while len(buf) >= 8:
+            stream_id, size = HEADER.unpack(buf[:8])
+            if len(buf) < 8 + size:
+                break
+            frames.append((stream_id, buf[8:8 + size]))
+            buf = buf[8 + size:]
+    return frames
+
+
+def demux(chunks: List[bytes]) -> List[Tuple[int, bytes]]:
+    demuxer = StreamDemuxer()
+    frames = []
+    for chunk in chunks:
+        frames.extend(demuxer.feed(chunk))
+    return frames
+
+
+def bench_parser(data: bytes, chunk_size: int) -> None:
+    chunks = chunked(data, chunk_size)
+    mb = len(data) / 1e6
+    for name, fn in (("naive", naive_demux), ("StreamDemuxer", demux)):
+        start = time.perf_counter()
+        fn(chunks)
+        elapsed = time.perf_counter() - start
+        print("%-16s %10.0f MB/s" % (name, mb / elapsed))
+
+
+async def serve_exec(request: web.Request) -> web.StreamResponse:
+    resp = web.StreamResponse(
+        headers={"Content-Type": "application/vnd.docker.raw-stream"})
+    await resp.prepare(request)
+    for chunk in request.app["chunks"]:
+        await resp.write(chunk)
+    await resp.write_eof()
+    return resp
+
+
+async def bench_end_to_end(data: bytes, chunk_size: int) -> None:
+    app = web.Application()
+    app["chunks"] = chunked(data, chunk_size)
+    # Requests are prefixed with the API version, given to the client as
+    # there is no /version to negotiate it with.
+    app.router.add_post("/v1.39/exec/{id}/start", serve_exec)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        await web.UnixSite(runner, sock).start()
+        async with DockerClient(DockerSock(sock), version=(1, 39)) as client:
+            start = time.perf_counter()
+            stream = await client.exec.exec_start_stream("bench")
+            out, err = stream.stdout(), stream.stderr()
+            received = 0
+
+            async def drain_err() -> None:
+                async for _ in err:
+                    pass
+            err_task = asyncio.ensure_future(drain_err())
+            async for payload in out:
+                received += len(payload)
+            await err_task
+            elapsed = time.perf_counter() - start
+    await runner.cleanup()
+    print("%-16s %10.0f MB/s (client and server share one process)" % (
+        "exec stdout()", len(data) / 1e6 / elapsed))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=256, help="MB")
+    parser.add_argument("--frame", type=int, default=16, help="KB")
+    parser.add_argument("--chunk", type=int, default=64, help="KB")
+    args = parser.parse_args()
+    data = make_output(args.size * 1024 * 1024, args.frame * 1024)
+    print("%d MB output, %d KB frames, %d KB chunks" % (
+        args.size, args.frame, args.chunk))
+    bench_parser(data, args.chunk * 1024)
+    asyncio.run(bench_end_to_end(data, args.chunk * 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Latency of deploying a new function version to warm containers, by copying
+the code in with `ContainerAPI.put_archive`, once per container or with
+`put_archive_many` which archives it once for all of them, against
+rebuilding the image with `ImageAPI.build` and recreating every container
+from it, run against the fake Docker Engine.
+
+The fake engine "builds" as soon as it has read the context and starts
+containers instantly, where dockerd would run the Dockerfile and start
+processes, so the rebuild figures are a lower bound: they only count the
+requests, while copying pays for sending the code to every container.
+
+    $ python benchmarks/bench_deploy.py [--containers N] [--files N]
+                                        [--file-size BYTES] [--iterations N]
+                                        [--latency SECONDS]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.config import ContainerConfig  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+CONFIG = ContainerConfig(image="fn:latest", cmd=["/bin/ash"], tty=False)
+
+
+async def start_engine(path: str, latency: float
+                       ) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        "--latency", str(latency), env=env, stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+def make_code(root: str, files: int, file_size: int) -> None:
+    with open(os.path.join(root, "Dockerfile"), "w") as f:
+        f.write("FROM python:3.7-alpine\nCOPY app /app\n")
+    os.mkdir(os.path.join(root, "app"))
+    for i in range(files):
+        with open(os.path.join(root, "app", "mod%d.py" % i), "wb") as f:
+            f.write(os.urandom(file_size))
+
+
+def percentile(samples: List[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[int(round((p / 100) * (len(samples) - 1)))]
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        code = os.path.join(tmp, "code")
+        os.mkdir(code)
+        make_code(code, args.files, args.file_size)
+        version = os.path.join(code, "app", "VERSION")
+        engine = await start_engine(sock, args.latency)
+        try:
+            async with DockerClient(DockerSock(sock)) as client:
+                names = ["fn-%d" % i for i in range(args.containers)]
+                async for _ in client.image.build(code, tag="fn"):
+                    pass
+                for name in names:
+                    await client.container.create(name, CONFIG)
+                    await client.container.start(name)
+
+                async def put_archive(i: int) -> None:
+                    with open(version, "w") as f:
+                        f.write(str(i))
+                    await asyncio.gather(*[
+                        client.container.put_archive(n, "/app",
+                                                     os.path.join(code, "app"))
+                        for n in names])
+
+                async def put_archive_many(i: int) -> None:
+                    with open(version, "w") as f:
+                        f.write(str(i))
+                    async for res in client.container.put_archive_many(
+                            names, "/app", os.path.join(code, "app")):
+                        assert res.ok, res.error
+
+                async def recreate(name: str) -> None:
+                    await client.container.stop(name)
+                    await client.container.delete(name)
+                    await client.container.create(name, CONFIG)
+                    await client.container.start(name)
+
+                async def rebuild(i: int) -> None:
+                    with open(version, "w") as f:
+                        f.write(str(i))
+                    async for msg in client.image.build(code, tag="fn"):
+                        assert "error" not in msg, msg
+                    await asyncio.gather(*[recreate(n) for n in names])
+
+                rows: List[Tuple[str, Callable[[int], Awaitable[None]]]] = [
+                    ("put_archive", put_archive),
+                    ("put_archive_many", put_archive_many),
+                    ("rebuild + recreate", rebuild),
+                ]
+                print("%d containers, %d files of %d bytes, %.1fms engine "
+                      "latency" % (args.containers, args.files,
+                                   args.file_size, args.latency * 1000))
+                print("%-20s %10s %10s %10s" % ("", "mean (ms)", "p50 (ms)",
+                                                "max (ms)"))
+                for name, deploy in rows:
+                    samples = []
+                    for i in range(args.iterations):
+                        start = time.perf_counter()
+                        await deploy(i)
+                        samples.append(time.perf_counter() - start)
+                    print("%-20s %10.1f %10.1f %10.1f" % (
+                        name, sum(samples) / len(samples) * 1000,
+                        percentile(samples, 50) * 1000, max(samples) * 1000))
+        finally:
+            engine.terminate()
+            await engine.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--containers", type=int, default=20)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--file-size", type=int, default=4096)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.001)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Exec throughput of a single `DockerClient` against a `Dispatcher` with a
+growing number of worker processes, run against the fake Docker Engine.
+
+`--concurrency` tasks run `--invocations` execs printing `--payload-size`
+bytes each across `--containers` containers. With the dispatcher the
+parent process only routes invocations and copies outputs out of shared
+memory, so its CPU time per invocation is reported too. Throughput can only
+scale while there are idle cores, and the fake engine is a single process
+that needs CPU of its own, so it is the limit well before dockerd would be.
+
+    $ python benchmarks/bench_dispatch.py [--invocations N] [--containers N]
+                                          [--concurrency N]
+                                          [--payload-size BYTES]
+                                          [--max-workers N]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.config import ContainerConfig, ExecConfig  # noqa: E402
+from ufaas_dockerapi.dispatcher import Dispatcher  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+CONFIG = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+OUTPUT = ExecConfig(cmd=["payload"], tty=False)
+
+
+async def start_engine(path: str, payload_size: int
+                       ) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        "--payload-size", str(payload_size), env=env,
+        stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+async def run(args: argparse.Namespace, name: str, containers: List[str],
+              invoke: Callable[[str], Awaitable[int]]) -> None:
+    remaining = args.invocations
+    received = 0
+
+    async def runner() -> None:
+        nonlocal remaining, received
+        while remaining > 0:
+            remaining -= 1
+            size = await invoke(containers[remaining % len(containers)])
+            received += size
+
+    start = time.perf_counter()
+    cpu = time.process_time()
+    await asyncio.gather(*[runner() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    print("%-14s %12.0f %10.1f %16.3f" % (
+        name, args.invocations / elapsed, received / elapsed / 2 ** 20,
+        cpu / args.invocations * 1000))
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    containers = ["bench-%d" % i for i in range(args.containers)]
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        engine = await start_engine(sock, args.payload_size)
+        try:
+            async with DockerClient(DockerSock(sock)) as client:
+                for name in containers:
+                    await client.container.create(name, CONFIG)
+                    await client.container.start(name)
+                print("%d execs of %d bytes, %d at once, %d CPUs" % (
+                    args.invocations, args.payload_size, args.concurrency,
+                    os.cpu_count() or 1))
+                print("%-14s %12s %10s %16s" % (
+                    "", "execs/s", "MB/s", "parent CPU (ms)"))
+
+                async def direct(container: str) -> int:
+                    proc = await client.exec.spawn(container, OUTPUT)
+                    async with proc:
+                        stdout, _ = await proc.read()
+                        await proc.wait()
+                    return len(stdout)
+
+                await run(args, "in process", containers, direct)
+
+            workers = 1
+            while workers <= args.max_workers:
+                async with Dispatcher(DockerSock(sock),
+                                      workers=workers) as dispatcher:
+
+                    async def dispatched(container: str) -> int:
+                        result = await dispatcher.exec(container, OUTPUT)
+                        return len(result.stdout)
+
+                    await run(args, "%d workers" % workers, containers,
+                              dispatched)
+                workers *= 2
+        finally:
+            engine.terminate()
+            await engine.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invocations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--containers", type=int, default=64)
+    parser.add_argument("--payload-size", type=int, default=256 * 1024)
+    parser.add_argument("--max-workers", type=int,
+                        default=os.cpu_count() or 1)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
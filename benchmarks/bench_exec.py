@@ -0,0 +1,163 @@
+"""
+Exec round-trip latency: `ExecAPI.run`, which reads the output from the exec
+start response, against `ExecAPI.spawn`, which hijacks the exec start
+connection, run against the fake Docker Engine.
+
+Both run a command which prints nothing, to the end of its output. For
+`spawn` the time to the first byte of `--payload-size` bytes of output is
+reported as well. The "echo" rows send a message to a `cat` process and wait
+for it to come back, with a new exec per message and many times over one
+hijacked connection. The "session" row makes the same round
+trip through an `ExecSession`, which adds request framing and dispatch.
+
+    $ python benchmarks/bench_exec.py [--iterations N] [--latency SECONDS]
+                                      [--payload-size BYTES]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.config import ContainerConfig, ExecConfig  # noqa: E402
+from ufaas_dockerapi.session import ExecSession  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+CONFIG = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+EMPTY = ExecConfig(cmd=["true"], tty=False)
+OUTPUT = ExecConfig(cmd=["payload"], tty=False)
+CAT = ExecConfig(cmd=["cat"], attach_stdin=True, tty=False)
+MESSAGE = b"x" * 64
+
+
+async def start_engine(path: str, latency: float, payload_size: int
+                       ) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        "--latency", str(latency), "--payload-size", str(payload_size),
+        env=env, stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+def percentile(samples: List[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[int(round((p / 100) * (len(samples) - 1)))]
+
+
+async def measure(n: int, op: Callable[[], Awaitable[float]]) -> List[float]:
+    """
+    `op` returns the time it measured itself.
+    """
+    await op()
+    return [await op() for _ in range(n)]
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        engine = await start_engine(sock, args.latency, args.payload_size)
+        try:
+            async with DockerClient(DockerSock(sock)) as client:
+                await client.container.create("bench", CONFIG)
+                await client.container.start("bench")
+
+                async def run() -> float:
+                    start = time.perf_counter()
+                    output = await client.exec.run("bench", EMPTY)
+                    await output.read()
+                    return time.perf_counter() - start
+
+                async def spawn_first_byte() -> float:
+                    start = time.perf_counter()
+                    proc = await client.exec.spawn("bench", OUTPUT)
+                    async for _ in proc:
+                        break
+                    elapsed = time.perf_counter() - start
+                    proc.close()
+                    return elapsed
+
+                async def spawn_wait() -> float:
+                    start = time.perf_counter()
+                    proc = await client.exec.spawn("bench", EMPTY)
+                    await proc.read()
+                    await proc.wait()
+                    return time.perf_counter() - start
+
+                async def echo_run() -> float:
+                    start = time.perf_counter()
+                    proc = await client.exec.spawn("bench", CAT)
+                    await proc.write(MESSAGE)
+                    await proc.close_stdin()
+                    await proc.read()
+                    return time.perf_counter() - start
+
+                proc = await client.exec.spawn("bench", CAT)
+                frames = proc.frames()
+
+                async def echo_session() -> float:
+                    start = time.perf_counter()
+                    await proc.write(MESSAGE)
+                    received = 0
+                    async for _, payload in frames:
+                        received += len(payload)
+                        if received >= len(MESSAGE):
+                            break
+                    return time.perf_counter() - start
+
+                session = ExecSession(client, "bench",
+                                      ["ufaas-session-echo"])
+                await session.start()
+
+                async def session_call() -> float:
+                    start = time.perf_counter()
+                    await session.call(MESSAGE)
+                    return time.perf_counter() - start
+
+                rows = [
+                    ("run", run),
+                    ("spawn, read + wait", spawn_wait),
+                    ("spawn, first byte", spawn_first_byte),
+                    ("echo, exec per message", echo_run),
+                    ("echo, one hijacked exec", echo_session),
+                    ("echo, exec session", session_call),
+                ]
+                print("%d iterations, %.1fms engine latency, %d byte payload"
+                      % (args.iterations, args.latency * 1000,
+                         args.payload_size))
+                print("%-26s %10s %10s %10s" % ("", "mean (ms)", "p50 (ms)",
+                                                "p99 (ms)"))
+                for name, op in rows:
+                    samples = await measure(args.iterations, op)
+                    print("%-26s %10.3f %10.3f %10.3f" % (
+                        name, sum(samples) / len(samples) * 1000,
+                        percentile(samples, 50) * 1000,
+                        percentile(samples, 99) * 1000))
+                await proc.close_stdin()
+                await proc.read()
+                await session.close()
+        finally:
+            engine.terminate()
+            await engine.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--payload-size", type=int, default=64 * 1024)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
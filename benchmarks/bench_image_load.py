@@ -0,0 +1,95 @@
+"""
+Throughput and client memory of moving multi-GB image archives to and from
+the fake Docker Engine: `ImageAPI.save` to disk, `ImageAPI.load` from disk,
+and with `--naive` a load that reads the whole archive into memory first.
+
+Peak RSS is the client process's high-water mark after each step, so the
+naive load runs last. It needs about three times the archive's size in
+memory, so keep `--size-mb` within a third of the machine's RAM with it.
+
+    $ python benchmarks/bench_image_load.py [--size-mb MB] [--naive]
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+
+async def start_engine(path: str, image_size: int
+                       ) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        "--image-size", str(image_size), env=env, stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(name: str, size: int, elapsed: float) -> None:
+    print("%-16s %10.0f %12.0f %14.0f" % (
+        name, elapsed * 1000, size / elapsed / 2 ** 20, peak_rss_mb()))
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        archive = os.path.join(tmp, "image.tar")
+        engine = await start_engine(sock, args.size_mb * 2 ** 20)
+        try:
+            async with DockerClient(DockerSock(sock)) as client:
+                await client.image.pull("bench")
+                print("%d MB archive, peak RSS at start %.0f MB"
+                      % (args.size_mb, peak_rss_mb()))
+                print("%-16s %10s %12s %14s" % ("", "time (ms)", "MB/s",
+                                                "peak RSS (MB)"))
+
+                start = time.perf_counter()
+                size = await client.image.save(["bench"], archive)
+                report("save", size, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                async for msg in client.image.load(archive):
+                    assert "error" not in msg, msg
+                report("load", size, time.perf_counter() - start)
+
+                if args.naive:
+                    start = time.perf_counter()
+                    with open(archive, "rb") as f:
+                        body = f.read()
+                    async with client._session.post(
+                            "http://1.25/images/load", data=body,
+                            headers={"Content-Type": "application/x-tar"}
+                            ) as resp:
+                        await resp.read()
+                    del body
+                    report("load, naive", size, time.perf_counter() - start)
+        finally:
+            engine.terminate()
+            await engine.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=2048)
+    parser.add_argument("--naive", action="store_true")
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
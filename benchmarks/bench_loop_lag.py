@@ -0,0 +1,131 @@
+"""
+Event loop lag while decoding large list responses, with the JSON decoded
+on the loop and off it, and with each available codec, see
+`ufaas_dockerapi.codec`.
+
+`--concurrency` tasks list `--containers` containers on the fake Docker
+Engine as fast as they can for `--duration` seconds, while a ticker that
+sleeps 1ms at a time measures how late the loop wakes it. A big list
+response held up on the loop delays everything else the client is doing,
+such as attaches, by about as long as it takes to decode.
+
+Off the loop a list is decoded with the codec a chunk of elements at a
+time, giving up the GIL in between.
+The maximum lag includes garbage collections, which no codec avoids.
+
+    $ python benchmarks/bench_loop_lag.py [--containers N]
+                                          [--concurrency N]
+                                          [--duration SECONDS]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.codec import (JSONCodec, OrjsonCodec,  # noqa: E402
+                                   orjson)
+from ufaas_dockerapi.config import ContainerConfig  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+CONFIG = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False,
+                         labels={"ufaas.function": "bench",
+                                 "ufaas.version": "1"},
+                         env={"FUNCTION": "bench"})
+TICK = 0.001
+
+
+async def start_engine(path: str) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        env=env, stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+def percentile(samples: List[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[int(round((p / 100) * (len(samples) - 1)))]
+
+
+async def run(args: argparse.Namespace, name: str,
+              client: DockerClient) -> None:
+    lags: List[float] = []
+    lists = 0
+    stop_at = time.monotonic() + args.duration
+
+    async def ticker() -> None:
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - start - TICK)
+
+    async def lister() -> None:
+        nonlocal lists
+        while time.monotonic() < stop_at:
+            _, containers = await client.container.list(all=True,
+                                                        use_cache=False)
+            assert len(containers) == args.containers
+            lists += 1
+
+    await asyncio.gather(ticker(), *[lister()
+                                     for _ in range(args.concurrency)])
+    print("%-22s %8.1f %10.2f %10.2f %10.2f" % (
+        name, lists / args.duration, percentile(lags, 50) * 1000,
+        percentile(lags, 99) * 1000, max(lags) * 1000))
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    codecs = [JSONCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        engine = await start_engine(sock)
+        try:
+            async with DockerClient(DockerSock(sock)) as client:
+                async for res in client.container.create_many(
+                        ("bench-%d" % i, CONFIG)
+                        for i in range(args.containers)):
+                    assert res.ok, res.error
+                async with client._session.get(
+                        "http://1.25/containers/json?all=1") as resp:
+                    size = len(await resp.read())
+            print("%d containers, %.1f MB list response, %d listers" % (
+                args.containers, size / 2 ** 20, args.concurrency))
+            print("%-22s %8s %10s %10s %10s" % (
+                "", "lists/s", "p50 (ms)", "p99 (ms)", "max (ms)"))
+            for codec in codecs:
+                for off_loop in (False, True):
+                    threshold = 256 * 1024 if off_loop else size + 1
+                    async with DockerClient(
+                            DockerSock(sock), codec=codec,
+                            decode_threshold=threshold) as client:
+                        await run(args, "%s, %s" % (
+                            codec.name, "off loop" if off_loop else "on loop"),
+                            client)
+        finally:
+            engine.terminate()
+            await engine.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--containers", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Throughput of a client overloading the fake Docker Engine, with and without
+an adaptive concurrency limit and retries, see `ufaas_dockerapi.limiter`.
+
+The engine works on `--capacity` requests at once, each taking `--latency`
+seconds plus more in proportion to the queue, and keeps working on requests
+the client has given up on. `--workers` tasks inspect a container in a loop,
+each call with a deadline of `--deadline` seconds. Goodput counts the calls
+that finished in time.
+
+    $ python benchmarks/bench_overload.py [--workers N] [--capacity N]
+                                          [--latency SECONDS]
+                                          [--deadline SECONDS]
+                                          [--duration SECONDS]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.config import ContainerConfig  # noqa: E402
+from ufaas_dockerapi.limiter import (ConcurrencyLimits,  # noqa: E402
+                                     RetryPolicy, deadline)
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+CONFIG = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+async def start_engine(path: str, latency: float, capacity: int
+                       ) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        "--latency", str(latency), "--capacity", str(capacity), env=env,
+        stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return float("nan")
+    samples = sorted(samples)
+    return samples[int(round((p / 100) * (len(samples) - 1)))]
+
+
+async def run(args: argparse.Namespace, name: str,
+              limits: Optional[ConcurrencyLimits],
+              retry: Optional[RetryPolicy]) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        engine = await start_engine(sock, args.latency, args.capacity)
+        try:
+            async with DockerClient(DockerSock(sock), limit=0, limits=limits,
+                                    retry=retry) as client:
+                await client.container.create("fn", CONFIG)
+                latencies: List[float] = []
+                failures = 0
+                stop_at = time.monotonic() + args.duration
+
+                async def worker() -> None:
+                    nonlocal failures
+                    while time.monotonic() < stop_at:
+                        start = time.perf_counter()
+                        try:
+                            with deadline(args.deadline):
+                                await client.container.inspect("fn")
+                        except asyncio.TimeoutError:
+                            failures += 1
+                        else:
+                            latencies.append(time.perf_counter() - start)
+
+                await asyncio.gather(*[worker()
+                                       for _ in range(args.workers)])
+                limit = "-"
+                if limits is not None:
+                    limit = str(limits.limiters["read"].limit)
+                print("%-16s %10.0f %10d %10.0f %10.0f %6s" % (
+                    name, len(latencies) / args.duration, failures,
+                    percentile(latencies, 50) * 1000,
+                    percentile(latencies, 99) * 1000, limit))
+        finally:
+            engine.terminate()
+            await engine.wait()
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    print("%d workers, capacity %d, %.0fms latency, %.1fs deadline" % (
+        args.workers, args.capacity, args.latency * 1000, args.deadline))
+    print("%-16s %10s %10s %10s %10s %6s" % (
+        "", "goodput/s", "timeouts", "p50 (ms)", "p99 (ms)", "limit"))
+
+    def retry() -> RetryPolicy:
+        return RetryPolicy(attempt_timeout=args.deadline / 2)
+
+    await run(args, "unlimited", None, None)
+    await run(args, "unlimited, retry", None, retry())
+    await run(args, "aimd", ConcurrencyLimits(), None)
+    await run(args, "aimd, retry", ConcurrencyLimits(), retry())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=400)
+    parser.add_argument("--capacity", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--deadline", type=float, default=1.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Requests/sec for 1k concurrent `container.start`/`container.stop` calls as the
+size of the client's connection pool changes.
+
+The server runs in a subprocess and simulates dockerd taking a little while to
+answer each request.
+
+    $ python benchmarks/bench_pool.py [--calls N] [--latency SECONDS]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+POOL_SIZES = (1, 10, 50, 100, 250, 0)
+
+
+async def serve_lifecycle(request: web.Request) -> web.Response:
+    await asyncio.sleep(request.app["latency"])
+    return web.Response(status=204)
+
+
+async def serve(sock: str, latency: float) -> None:
+    app = web.Application()
+    app["latency"] = latency
+    app.router.add_post("/containers/{id}/start", serve_lifecycle)
+    app.router.add_post("/containers/{id}/stop", serve_lifecycle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.UnixSite(runner, sock, backlog=4096).start()
+    print("ready", flush=True)
+    await asyncio.Event().wait()
+
+
+async def run_pool(sock: str, limit: int, calls: int) -> float:
+    async with DockerClient(DockerSock(sock), limit=limit) as client:
+        async def start_stop(i: int) -> None:
+            await client.container.start("c%d" % i)
+            await client.container.stop("c%d" % i)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[start_stop(i) for i in range(calls)])
+        elapsed = time.perf_counter() - start
+    return (calls * 2) / elapsed
+
+
+async def run_benchmark(calls: int, latency: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        server = await asyncio.create_subprocess_exec(
+            sys.executable, __file__, "--serve", sock,
+            "--latency", str(latency), stdout=subprocess.PIPE)
+        assert server.stdout is not None
+        await server.stdout.readline()
+        try:
+            print("%d concurrent start/stop pairs, %.1fms server latency" % (
+                calls, latency * 1000))
+            print("%-10s %12s" % ("pool size", "requests/s"))
+            for limit in POOL_SIZES:
+                rps = await run_pool(sock, limit, calls)
+                print("%-10s %12.0f" % (limit or "unlimited", rps))
+        finally:
+            server.terminate()
+            await server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--serve")
+    args = parser.parse_args()
+    if args.serve:
+        asyncio.run(serve(args.serve, args.latency))
+    else:
+        asyncio.run(run_benchmark(args.calls, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Compare the buffered `ImageAPI.pull` against the incremental
+`ImageAPI.pull_stream` for a long stream of pull progress messages.
+
+Reports peak RSS growth and time-to-first-event for each. Every client runs in
+its own process so that peak RSS of one run can't hide the other.
+
+    $ python benchmarks/bench_pull_stream.py [--messages N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+# Roughly the size of a real "Downloading" progress message.
+PROGRESS = {
+    "status": "Downloading",
+    "progressDetail": {"current": 0, "total": 2811478},
+    "progress": "[=====>                                  ]  1.2MB/2.811MB",
+    "id": "4fe2ade4980c"
+}
+
+
+async def serve_pull(request: web.Request) -> web.StreamResponse:
+    messages = int(request.app["messages"])
+    resp = web.StreamResponse(headers={"Content-Type": "application/json"})
+    await resp.prepare(request)
+    batch = []
+    for i in range(messages):
+        PROGRESS["progressDetail"]["current"] = i  # type: ignore
+        batch.append(json.dumps(PROGRESS))
+        if len(batch) == 100:
+            await resp.write(("\r\n".join(batch) + "\r\n").encode())
+            batch = []
+            # Let the client see partial output, as a real pull would.
+            await asyncio.sleep(0)
+    if batch:
+        await resp.write(("\r\n".join(batch) + "\r\n").encode())
+    await resp.write_eof()
+    return resp
+
+
+def maxrss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def run_client(mode: str, sock: str) -> None:
+    client = DockerClient(DockerSock(sock), version=(1, 39))
+    base = maxrss_kb()
+    start = time.perf_counter()
+    first = None
+    count = 0
+    if mode == "buffered":
+        _, res = await client.image.pull("alpine", tag="3.8")
+        first = time.perf_counter() - start
+        count = len(res)
+    else:
+        async for _ in client.image.pull_stream("alpine", tag="3.8"):
+            if first is None:
+                first = time.perf_counter() - start
+            count += 1
+    total = time.perf_counter() - start
+    await client.close()
+    print(json.dumps({"mode": mode, "messages": count,
+                      "first_event_ms": (first or 0) * 1000,
+                      "total_ms": total * 1000,
+                      "peak_rss_growth_kb": maxrss_kb() - base}))
+
+
+async def run_benchmark(messages: int) -> None:
+    app = web.Application()
+    app["messages"] = messages
+    # Requests are prefixed with the API version, given to the client as
+    # there is no /version to negotiate it with.
+    app.router.add_post("/v1.39/images/create", serve_pull)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        site = web.UnixSite(runner, sock)
+        await site.start()
+        print("%d progress messages" % messages)
+        print("%-10s %12s %12s %18s" % ("mode", "first (ms)", "total (ms)",
+                                        "peak RSS (+KiB)"))
+        for mode in ("buffered", "stream"):
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, __file__, "--client", mode, "--socket", sock,
+                stdout=subprocess.PIPE)
+            out, _ = await proc.communicate()
+            res = json.loads(out)
+            print("%-10s %12.1f %12.1f %18d" % (
+                mode, res["first_event_ms"], res["total_ms"],
+                res["peak_rss_growth_kb"]))
+    await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--client", choices=("buffered", "stream"))
+    parser.add_argument("--socket")
+    args = parser.parse_args()
+    if args.client:
+        asyncio.run(run_client(args.client, args.socket))
+    else:
+        asyncio.run(run_benchmark(args.messages))
+
+
+if __name__ == "__main__":
+    main()
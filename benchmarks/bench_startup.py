@@ -0,0 +1,108 @@
+"""
+Start-up cost of a short-lived worker process: the time to import aiohttp,
+then `ufaas_dockerapi.client`, and the time from creating a client to the
+response of its first request, against the fake Docker Engine. The first
+request includes importing the API module it uses.
+
+Each of `--runs` fresh interpreters imports the client, creates one and
+lists containers once, with the API version negotiated by a ping first and
+with it given to the client. The wall time of the whole process, including
+the interpreter's own start-up, is reported too. Byte code is cached in a
+temporary directory, as an installed package's would be, and a first run
+warms it up.
+
+    $ python benchmarks/bench_startup.py [--runs N]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+WORKER = """
+import time
+start = time.perf_counter()
+import asyncio
+import aiohttp
+deps = time.perf_counter()
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.transports import DockerSock
+imported = time.perf_counter()
+
+async def main():
+    async with DockerClient(DockerSock(%(sock)r),
+                            version=%(version)s) as client:
+        await client.container.list()
+
+asyncio.run(main())
+print(deps - start, imported - deps, time.perf_counter() - imported)
+"""
+
+
+async def start_engine(path: str) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        env=env, stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+def run_worker(sock: str, version: str, pycache: str) -> List[float]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    env["PYTHONPYCACHEPREFIX"] = pycache
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    start = time.perf_counter()
+    out = subprocess.check_output(
+        [sys.executable, "-c", WORKER % {"sock": sock, "version": version}],
+        env=env)
+    wall = time.perf_counter() - start
+    return [float(t) for t in out.split()] + [wall]
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        pycache = os.path.join(tmp, "pycache")
+        engine = await start_engine(sock)
+        try:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, run_worker, sock, "None",
+                                       pycache)
+            results: Dict[str, List[List[float]]] = {}
+            for name, version in (("negotiated", "None"),
+                                  ("given", "(1, 39)")):
+                results[name] = [
+                    await loop.run_in_executor(None, run_worker, sock,
+                                               version, pycache)
+                    for _ in range(args.runs)]
+        finally:
+            engine.terminate()
+            await engine.wait()
+
+    print("median of %d runs" % args.runs)
+    print("%-12s %14s %14s %16s %10s" % (
+        "version", "aiohttp (ms)", "client (ms)", "first call (ms)",
+        "wall (ms)"))
+    for name, runs in results.items():
+        print("%-12s %14.1f %14.1f %16.1f %10.1f" % (
+            name, *(statistics.median(r[i] for r in runs) * 1000
+                    for i in range(4))))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Cost of tracking the resource usage of many containers with `StatsBuffer`,
+against keeping each container's recent stats responses as dicts and
+computing usage from those one container at a time.
+
+The synthetic part records `--containers` samples per simulated second for a
+`--window` of samples per container and reports the memory held, the time
+to record a second's worth of samples and the time to compute everyone's
+usage. The end to end part follows that many containers' stats streams on
+the fake Docker Engine at 1 Hz for `--seconds` and reports the client's CPU
+use, which must stay well under a core for the collector to keep up.
+
+    $ python benchmarks/bench_stats.py [--containers N] [--window SAMPLES]
+                                       [--seconds SECONDS] [--synthetic-only]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi import stats  # noqa: E402
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.config import ContainerConfig  # noqa: E402
+from ufaas_dockerapi.stats import StatsBuffer, StatsCollector  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+CONFIG = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+def make_sample(i: int, second: int) -> Dict[str, Any]:
+    """
+    A stats response shaped like dockerd's, cgroups v1 with a few CPUs.
+    """
+    return {
+        "read": "2019-01-01T00:%02d:%02d.123456789Z" % divmod(second % 3600,
+                                                              60),
+        "preread": "2019-01-01T00:00:00Z",
+        "pids_stats": {"current": 3},
+        "blkio_stats": {"io_service_bytes_recursive": [
+            {"major": 8, "minor": 0, "op": op, "value": second * v}
+            for op, v in (("Read", 4096), ("Write", 8192), ("Sync", 0),
+                          ("Async", 0), ("Total", 12288))]},
+        "cpu_stats": {
+            "cpu_usage": {"total_usage": second * (i + 1) * 10 ** 6,
+                          "percpu_usage": [second * 10 ** 6] * 4,
+                          "usage_in_kernelmode": second * 10 ** 5,
+                          "usage_in_usermode": second * 10 ** 5},
+            "system_cpu_usage": second * 4 * 10 ** 9,
+            "online_cpus": 4,
+            "throttling_data": {"periods": 0, "throttled_periods": 0,
+                                "throttled_time": 0}},
+        "memory_stats": {
+            "usage": 20 * 2 ** 20 + i, "max_usage": 30 * 2 ** 20,
+            "limit": 256 * 2 ** 20,
+            "stats": {"cache": 4 * 2 ** 20, "rss": 16 * 2 ** 20,
+                      "mapped_file": 0, "pgfault": second * 100,
+                      "pgmajfault": 0, "inactive_file": 2 ** 20}},
+        "networks": {"eth0": {"rx_bytes": second * 1000,
+                              "rx_packets": second, "rx_errors": 0,
+                              "tx_bytes": second * 500,
+                              "tx_packets": second, "tx_errors": 0}},
+    }
+
+
+def naive_usage(history: Dict[str, Deque[Dict[str, Any]]]
+                ) -> Dict[str, Tuple[float, ...]]:
+    """
+    Usage from the last two raw responses of each container.
+    """
+    result = {}
+    for name, samples in history.items():
+        prev, cur = stats.parse_stats(samples[-2]), \
+            stats.parse_stats(samples[-1])
+        elapsed = cur[0] - prev[0]
+        system = cur[2] - prev[2]
+        result[name] = (
+            (cur[1] - prev[1]) / system * cur[3] * 100 if system else 0.0,
+            cur[4] / cur[5] * 100,
+        ) + tuple((cur[i] - prev[i]) / elapsed for i in range(6, 10))
+    return result
+
+
+def timed(fn: Callable[[], Any], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def synthetic(containers: int, window: int) -> None:
+    names = ["fn-%d" % i for i in range(containers)]
+    # The same samples are fed to both, so building them isn't measured.
+    ticks = [[make_sample(i, s) for i in range(containers)]
+             for s in range(1, 4)]
+
+    tracemalloc.start()
+    history: Dict[str, Deque[Dict[str, Any]]] = {
+        n: deque(maxlen=window) for n in names}
+    for second in range(window):
+        for i, name in enumerate(names):
+            history[name].append(make_sample(i, second + 1))
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del history
+
+    history = {n: deque(maxlen=window) for n in names}
+    buf = StatsBuffer(capacity=window, max_containers=containers)
+    for tick in ticks:
+        for name, sample in zip(names, tick):
+            history[name].append(sample)
+            buf.record(name, sample)
+
+    def record_dicts() -> None:
+        for name, sample in zip(names, ticks[-1]):
+            history[name].append(sample)
+
+    def record_buffer() -> None:
+        for name, sample in zip(names, ticks[-1]):
+            buf.record(name, sample)
+
+    # Usage first, recording the same tick again makes the deltas zero.
+    naive_time = timed(lambda: naive_usage(history))
+    rows: List[Tuple[str, float, float, int]] = [
+        ("raw dicts", timed(record_dicts), naive_time, dict_bytes),
+    ]
+    numpy = stats.numpy
+    stats.numpy = None
+    rows.append(("StatsBuffer, python", timed(record_buffer),
+                 timed(buf.usage), buf.nbytes))
+    stats.numpy = numpy
+    if numpy is not None:
+        rows.append(("StatsBuffer, numpy", timed(record_buffer),
+                     timed(buf.usage), buf.nbytes))
+
+    print("%d containers, %d samples each" % (containers, window))
+    print("%-22s %14s %14s %12s" % ("", "record 1s (ms)", "usage (ms)",
+                                    "memory (MB)"))
+    for name, record, usage, nbytes in rows:
+        print("%-22s %14.2f %14.2f %12.1f" % (
+            name, record * 1000, usage * 1000, nbytes / 2 ** 20))
+
+
+async def start_engine(path: str) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        "--stats-interval", "1", env=env, stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+async def end_to_end(containers: int, window: int, seconds: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        engine = await start_engine(sock)
+        try:
+            transport = DockerSock(sock, limit=containers + 10)
+            async with DockerClient(transport) as client:
+                names = ["fn-%d" % i for i in range(containers)]
+                async for _ in client.container.create_many(
+                        [(n, CONFIG) for n in names]):
+                    pass
+                async for _ in client.container.start_many(names):
+                    pass
+                async with StatsCollector(client, capacity=window,
+                                          max_containers=containers) as col:
+                    for name in names:
+                        col.follow(name)
+                    # Let every stream connect before measuring.
+                    await asyncio.sleep(2)
+                    before = sum(len(col.buffer.series(n, "time"))
+                                 for n in col.buffer.containers)
+                    cpu = time.process_time()
+                    await asyncio.sleep(seconds)
+                    cpu = time.process_time() - cpu
+                    after = sum(len(col.buffer.series(n, "time"))
+                                for n in col.buffer.containers)
+                    start = time.perf_counter()
+                    usage = col.usage()
+                    usage_time = time.perf_counter() - start
+                print("\nend to end, %d streams at 1 Hz for %.0fs"
+                      % (containers, seconds))
+                print("samples recorded:   %d" % (after - before))
+                print("client CPU:         %.1f%% of a core"
+                      % (cpu / seconds * 100))
+                print("usage of %d:      %.2fms" % (len(usage),
+                                                    usage_time * 1000))
+                print("stream errors:      %d" % len(col.errors))
+        finally:
+            engine.terminate()
+            await engine.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--containers", type=int, default=1000)
+    parser.add_argument("--window", type=int, default=60)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--synthetic-only", action="store_true")
+    args = parser.parse_args()
+    synthetic(args.containers, args.window)
+    if not args.synthetic_only:
+        asyncio.run(end_to_end(args.containers, args.window, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Latency from deciding to invoke a function to the output of its first exec,
+for a container that was frozen with `Container.freeze`, one that was
+stopped and one that doesn't exist yet, run against the fake Docker Engine.
+
+A thaw is a single unpause, a restart a start and a cold start a create and
+a start, each followed by the exec. The fake engine doesn't model the
+container runtime, so these only differ by their API calls here. Against
+dockerd a start also sets up the container's namespaces and runs its
+entrypoint, which an unpause doesn't, so the gap is wider.
+
+    $ python benchmarks/bench_thaw.py [--runs N]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.config import ContainerConfig, ExecConfig  # noqa: E402
+from ufaas_dockerapi.container import Container  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+
+CONFIG = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+ECHO = ExecConfig(cmd=["echo", "hello"], tty=False)
+
+
+async def start_engine(path: str) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        env=env, stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+async def first_exec(client: DockerClient, container: Container) -> None:
+    proc = await client.exec.spawn(container.name, ECHO)
+    async with proc:
+        await proc.read()
+        await proc.wait()
+
+
+async def measure(runs: int, prepare: Callable[[int], Awaitable[Container]],
+                  client: DockerClient) -> List[float]:
+    latencies = []
+    for i in range(runs):
+        container = await prepare(i)
+        start = time.perf_counter()
+        await container.thaw()
+        await first_exec(client, container)
+        latencies.append(time.perf_counter() - start)
+        await container.delete()
+    return latencies
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        engine = await start_engine(sock)
+        try:
+            async with DockerClient(DockerSock(sock),
+                                    version=(1, 39)) as client:
+
+                async def frozen(i: int) -> Container:
+                    container = Container(client, "frozen-%d" % i, CONFIG,
+                                          created=False)
+                    await container.start()
+                    await container.freeze()
+                    return container
+
+                async def stopped(i: int) -> Container:
+                    container = Container(client, "stopped-%d" % i, CONFIG,
+                                          created=False)
+                    await container.start()
+                    await container.stop()
+                    return container
+
+                async def cold(i: int) -> Container:
+                    return Container(client, "cold-%d" % i, CONFIG,
+                                     created=False)
+
+                print("%d runs each" % args.runs)
+                print("%-10s %12s %12s" % ("", "p50 (ms)", "p99 (ms)"))
+                for name, prepare in (("thaw", frozen), ("restart", stopped),
+                                      ("cold", cold)):
+                    latencies = sorted(await measure(args.runs, prepare,
+                                                     client))
+                    p99 = latencies[int(0.99 * (len(latencies) - 1))]
+                    print("%-10s %12.3f %12.3f" % (
+                        name, statistics.median(latencies) * 1000,
+                        p99 * 1000))
+        finally:
+            engine.terminate()
+            await engine.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=500)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Waiting on the exits of many containers with a `/containers/{id}/wait`
+request each, against `ContainerAPI.wait_many` which resolves every wait
+from a single events subscription, run against the fake Docker Engine.
+
+`--containers` containers are started and waited on by one client, then
+killed by another. While the waits are pending an inspect is made with the
+waiting client: with a request per wait its connection pool is full and the
+inspect is held up until `--probe-timeout` gives up. Reported are the
+inspect's latency, the time from the kills starting to every wait being
+resolved and the waiting client's CPU time.
+
+    $ python benchmarks/bench_wait.py [--containers N] [--probe-timeout S]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, List
+
+import async_timeout
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ufaas_dockerapi.client import DockerClient  # noqa: E402
+from ufaas_dockerapi.config import ContainerConfig  # noqa: E402
+from ufaas_dockerapi.transports import DockerSock  # noqa: E402
+from ufaas_dockerapi.utils import bounded_map  # noqa: E402
+
+CONFIG = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+async def start_engine(path: str) -> asyncio.subprocess.Process:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "ufaas_dockerapi.fake_engine", "--path", path,
+        env=env, stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    await proc.stdout.readline()
+    return proc
+
+
+async def run(args: argparse.Namespace, name: str, names: List[str],
+              killer: DockerClient, waiting: DockerClient,
+              wait_all: Callable[[], Awaitable[object]]) -> None:
+    async for _, _, error in bounded_map(killer.container.start, names, 16):
+        assert error is None
+    cpu = time.process_time()
+    waits = asyncio.ensure_future(wait_all())
+    await asyncio.sleep(0.5)
+
+    start = time.perf_counter()
+    try:
+        async with async_timeout.timeout(args.probe_timeout):
+            await waiting.container.inspect(names[0])
+        probe = "%.1f" % ((time.perf_counter() - start) * 1000)
+    except asyncio.TimeoutError:
+        probe = "> %.0f" % (args.probe_timeout * 1000)
+
+    start = time.perf_counter()
+    async for _, _, error in bounded_map(killer.container.kill, names, 16):
+        assert error is None
+    await waits
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    print("%-16s %18s %18.3f %12.0f" % (name, probe, elapsed, cpu * 1000))
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    names = ["bench-%d" % i for i in range(args.containers)]
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "docker.sock")
+        engine = await start_engine(sock)
+        try:
+            async with DockerClient(DockerSock(sock),
+                                    version=(1, 39)) as killer:
+                async for _, _, error in bounded_map(
+                        lambda n: killer.container.create(n, CONFIG), names,
+                        16):
+                    assert error is None
+                print("%d containers" % args.containers)
+                print("%-16s %18s %18s %12s" % (
+                    "", "inspect (ms)", "kill to exits (s)", "CPU (ms)"))
+
+                async with DockerClient(DockerSock(sock),
+                                        version=(1, 39)) as waiting:
+                    await run(args, "wait requests", names, killer, waiting,
+                              lambda: asyncio.gather(*[
+                                  waiting.container.wait(n) for n in names]))
+
+                async with DockerClient(DockerSock(sock),
+                                        version=(1, 39)) as waiting:
+                    await run(args, "wait_many", names, killer, waiting,
+                              lambda: asyncio.gather(
+                                  *waiting.container.wait_many(
+                                      names).values()))
+        finally:
+            engine.terminate()
+            await engine.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--containers", type=int, default=2000)
+    parser.add_argument("--probe-timeout", type=float, default=2.0)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,10 @@ TEST_REQUIRES = INSTALL_REQUIRES + [
 # This means you can do pip install .[test] for testing deps.
 extras = {
     "test": TEST_REQUIRES,
+    # Vectorises container stats aggregation.
+    "stats": ["numpy"],
+    # Quicker JSON encoding and decoding of requests and responses.
+    "json": ["orjson"],
 }
 
 setup(
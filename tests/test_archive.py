@@ -0,0 +1,160 @@
+import asyncio
+import io
+import os
+import tarfile
+import time
+
+import pytest
+
+# The client must be imported first as the API modules import each other.
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi import archive  # noqa: I100
+from ufaas_dockerapi.archive import (
+    context_hash, ignored, scan_context, tar_stream)
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.exceptions import DockerAPIException
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+def make_context(root):
+    (root / "app").mkdir()
+    (root / "app" / "main.py").write_text("print('hi')\n")
+    (root / "app" / "big.bin").write_bytes(os.urandom(300 * 1024 + 7))
+    (root / "Dockerfile").write_text("FROM alpine\nCOPY app /app\n")
+    (root / "secrets").mkdir()
+    (root / "secrets" / "key").write_text("hunter2")
+    (root / "notes.md").write_text("notes")
+    os.symlink("main.py", str(root / "app" / "link"))
+    (root / ".dockerignore").write_text(
+        "# comment\nsecrets\n*.md\n!README.md\n")
+    (root / "README.md").write_text("readme")
+
+
+def test_ignored():
+    patterns = [(False, "secrets"), (False, "*.md"), (True, "README.md")]
+    assert ignored("secrets/key", patterns)
+    assert ignored("notes.md", patterns)
+    assert not ignored("README.md", patterns)
+    assert not ignored("app/main.py", patterns)
+
+
+@pytest.mark.asyncio
+async def test_tar_stream(tmp_path):
+    make_context(tmp_path)
+    entries = scan_context(str(tmp_path))
+    names = [e.arcname for e in entries]
+    assert names == [".dockerignore", "Dockerfile", "README.md", "app",
+                     "app/big.bin", "app/link", "app/main.py"]
+
+    chunks = [c async for c in tar_stream(entries, chunk_size=64 * 1024)]
+    assert all(len(c) == 64 * 1024 for c in chunks[:-1])
+    with tarfile.open(fileobj=io.BytesIO(b"".join(chunks))) as tar:
+        assert tar.getnames() == names
+        assert tar.getmember("app/link").linkname == "main.py"
+        assert (tar.extractfile("app/big.bin").read() ==
+                (tmp_path / "app" / "big.bin").read_bytes())
+
+
+@pytest.mark.asyncio
+async def test_tar_stream_cancelled(monkeypatch):
+    """
+    Cancelling a consumer while a chunk is being read waits for the read
+    before closing the archive.
+    """
+    events = []
+
+    def slow_chunks(entries, chunk_size):
+        try:
+            time.sleep(0.05)
+            events.append("read")
+            yield b"chunk"
+        finally:
+            events.append("closed")
+
+    monkeypatch.setattr(archive, "_tar_chunks", slow_chunks)
+
+    async def consume():
+        async for _ in tar_stream([]):
+            pass
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert events == ["read", "closed"]
+
+
+def test_context_hash(tmp_path):
+    make_context(tmp_path)
+    cache = {}
+    digest = context_hash(scan_context(str(tmp_path)), cache=cache)
+    assert len(cache) == 5
+    # Ignored files and modification times don't matter.
+    (tmp_path / "secrets" / "key").write_text("changed")
+    os.utime(str(tmp_path / "app" / "main.py"), (0, 0))
+    assert context_hash(scan_context(str(tmp_path)), cache=cache) == digest
+    assert context_hash(scan_context(str(tmp_path)), b"args") != digest
+    (tmp_path / "app" / "main.py").write_text("print('bye')\n")
+    assert context_hash(scan_context(str(tmp_path)), cache=cache) != digest
+
+
+@pytest.mark.asyncio
+async def test_put_get_archive(tmp_path):
+    code = tmp_path / "code"
+    code.mkdir()
+    (code / "handler.py").write_text("def handle(): pass\n")
+    (code / "lib").mkdir()
+    (code / "lib" / "data.bin").write_bytes(os.urandom(200 * 1024))
+
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("fn", ALPINE)
+            await client.container.put_archive("fn", "/app", str(code))
+            await client.container.put_archive(
+                "fn", "/etc", str(tmp_path / "code" / "handler.py"))
+            container = engine.containers[next(iter(engine.containers))]
+            assert sorted(container.files) == [
+                "/app/handler.py", "/app/lib/data.bin", "/etc/handler.py"]
+
+            # A ready-made archive, as chunks.
+            buf = io.BytesIO()
+            with tarfile.open(fileobj=buf, mode="w") as tar:
+                info = tarfile.TarInfo("VERSION")
+                info.size = 2
+                tar.addfile(info, io.BytesIO(b"v2"))
+            data = buf.getvalue()
+            await client.container.put_archive(
+                "fn", "/app", [data[:100], data[100:]])
+            assert container.files["/app/VERSION"] == b"v2"
+
+            chunks = [c async for c in client.container.get_archive(
+                "fn", "/app", chunk_size=16 * 1024)]
+            assert max(len(c) for c in chunks) <= 16 * 1024
+            with tarfile.open(fileobj=io.BytesIO(b"".join(chunks))) as tar:
+                assert tar.getnames() == ["app/VERSION", "app/handler.py",
+                                          "app/lib/data.bin"]
+                assert (tar.extractfile("app/lib/data.bin").read() ==
+                        (code / "lib" / "data.bin").read_bytes())
+
+            with pytest.raises(DockerAPIException) as e:
+                async for _ in client.container.get_archive("fn", "/nope"):
+                    pass
+            assert e.value.http_status == 404
+
+
+@pytest.mark.asyncio
+async def test_put_archive_many(tmp_path):
+    (tmp_path / "handler.py").write_text("def handle(): pass\n")
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            for name in ("fn-1", "fn-2"):
+                await client.container.create(name, ALPINE)
+            results = [r async for r in client.container.put_archive_many(
+                ["fn-1", "fn-2", "fn-3"], "/app", str(tmp_path))]
+            assert sorted(r.container for r in results if r.ok) == [
+                "fn-1", "fn-2"]
+            for container in engine.containers.values():
+                assert list(container.files) == ["/app/handler.py"]
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from ufaas_dockerapi.cache import TTLCache
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+@pytest.mark.asyncio
+async def test_ttl_cache():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    cache = TTLCache(ttl=60)
+    results = await asyncio.gather(*[cache.get("k", fetch)
+                                     for _ in range(100)])
+    assert results == [1] * 100
+    assert (cache.misses, cache.coalesced) == (1, 99)
+    assert await cache.get("k", fetch) == 1
+    cache.invalidate("k")
+    assert await cache.get("k", fetch) == 2
+
+
+@pytest.mark.asyncio
+async def test_ttl_cache_read_after_invalidate():
+    """
+    A read after a write and invalidation doesn't join a fetch started
+    before the write.
+    """
+    value = "old"
+
+    async def fetch():
+        seen = value
+        await asyncio.sleep(0.01)
+        return seen
+
+    cache = TTLCache(ttl=60)
+    before = asyncio.ensure_future(cache.get("k", fetch))
+    await asyncio.sleep(0.001)
+    value = "new"
+    cache.invalidate("k")
+    assert await cache.get("k", fetch) == "new"
+    assert await before == "old"
+    # The stale fetch finishing doesn't replace the new value.
+    assert await cache.get("k", fetch) == "new"
+
+    before = asyncio.ensure_future(cache.get("k2", fetch))
+    await asyncio.sleep(0.001)
+    value = "newer"
+    cache.invalidate_where(lambda k, v: True)
+    assert await cache.get("k2", fetch) == "newer"
+    await before
+
+
+@pytest.mark.asyncio
+async def test_ttl_cache_invalidate_other_key():
+    """
+    Invalidating one key doesn't stop fetches for others being shared and
+    stored.
+    """
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    cache = TTLCache(ttl=60)
+    first = asyncio.ensure_future(cache.get("k", fetch))
+    await asyncio.sleep(0.001)
+    cache.invalidate("other")
+    cache.invalidate_where(lambda k, v: k == "other")
+    assert await cache.get("k", fetch) == 1
+    assert await first == 1
+    assert (cache.misses, cache.coalesced) == (1, 1)
+    assert await cache.get("k", fetch) == 1
+    assert cache.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_ttl_cache_errors():
+    """
+    A failed fetch reaches every waiter and isn't cached.
+    """
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError()
+
+    cache = TTLCache(ttl=60)
+    results = await asyncio.gather(*[cache.get("k", fail) for _ in range(3)],
+                                   return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_list_filters():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("a", ALPINE)
+            await client.container.create("b", ContainerConfig(
+                image="alpine:3.8", labels={"ufaas.function": "resize"}))
+            await client.container.start("a")
+            _, running = await client.container.list()
+            assert [c["Names"] for c in running] == [["/a"]]
+            _, labelled = await client.container.list(
+                filters={"label": ["ufaas.function=resize"]}, all=True)
+            assert [c["Names"] for c in labelled] == [["/b"]]
+            _, res = await client.container.inspect("a")
+            assert res["State"]["Running"]
+
+
+@pytest.mark.asyncio
+async def test_inspect_single_flight():
+    """
+    Concurrent inspects share one request and changes invalidate the cache.
+    """
+    async with FakeDockerEngine(latency=0.01) as engine:
+        async with DockerClient(engine.transport(), cache_ttl=60) as client:
+            await client.container.create("fn", ALPINE)
+            engine.requests = 0
+            results = await asyncio.gather(*[
+                client.container.inspect("fn") for _ in range(500)])
+            assert engine.requests == 1
+            assert all(r is results[0] for r in results)
+
+            await client.container.start("fn")
+            _, res = await client.container.inspect("fn")
+            assert res["State"]["Running"]
+            assert engine.requests == 3
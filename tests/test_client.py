@@ -3,8 +3,9 @@ from dataclasses import asdict
 import pytest
 
 from ufaas_dockerapi.client import DockerClient, default_transport
-from ufaas_dockerapi.config import (ContainerConfig, ExecConfig,
-                                    config_dict_factory)
+from ufaas_dockerapi.config import (ContainerConfig, ExecConfig, HostConfig,
+                                    config_dict_factory, serialize_config)
+from ufaas_dockerapi.transports import DockerSock
 
 
 @pytest.fixture
@@ -61,6 +62,19 @@ async def test_version(client):
     assert "ApiVersion" in res.keys()
 
 
+@pytest.mark.asyncio
+async def test_client_lifecycle():
+    """
+    The connection pool is shared by every request and is closed along with
+    the client.
+    """
+    async with DockerClient(DockerSock(limit=5, stream_limit=2)) as client:
+        assert client.conn is client.conn
+        assert client.conn.limit == 5
+        assert client._stream_session is not client._session
+    assert client.closed
+
+
 @pytest.mark.asyncio
 async def test_image_basics(client):
     """
@@ -92,6 +106,27 @@ async def test_config_serialisation():
         pytest.fail("Config object serialisation failed: %s" % e)
 
 
+def test_serialize_config():
+    """
+    The cached serializer produces the same JSON as `asdict` with
+    `config_dict_factory` followed by `strip_nulls`.
+    """
+    config = ContainerConfig(image="alpine:3.8", hostname="fn",
+                             env={"A": 1, "B": "two"}, cmd=["/bin/ash"],
+                             entry_point=["/init"], labels={"ufaas": "1"},
+                             host_config=HostConfig())
+    expected = {k: v for k, v in
+                asdict(config, dict_factory=config_dict_factory).items()
+                if v is not None}
+    assert serialize_config(config) == expected
+    assert serialize_config(config)["Env"] == ["A=1", "B=two"]
+    assert serialize_config(config)["Hostname"] == "fn"
+
+    exec_config = ExecConfig(cmd=["echo"], tty=True)
+    assert serialize_config(exec_config) == {
+        "Tty": True, "Env": [], "Cmd": ["echo"]}
+
+
 @pytest.mark.asyncio
 async def test_container_basic(client, alpine):
     """
@@ -123,8 +158,9 @@ async def test_exec(client, alpine_container_started):
     })
 
     try:
-        status, _ = await client.exec.run("alpine_container", exec_config)
-        assert status == 200
+        output = await client.exec.run("alpine_container", exec_config)
+        stdout, _ = await output.read()
+        assert b"hello world" in stdout
     except Exception as e:
         pytest.fail("Exec test failed: %s" % e)
 
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+# The client must be imported first as the API modules import each other.
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi import codec as codec_module  # noqa: I100
+from ufaas_dockerapi.codec import (JSONCodec, OrjsonCodec,  # noqa: I100
+                                   default_codec, loads_yielding, orjson)
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+class CountingCodec(JSONCodec):
+    def __init__(self):
+        self.dumped = 0
+        self.loaded = 0
+
+    def dumps(self, obj):
+        self.dumped += 1
+        return super().dumps(obj)
+
+    def loads(self, data):
+        self.loaded += 1
+        return super().loads(data)
+
+
+@pytest.mark.parametrize("doc", [
+    [], {}, [1], {"a": [1, 2]}, "s", 1,
+    [{"Id": str(i), "Names": ["/fn-%d" % i]} for i in range(200)],
+    [[], [[1]], {"a": {}}, None, "x"],
+])
+def test_loads_yielding(doc):
+    codec = JSONCodec()
+    assert loads_yielding(codec, json.dumps(doc).encode()) == doc
+    assert loads_yielding(codec, json.dumps(doc, indent=2).encode()) == doc
+
+
+def test_loads_yielding_chunks(monkeypatch):
+    monkeypatch.setattr(codec_module, "_YIELD_BYTES", 16)
+    doc = [{"Id": str(i), "Command": "echo hi", "Ports": [{"a": [i]}]}
+           for i in range(50)] + [[1, {"b": "]]"}], 2, "x"]
+    codec = CountingCodec()
+    assert loads_yielding(codec, json.dumps(doc).encode()) == doc
+    # Decoded with the codec, a chunk at a time.
+    assert codec.loaded > 10
+    with pytest.raises(ValueError):
+        loads_yielding(codec, json.dumps(doc).encode()[:-1])
+
+
+@pytest.mark.parametrize("command", ["awk '{print $1'", "echo '}, {'"])
+def test_loads_yielding_brackets_in_strings(monkeypatch, command):
+    # Counts thrown off by a string are given up on rather than rescanned.
+    monkeypatch.setattr(codec_module, "_YIELD_BYTES", 16)
+    doc = [{"Id": str(i), "Command": command, "Ports": [{"a": i}]}
+           for i in range(5000)]
+    codec = CountingCodec()
+    assert loads_yielding(codec, json.dumps(doc).encode()) == doc
+
+
+@pytest.mark.parametrize("data", [b"[1 2]", b"[1,", b"[1] x", b"[", b"[,]"])
+def test_loads_yielding_invalid(data):
+    with pytest.raises(ValueError):
+        loads_yielding(JSONCodec(), data)
+
+
+def test_default_codec():
+    codec = default_codec()
+    assert codec.loads(codec.dumps({"a": [1, "b"]})) == {"a": [1, "b"]}
+    if orjson is None:
+        assert codec.name == "json"
+        with pytest.raises(RuntimeError):
+            OrjsonCodec()
+    else:
+        assert codec.name == "orjson"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("decode_threshold", [0, 1024 * 1024])
+async def test_client_codec(decode_threshold):
+    codec = CountingCodec()
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport(), codec=codec,
+                                decode_threshold=decode_threshold) as client:
+            for i in range(20):
+                await client.container.create("fn-%d" % i, ALPINE)
+            assert codec.dumped == 20
+            _, containers = await client.container.list(all=True)
+            assert len(containers) == 20
+            messages = [m async for m in client.image.pull_stream("alpine")]
+            assert messages
+            assert codec.loaded >= 20 + len(messages)
@@ -0,0 +1,225 @@
+import asyncio
+import time
+
+import pytest
+
+# The client must be imported first as the API modules import each other.
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.container import Container
+from ufaas_dockerapi.exceptions import DockerAPIException
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+from ufaas_dockerapi.waiter import ExitStatus, ExitWaiter
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+@pytest.mark.asyncio
+async def test_pause_kill_wait():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            await client.container.pause("fn")
+            _, info = await client.container.inspect("fn")
+            assert info["State"]["Paused"] and info["State"]["Running"]
+            with pytest.raises(DockerAPIException) as exc_info:
+                await client.container.pause("fn")
+            assert exc_info.value.http_status == 409
+            await client.container.unpause("fn")
+
+            waiter = asyncio.ensure_future(client.container.wait("fn"))
+            await asyncio.sleep(0.05)
+            assert not waiter.done()
+            await client.container.kill("fn", signal="SIGHUP")
+            await asyncio.sleep(0.05)
+            assert not waiter.done()
+            await client.container.kill("fn")
+            _, result = await waiter
+            assert result["StatusCode"] == 137
+
+            # A stopped container is waited on straight away.
+            _, result = await client.container.wait("fn")
+            assert result["StatusCode"] == 137
+
+
+@pytest.mark.asyncio
+async def test_container_lifecycle():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport(), version=(1, 39)) as client:
+            container = Container(client, "fn", ALPINE, created=False)
+            assert container.status is None
+            await container.start()
+            assert container.status == "running"
+            assert engine.requests == 2
+
+            # Calls that wouldn't change anything aren't made.
+            await container.start()
+            await container.unpause()
+            assert await container.freeze()
+            assert not await container.freeze()
+            assert container.paused and not container.running
+            assert engine.requests == 3
+
+            await container.thaw()
+            assert container.running
+            assert engine.requests == 4
+            await container.thaw()
+            assert engine.requests == 4
+
+            await container.kill()
+            assert container.status == "exited"
+            assert (await container.wait()).exit_code == 137
+            assert not await container.freeze()
+            await container.thaw()
+            assert container.running
+
+            # Changes made elsewhere are picked up by a refresh.
+            await client.container.stop("fn")
+            assert await container.refresh() == "exited"
+            await container.delete()
+            assert not container.created
+            assert await container.refresh() is None
+
+
+@pytest.mark.asyncio
+async def test_refresh_skips_cache():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport(), version=(1, 39),
+                                cache_ttl=60) as client:
+            container = Container(client, "fn", ALPINE, created=False)
+            await container.start()
+            _, info = await client.container.inspect("fn")
+            assert info["State"]["Status"] == "running"
+            engine.exit_container("fn")
+            assert await container.refresh() == "exited"
+
+
+@pytest.mark.asyncio
+async def test_wait_many():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport(), version=(1, 39)) as client:
+            names = ["fn-%d" % i for i in range(200)]
+            for name in names:
+                await client.container.create(name, ALPINE)
+                await client.container.start(name)
+            await client.container.create("idle", ALPINE)
+            await client.container.kill(names[0])
+
+            engine.requests = 0
+            futures = client.container.wait_many(names + ["missing"])
+            slow = client.container.wait_many(["idle"], timeout=0.05)
+            await asyncio.sleep(0.05)
+            # One list and one events stream for every wait.
+            assert engine.requests <= 3
+            assert engine.event_streams == 1
+            assert futures[names[0]].result() == ExitStatus(137, False)
+            with pytest.raises(DockerAPIException) as exc_info:
+                futures["missing"].result()
+            assert exc_info.value.http_status == 404
+            with pytest.raises(asyncio.TimeoutError):
+                await slow["idle"]
+
+            for i, name in enumerate(names[1:]):
+                engine.exit_container(name, exit_code=i % 3)
+            statuses = await asyncio.gather(*futures.values(),
+                                            return_exceptions=True)
+            assert [s.exit_code for s in statuses[1:-1]] == \
+                [i % 3 for i in range(len(names) - 1)]
+            # The subscription ends with the last wait.
+            assert client.container.exits.pending == 0
+            assert not client.container.exits.subscribed
+
+
+@pytest.mark.asyncio
+async def test_waiter_reconnect():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport(), version=(1, 39)) as client:
+            waiter = ExitWaiter(client, reconnect_delay=0.05)
+            for name in ("a", "b", "c"):
+                await client.container.create(name, ALPINE)
+                await client.container.start(name)
+            a, b = waiter.wait("a"), waiter.wait("b")
+            await asyncio.sleep(0.05)
+
+            # An exit while the stream is down is found when it reconnects.
+            engine.drop_event_streams()
+            await asyncio.sleep(0.01)
+            engine.exit_container("a", exit_code=2)
+            assert (await a).exit_code == 2
+            assert waiter.subscriptions == 2
+
+            # Exit codes missing from events are inspected for.
+            _, info = await client.container.inspect("b")
+            for action in ("oom", "die"):
+                waiter.apply({"Type": "container", "Action": action,
+                              "timeNano": time.time_ns(),
+                              "Actor": {"ID": info["Id"], "Attributes": {}}})
+            assert await b == ExitStatus(0, True)
+
+            # A restarted container isn't resolved by its earlier exit.
+            await client.container.stop("c")
+            await client.container.start("c")
+            c = waiter.wait("c")
+            await asyncio.sleep(0.05)
+            assert not c.done()
+            await waiter.close()
+            assert c.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_waiter_clock_skew():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport(), version=(1, 39)) as client:
+            waiter = ExitWaiter(client, reconnect_delay=0.05)
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            _, info = await client.container.inspect("fn")
+            die = {"Type": "container", "Action": "die",
+                   "Actor": {"ID": info["Id"], "Attributes": {}}}
+
+            # A die event before the listing, of an earlier exit, leads to
+            # an inspect that finds the container still running.
+            future = waiter.wait("fn")
+            waiter.apply(dict(die, timeNano=time.time_ns()))
+            await asyncio.sleep(0.05)
+            assert not future.done()
+
+            # One from a daemon whose clock is an hour behind still counts.
+            waiter.apply(dict(die, timeNano=time.time_ns() - 3600 * 10**9,
+                              Actor={"ID": info["Id"],
+                                     "Attributes": {"exitCode": "3"}}))
+            assert (await future).exit_code == 3
+            await waiter.close()
+
+
+@pytest.mark.asyncio
+async def test_waiter_survives_errors():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport(), version=(1, 39)) as client:
+            waiter = ExitWaiter(client, reconnect_delay=0.01)
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            events = client.system.events
+
+            def flaky_events(**kwargs):
+                client.system.events = events
+                raise asyncio.TimeoutError()
+
+            client.system.events = flaky_events
+            future = waiter.wait("fn")
+            await asyncio.sleep(0.1)
+            assert isinstance(waiter.last_error, asyncio.TimeoutError)
+            assert waiter.subscriptions == 2
+            engine.exit_container("fn", exit_code=4)
+            assert (await future).exit_code == 4
+
+            # A subscription that ends is started again by the next wait.
+            await client.container.start("fn")
+            waiter.wait("fn")
+            waiter._task.cancel()
+            await asyncio.sleep(0.01)
+            assert not waiter.subscribed
+            waiter.wait("fn")
+            assert waiter.subscribed
+            await waiter.close()
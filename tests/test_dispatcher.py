@@ -0,0 +1,122 @@
+import asyncio
+import os
+
+import pytest
+
+# The client must be imported first as the API modules import each other.
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig, ExecConfig
+from ufaas_dockerapi.dispatcher import Dispatcher
+from ufaas_dockerapi.exceptions import DispatcherError, DockerAPIException
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+CONTAINERS = ["fn-%d" % i for i in range(8)]
+
+
+def segments():
+    if not os.path.isdir("/dev/shm"):  # pragma: no cover
+        return set()
+    return set(os.listdir("/dev/shm"))
+
+
+async def running(engine):
+    async with DockerClient(engine.transport()) as client:
+        for name in CONTAINERS:
+            await client.container.create(name, ALPINE)
+            await client.container.start(name)
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_exec():
+    before = segments()
+    async with FakeDockerEngine(payload_size=1024 * 1024) as engine:
+        await running(engine)
+        async with Dispatcher(engine.transport(), workers=2) as dispatcher:
+            assert {dispatcher.worker_for(c) for c in CONTAINERS} == {0, 1}
+            assert all(dispatcher.worker_for(c) == dispatcher.worker_for(c)
+                       for c in CONTAINERS)
+
+            results = await asyncio.gather(*[
+                dispatcher.exec(c, ExecConfig(cmd=["echo", c]))
+                for c in CONTAINERS])
+            assert [r.stdout for r in results] == [
+                ("%s\n" % c).encode() for c in CONTAINERS]
+            assert all(r.exit_code == 0 and r.stderr == b""
+                       for r in results)
+
+            # Large outputs come back through shared memory.
+            result = await dispatcher.exec("fn-0",
+                                           ExecConfig(cmd=["payload"]))
+            assert result.stdout == b"x" * (1024 * 1024)
+
+            result = await dispatcher.exec(
+                "fn-1", ExecConfig(cmd=["cat"], attach_stdin=True),
+                stdin=b"hello")
+            assert result.stdout == b"hello"
+
+            with pytest.raises(DockerAPIException) as exc_info:
+                await dispatcher.exec("missing", ExecConfig(cmd=["true"]))
+            assert exc_info.value.http_status == 404
+    assert segments() == before
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_call():
+    before = segments()
+    async with FakeDockerEngine() as engine:
+        await running(engine)
+        async with Dispatcher(engine.transport(), workers=2,
+                              session_cmd=["ufaas-session-echo"],
+                              inline_limit=1024) as dispatcher:
+            replies = await asyncio.gather(*[
+                dispatcher.call(c, c.encode() * 1000) for c in CONTAINERS])
+            assert replies == [c.encode() * 1000 for c in CONTAINERS]
+            assert await dispatcher.call("fn-2", b"hi") == b"hi"
+    assert segments() == before
+
+    async with Dispatcher(engine.transport(), workers=1) as dispatcher:
+        with pytest.raises(ValueError):
+            await dispatcher.call("fn-0", b"")
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_worker_exit():
+    async with FakeDockerEngine() as engine:
+        await running(engine)
+        async with Dispatcher(engine.transport(), workers=1) as dispatcher:
+            process = dispatcher._workers[0].process
+            process.kill()
+            # Invocations in flight or sent before the exit is noticed fail,
+            # after that the worker is replaced.
+            with pytest.raises(DispatcherError):
+                for _ in range(100):
+                    await dispatcher.exec("fn-0", ExecConfig(cmd=["true"]))
+            result = await dispatcher.exec("fn-0",
+                                           ExecConfig(cmd=["echo", "hi"]))
+            assert result.stdout == b"hi\n"
+            assert dispatcher._workers[0].process is not process
+
+        with pytest.raises(DispatcherError):
+            await dispatcher.exec("fn-0", ExecConfig(cmd=["true"]))
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_large_messages():
+    """
+    Large requests and responses crossing between the dispatcher and a
+    worker don't block either side.
+    """
+    size = 4 * 1024 * 1024
+    async with FakeDockerEngine() as engine:
+        await running(engine)
+        async with Dispatcher(engine.transport(), workers=1,
+                              inline_limit=2 * size) as dispatcher:
+            async def cat(data):
+                for _ in range(4):
+                    result = await dispatcher.exec(
+                        "fn-0", ExecConfig(cmd=["cat"], attach_stdin=True),
+                        stdin=data)
+                    assert result.stdout == data
+
+            await asyncio.gather(*[cat(bytes([i]) * size) for i in range(8)])
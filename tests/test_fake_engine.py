@@ -0,0 +1,181 @@
+"""
+The client against the fake Docker Engine, these tests don't need Docker.
+"""
+
+import pytest
+
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig, ExecConfig
+from ufaas_dockerapi.exceptions import DockerAPIException
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+@pytest.mark.asyncio
+async def test_fake_version():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            _, res = await client.system.version()
+            assert "ApiVersion" in res.keys()
+
+
+@pytest.mark.asyncio
+async def test_fake_pull():
+    """
+    The buffered and streamed pulls return the same progress messages.
+    """
+    async with FakeDockerEngine(pull_messages=50) as engine:
+        async with DockerClient(engine.transport()) as client:
+            _, buffered = await client.image.pull("alpine", tag="3.8")
+            streamed = [m async for m in
+                        client.image.pull_stream("alpine", tag="3.8")]
+            assert len(buffered) == len(streamed) == 52
+            await client.image.remove("alpine:3.8")
+
+
+@pytest.mark.asyncio
+async def test_fake_container_lifecycle():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            status, res = await client.container.create("fn", ALPINE)
+            assert status == 201 and "Id" in res
+            await client.container.start("fn")
+            # Starting a running container is not an error.
+            status, _ = await client.container.start("fn")
+            assert status == 304
+            await client.container.restart("fn")
+            await client.container.stop("fn")
+            await client.container.delete("fn")
+            with pytest.raises(DockerAPIException) as e:
+                await client.container.start("fn")
+            assert e.value.http_status == 404
+
+
+@pytest.mark.asyncio
+async def test_fake_container_lookup():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            _, first = await client.container.create("fn", ALPINE)
+            # A name is matched before an ID prefix, like Docker does.
+            prefix = first["Id"][:2]
+            _, second = await client.container.create(prefix, ALPINE)
+            _, info = await client.container.inspect(prefix)
+            assert info["Id"] == second["Id"]
+            _, info = await client.container.inspect(first["Id"][:3])
+            assert info["Id"] == first["Id"]
+
+
+@pytest.mark.asyncio
+async def test_fake_exec_stream():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            _, res = await client.exec.exec_create(
+                "fn", ExecConfig(cmd=["echo", "hello world"]))
+            stream = await client.exec.exec_start_stream(res["Id"])
+            stdout, stderr = await stream.read()
+            assert stdout == b"hello world\n"
+            assert stderr == b""
+
+
+@pytest.mark.asyncio
+async def test_fake_exec_run():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            for tty in (False, True):
+                output = await client.exec.run("fn", ExecConfig(
+                    cmd=["echo", "hi"], tty=tty))
+                assert await output.read() == (b"hi\n", b"")
+
+            output = await client.exec.run(
+                "fn", ExecConfig(cmd=["echo", "hi"], tty=False))
+            async with output:
+                chunks = [chunk async for chunk in output.stdout()]
+            assert b"".join(chunks) == b"hi\n"
+
+            output = await client.exec.run(
+                "fn", ExecConfig(cmd=["echo", "hi"]), detach=True)
+            assert await output.read() == (b"", b"")
+
+
+@pytest.mark.asyncio
+async def test_fake_attach():
+    """
+    Large output is split into frames and reassembled on stdout.
+    """
+    async with FakeDockerEngine(payload_size=100000) as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("fn", ALPINE)
+            stream = await client.container.attach("fn")
+            out = b"".join([chunk async for chunk in stream.stdout()])
+            assert out == b"x" * 100000
+
+
+@pytest.mark.asyncio
+async def test_fake_websocket():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("fn", ALPINE)
+            ws = await client.container.attach_websocket(
+                "fn", return_stream=True, attach_stdin=True,
+                attach_stdout=True)
+            await ws.send_str('echo "hello world"\n')
+            output = await ws.receive()
+            assert "hello world" in "{}".format(output)
+            await ws.close()
+
+
+@pytest.mark.asyncio
+async def test_fake_bulk():
+    """
+    A failure in a bulk operation is reported for that container alone.
+    """
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            names = ["fn-%d" % i for i in range(20)]
+            created = [r async for r in client.container.create_many(
+                [(n, ALPINE) for n in names], concurrency=4)]
+            assert all(r.ok for r in created)
+
+            started = [r async for r in client.container.start_many(
+                names + ["missing"], concurrency=4)]
+            failed = [r.container for r in started if not r.ok]
+            assert failed == ["missing"]
+
+            deleted = [r async for r in client.container.delete_many(
+                names, force_stop=True)]
+            assert all(r.ok for r in deleted)
+            assert engine.containers == {}
+
+
+@pytest.mark.asyncio
+async def test_fake_exec_hijacked():
+    """
+    Stdin is streamed to the process and output arrives before it exits.
+    """
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            proc = await client.exec.spawn("fn", ExecConfig(
+                cmd=["cat"], attach_stdin=True))
+            stdout = proc.stdout()
+            await proc.write(b"hello")
+            assert await stdout.__anext__() == b"hello"
+            await proc.write(b" world")
+            await proc.close_stdin()
+            assert b"".join([c async for c in stdout]) == b" world"
+            assert await proc.wait() == 0
+
+
+@pytest.mark.asyncio
+async def test_fake_exec_hijacked_missing():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            with pytest.raises(DockerAPIException) as e:
+                await client.exec.exec_start_hijacked("missing")
+            assert e.value.http_status == 404
@@ -0,0 +1,160 @@
+import asyncio
+import io
+import tarfile
+
+import pytest
+
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.exceptions import DockerAPIException
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+from ufaas_dockerapi.image import reference
+from ufaas_dockerapi.state import StateCache
+
+
+def test_reference():
+    assert reference("alpine") == "alpine:latest"
+    assert reference("alpine", "3.8") == "alpine:3.8"
+    assert reference("localhost:5000/fn") == "localhost:5000/fn:latest"
+    assert reference("localhost:5000/fn:1") == "localhost:5000/fn:1"
+    assert reference("alpine@sha256:abc") == "alpine@sha256:abc"
+
+
+@pytest.mark.asyncio
+async def test_list_inspect():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.image.pull("alpine", tag="3.8")
+            _, images = await client.image.list()
+            assert [i["RepoTags"] for i in images] == [["alpine:3.8"]]
+            _, image = await client.image.inspect("alpine:3.8")
+            assert image["Id"] == images[0]["Id"]
+            with pytest.raises(DockerAPIException) as e:
+                await client.image.inspect("alpine")
+            assert e.value.http_status == 404
+
+
+@pytest.mark.asyncio
+async def test_ensure_coalesces():
+    async with FakeDockerEngine(latency=0.01) as engine:
+        async with DockerClient(engine.transport(), cache_ttl=60) as client:
+            pulled = await asyncio.gather(*[
+                client.image.ensure("alpine", "3.8") for _ in range(20)])
+            assert pulled == [True] * 20
+            assert len(engine.images) == 1
+            api = client.image
+            assert (api.hits, api.misses, api.coalesced) == (0, 1, 19)
+
+            # Now it's present, after one inspect known from the cache.
+            assert not await client.image.ensure("alpine", "3.8")
+            requests = engine.requests
+            assert not await client.image.ensure("alpine", "3.8")
+            assert engine.requests == requests
+            assert api.hits == 2
+
+
+@pytest.mark.asyncio
+async def test_ensure_tagged():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            # A tag given in the image isn't added to.
+            assert await client.image.ensure("alpine:3.8")
+            assert not await client.image.ensure("alpine:3.8", "3.9")
+            assert await client.image.ensure("localhost:5000/fn")
+            assert sorted(engine.images) == ["alpine:3.8",
+                                             "localhost:5000/fn:latest"]
+
+
+@pytest.mark.asyncio
+async def test_ensure_invalidated_by_events():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport(), cache_ttl=60) as client:
+            cache = StateCache(client)
+            await cache.start()
+            try:
+                assert await client.image.ensure("alpine")
+                assert not await client.image.ensure("alpine")
+                # Removed behind the client's back.
+                engine.images.clear()
+                engine._emit_image("delete", "sha256:0", "alpine:latest")
+                for _ in range(100):
+                    if not client.image.cache:
+                        break
+                    await asyncio.sleep(0.01)
+                assert await client.image.ensure("alpine")
+                assert client.image.misses == 2
+            finally:
+                await cache.stop()
+
+
+@pytest.mark.asyncio
+async def test_save_load(tmp_path):
+    async with FakeDockerEngine(image_size=3 * 1024 * 1024 + 1) as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.image.pull("alpine", tag="3.8")
+            await client.image.pull("busybox")
+            dest = str(tmp_path / "images.tar")
+            size = await client.image.save(["alpine:3.8", "busybox"], dest)
+            assert size == (tmp_path / "images.tar").stat().st_size
+            with tarfile.open(dest) as tar:
+                assert "manifest.json" in tar.getnames()
+
+            engine.images.clear()
+            messages = [m async for m in client.image.load(dest)]
+            assert [m["stream"] for m in messages] == [
+                "Loaded image: alpine:3.8\n", "Loaded image: busybox:latest\n"]
+            assert set(engine.images) == {"alpine:3.8", "busybox:latest"}
+
+
+@pytest.mark.asyncio
+async def test_import_file(tmp_path):
+    rootfs = tmp_path / "rootfs.tar"
+    with tarfile.open(str(rootfs), "w") as tar:
+        info = tarfile.TarInfo("hello")
+        info.size = 5
+        tar.addfile(info, io.BytesIO(b"hello"))
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            status, messages = await client.image.import_source(
+                str(rootfs), "fn", tag="1")
+            assert status == 200
+            assert messages[0]["status"] == engine.images["fn:1"]["Id"]
+            with pytest.raises(ValueError):
+                await client.image.import_source("-", "fn")
+
+
+@pytest.mark.asyncio
+async def test_build(tmp_path):
+    (tmp_path / "Dockerfile").write_text("FROM alpine\nCOPY . /app\n")
+    (tmp_path / "main.py").write_text("print('hi')\n")
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            messages = [m async for m in client.image.build(
+                str(tmp_path), tag="fn:1", buildargs={"A": "1"})]
+            assert messages[0] == {"stream": "Step 1/2 : FROM alpine\n"}
+            image_id = engine.images["fn:1"]["Id"]
+            assert {"aux": {"ID": image_id}} in messages
+            assert engine.build_contexts == [["Dockerfile", "main.py"]]
+
+            # Unchanged, so not built again.
+            messages = [m async for m in client.image.build(
+                str(tmp_path), tag="fn:1", buildargs={"A": "1"})]
+            assert messages[0] == {"aux": {"ID": image_id}}
+            assert engine.builds == 1
+
+            # A different build argument or file is rebuilt.
+            [m async for m in client.image.build(
+                str(tmp_path), tag="fn:1", buildargs={"A": "2"})]
+            (tmp_path / "main.py").write_text("print('bye')\n")
+            [m async for m in client.image.build(
+                str(tmp_path), tag="fn:1", buildargs={"A": "2"})]
+            assert engine.builds == 3
+
+
+@pytest.mark.asyncio
+async def test_build_missing_dockerfile(tmp_path):
+    (tmp_path / "main.py").write_text("print('hi')\n")
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            messages = [m async for m in client.image.build(
+                str(tmp_path), tag="fn")]
+            assert "Cannot locate" in messages[-1]["error"]
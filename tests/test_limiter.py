@@ -0,0 +1,161 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+# The client must be imported first as the API modules import each other.
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+from ufaas_dockerapi.limiter import (AIMDLimiter, ConcurrencyLimits,
+                                     RetryPolicy, deadline, endpoint_class,
+                                     latency_signal, remaining)
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+def test_endpoint_class():
+    assert endpoint_class("GET", "http://1.25/containers/fn/json") == "read"
+    assert endpoint_class("GET", "http://1.25/containers/json") == "read"
+    assert (endpoint_class("POST", "http://1.25/containers/fn/start") ==
+            "lifecycle")
+    assert (endpoint_class("POST", "http://1.25/containers/fn/exec") ==
+            "exec")
+    assert endpoint_class("POST", "http://1.25/exec/abc/start") == "exec"
+    assert endpoint_class("GET", "http://1.25/images/alpine/json") == "image"
+    assert endpoint_class("GET", "http://1.25/version") == "read"
+
+
+@pytest.mark.asyncio
+async def test_aimd_limiter():
+    limiter = AIMDLimiter(initial=1, max_limit=4, latency_target=1.0)
+    first = await limiter.acquire()
+    waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert (limiter.inflight, limiter.queued) == (1, 3)
+
+    # A cancelled waiter gives up its place in the queue.
+    waiters[0].cancel()
+    await asyncio.sleep(0)
+    assert limiter.queued == 2
+
+    # A fast request grows the limit by one, letting two more in.
+    limiter.release(first)
+    assert limiter.limit == 2
+    started = await asyncio.gather(*waiters[1:])
+    assert (limiter.inflight, limiter.queued) == (2, 0)
+
+    # Overload backs off, but only once for requests started together.
+    limiter.release(started[0], overloaded=True)
+    limiter.release(started[1], overloaded=True)
+    assert limiter.limit == 1
+    assert limiter.decreases == 1
+    assert limiter.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_aimd_latency_gradient():
+    rand = random.Random(1)
+    limiter = AIMDLimiter(initial=8, max_limit=8, latency_target=1.0)
+    # Ordinary jitter of a healthy dockerd isn't overload.
+    for _ in range(5000):
+        started = await limiter.acquire()
+        limiter.release(started - rand.uniform(0.002, 0.008))
+    assert (limiter.limit, limiter.decreases) == (8, 0)
+
+    # Stops wait for the grace period, which says nothing about dockerd.
+    assert not latency_signal("POST", "http://d/v1.39/containers/fn/stop")
+    assert latency_signal("POST", "http://d/v1.39/containers/fn/start")
+    for path in ("images/create", "images/load", "images/fn/push", "build"):
+        assert not latency_signal("POST", "http://d/v1.39/" + path)
+    started = await limiter.acquire()
+    limiter.release(started - 9.5, timed=False)
+    assert limiter.decreases == 0
+
+    # Requests queueing in dockerd are.
+    for _ in range(20):
+        started = await limiter.acquire()
+        limiter.release(started - rand.uniform(0.02, 0.04))
+    assert limiter.decreases == 1
+    assert limiter.limit < 8
+
+
+def test_deadline():
+    assert remaining() is None
+    assert remaining(5) == 5
+    with deadline(10):
+        assert 9 < remaining() <= 10
+        assert remaining(1) == 1
+        with deadline(60):
+            assert remaining() <= 10
+    assert remaining() is None
+
+
+@pytest.mark.asyncio
+async def test_limits():
+    limits = ConcurrencyLimits({"read": AIMDLimiter(initial=2, max_limit=2)})
+    async with FakeDockerEngine(latency=0.01) as engine:
+        async with DockerClient(engine.transport(), limits=limits) as client:
+            await client.container.create("fn", ALPINE)
+            await asyncio.gather(*[client.container.inspect("fn")
+                                   for _ in range(20)])
+            read = limits.limiters["read"]
+            assert read.limit <= 2
+            assert (read.inflight, read.queued) == (0, 0)
+            assert limits.limiters["lifecycle"].inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_idempotent_only():
+    retry = RetryPolicy(attempts=3, base_delay=0.001, attempt_timeout=0.02)
+    async with FakeDockerEngine(latency=0.1) as engine:
+        # The version is given so that only the calls reach the engine.
+        async with DockerClient(engine.transport(), retry=retry,
+                                limits=ConcurrencyLimits(),
+                                version=(1, 39)) as client:
+            with pytest.raises(asyncio.TimeoutError):
+                await client.system.version()
+            assert engine.requests == 3
+
+            with pytest.raises(asyncio.TimeoutError):
+                await client.container.create("fn", ALPINE)
+            assert engine.requests == 4
+            assert client.limits.limiters["read"].decreases >= 1
+
+
+@pytest.mark.asyncio
+async def test_retry_untimed():
+    """
+    Stops wait for the container, so aren't held to the attempt timeout.
+    """
+    retry = RetryPolicy(attempts=3, base_delay=0.001, attempt_timeout=0.05)
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport(), retry=retry,
+                                limits=ConcurrencyLimits(),
+                                version=(1, 39)) as client:
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            engine.latency = 0.1
+            await client.container.stop("fn")
+            with pytest.raises(asyncio.TimeoutError):
+                await client.container.start("fn")
+
+
+@pytest.mark.asyncio
+async def test_call_deadline():
+    retry = RetryPolicy(attempts=100, base_delay=0.001, attempt_timeout=0.02)
+    async with FakeDockerEngine(latency=0.1) as engine:
+        async with DockerClient(engine.transport(), retry=retry,
+                                version=(1, 39)) as client:
+            start = time.monotonic()
+            with pytest.raises(asyncio.TimeoutError):
+                with deadline(0.1):
+                    await client.system.version()
+            assert time.monotonic() - start < 0.5
+            assert engine.requests < 100
+
+        async with DockerClient(engine.transport(), call_timeout=0.05,
+                                version=(1, 39)) as client:
+            with pytest.raises(asyncio.TimeoutError):
+                await client.system.version()
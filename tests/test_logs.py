@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+from ufaas_dockerapi.logs import LogCollector
+from ufaas_dockerapi.streams import RingBuffer, STDERR, STDOUT
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+def test_ring_buffer():
+    buf = RingBuffer(10)
+    buf.append(STDOUT, b"hello ")
+    buf.append(STDERR, b"oops ")
+    assert buf.getvalue() == b"ello oops "
+    assert buf.getvalue(STDERR) == b"oops "
+    assert (len(buf), buf.dropped) == (10, 1)
+    buf.append(STDOUT, b"0123456789abc")
+    assert buf.frames() == [(STDOUT, b"3456789abc")]
+    assert buf.dropped == 14
+
+
+@pytest.mark.asyncio
+async def test_logs_tail():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("fn", ALPINE)
+            for i in range(5):
+                engine.write_log("fn", b"line %d\n" % i)
+            engine.write_log("fn", b"error\n", stream_id=STDERR)
+            stream = await client.container.logs("fn", tail=2)
+            assert await stream.read() == (b"line 4\n", b"error\n")
+            stream = await client.container.logs("fn", timestamps=True,
+                                                 stderr=False)
+            stdout, _ = await stream.read()
+            assert stdout.count(b"Z line") == 5
+
+
+@pytest.mark.asyncio
+async def test_logs_follow():
+    """
+    Followed output arrives as it is written and ends with the container.
+    """
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            stream = await client.container.logs("fn", follow=True)
+            frames = stream.frames()
+            engine.write_log("fn", b"first\n")
+            assert await frames.__anext__() == (STDOUT, b"first\n")
+            await client.container.stop("fn")
+            assert [f async for f in frames] == []
+
+
+@pytest.mark.asyncio
+async def test_log_collector():
+    """
+    Only the most recent output of each container is kept.
+    """
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            names = ["fn-%d" % i for i in range(20)]
+            async for _ in client.container.create_many(
+                    [(n, ALPINE) for n in names]):
+                pass
+            async for _ in client.container.start_many(names):
+                pass
+            async with LogCollector(client, max_bytes=1024) as logs:
+                for name in names:
+                    logs.follow(name)
+                await asyncio.sleep(0.05)
+                for i in range(100):
+                    for name in names:
+                        engine.write_log(name, b"%s %04d\n" % (
+                            name.encode(), i) + b"x" * 100)
+                await asyncio.sleep(0.1)
+                buf = logs.buffer("fn-3")
+                assert len(buf) == 1024
+                assert buf.getvalue().endswith(b"fn-3 0099\n" + b"x" * 100)
+                await client.container.stop("fn-3")
+                await asyncio.sleep(0.05)
+                assert not logs.following("fn-3")
+                assert logs.following("fn-4")
+                # The buffer is kept after the container stops.
+                assert len(logs.buffer("fn-3")) == 1024
@@ -0,0 +1,59 @@
+import pytest
+
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+from ufaas_dockerapi.metrics import (Histogram, InMemoryMetrics,
+                                     endpoint_template)
+
+
+def test_endpoint_template():
+    assert endpoint_template("/v1.25/containers/3f4e/start") == \
+        "/containers/{id}/start"
+    assert endpoint_template("/containers/create") == "/containers/create"
+    assert endpoint_template("/exec/abc/start") == "/exec/{id}/start"
+    assert endpoint_template("/images/library/alpine:3.8/json") == \
+        "/images/{name}/json"
+    assert endpoint_template("/images/alpine:3.8") == "/images/{name}"
+    assert endpoint_template("/images/create") == "/images/create"
+    assert endpoint_template("/version") == "/version"
+
+
+def test_histogram_percentiles():
+    hist = Histogram()
+    for i in range(1, 101):
+        hist.record(i / 1000)
+    assert hist.count == 100
+    # Accurate to within a bucket.
+    assert 0.05 <= hist.percentile(50) < 0.05 * 1.2
+    assert 0.099 <= hist.percentile(99) <= 0.1
+    assert hist.max == 0.1
+
+
+@pytest.mark.asyncio
+async def test_metrics_sink():
+    """
+    Requests are grouped by endpoint template and record status and sizes.
+    """
+    metrics = InMemoryMetrics()
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport(),
+                                metrics=metrics) as client:
+            for name in ("a", "b"):
+                await client.container.create(
+                    name, ContainerConfig(image="alpine:3.8"))
+                await client.container.start(name)
+            [m async for m in client.image.pull_stream("alpine")]
+            ws = await client.container.attach_websocket("a")
+            await ws.close()
+
+    summary = metrics.summary()
+    create = summary["POST /containers/create"]
+    assert create["count"] == 2
+    assert create["statuses"] == {201: 2}
+    assert create["bytes_out"] > 0 and create["bytes_in"] > 0
+    assert summary["POST /containers/{id}/start"]["count"] == 2
+    assert summary["POST /images/create"]["bytes_in"] > 0
+    assert summary["GET /containers/{id}/attach/ws"]["statuses"] == {101: 1}
+    start = summary["POST /containers/{id}/start"]["time_to_body"]
+    assert 0 < start["p50"] <= start["max"]
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+# The client must be imported first as the API modules import each other.
+from ufaas_dockerapi.client import DockerClient  # noqa: F401
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.pool import ContainerPool
+
+
+class CountingContainerAPI:
+    """
+    Stands in for `ContainerAPI`, counting calls instead of talking to Docker.
+    """
+    def __init__(self):
+        self.created = []
+        self.started = []
+        self.deleted = []
+
+    async def create(self, name, config):
+        self.created.append(name)
+
+    async def start(self, name, detach_keysequence=None):
+        self.started.append(name)
+
+    async def delete(self, name, force_stop=None, remove_volumes=None,
+                     remove_link=None):
+        self.deleted.append(name)
+
+
+class SlowContainerAPI(CountingContainerAPI):
+    """
+    Containers are created straight away but never finish starting.
+    """
+    async def start(self, name, detach_keysequence=None):
+        await asyncio.Event().wait()
+
+
+class CountingClient:
+    def __init__(self, api=None):
+        self.container = api or CountingContainerAPI()
+        self.state_cache = None
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_pool_warm_hit():
+    """
+    After the first miss the pool refills in the background and following
+    acquires are served from warm containers.
+    """
+    client = CountingClient()
+    async with ContainerPool(client, size=2) as pool:
+        first = await pool.acquire("alpine:3.8")
+        assert pool.stats.misses == 1
+        await settle()
+        assert pool.idle_count == 2
+
+        second = await pool.acquire(ContainerConfig(image="alpine:3.8"))
+        assert pool.stats.hits == 1
+        assert second.running and second.name != first.name
+    assert len(client.container.deleted) >= 1
+
+
+@pytest.mark.asyncio
+async def test_pool_lru_eviction():
+    """
+    The least recently used image loses its warm containers first once the
+    pool is full.
+    """
+    client = CountingClient()
+    pool = ContainerPool(client, size=2, max_size=2)
+    pool.prewarm("alpine:3.8")
+    await settle()
+    assert pool.idle_count == 2
+
+    pool.prewarm("busybox")
+    await settle()
+    assert pool.idle_count == 2
+    assert pool.stats.evictions == 2
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_idle_ttl():
+    """
+    Containers idle for longer than the TTL are evicted.
+    """
+    client = CountingClient()
+    pool = ContainerPool(client, size=1, idle_ttl=0)
+    pool.prewarm("alpine:3.8")
+    await settle()
+    assert pool.evict_idle() == 1
+    assert pool.idle_count == 0
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_close_during_refill():
+    """
+    Containers still being started count towards the pool's size, and are
+    deleted when the pool is closed.
+    """
+    client = CountingClient(SlowContainerAPI())
+    pool = ContainerPool(client, size=2, max_size=2)
+    pool.prewarm("alpine:3.8")
+    pool.prewarm("busybox")
+    pool.prewarm("debian")
+    await settle()
+    assert pool.pending_count == 2
+    assert len(client.container.created) == 2
+
+    await pool.close()
+    assert sorted(client.container.deleted) == \
+        sorted(client.container.created)
+    assert pool.pending_count == 0
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.exceptions import (ExecSessionBusy, ExecSessionClosed,
+                                        ExecSessionException)
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+from ufaas_dockerapi.session import (ExecSession, ExecSessionPool,
+                                     FrameDecoder, REQUEST, encode_frame)
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+WORKER = ["ufaas-session-echo"]
+
+
+def test_frame_decoder():
+    data = encode_frame(1, REQUEST, b"hello") + encode_frame(2, REQUEST, b"")
+    decoder = FrameDecoder()
+    frames = []
+    # Frames split at every possible point are reassembled.
+    for i in range(len(data)):
+        frames += decoder.feed(data[i:i + 1])
+    assert frames == [(1, REQUEST, b"hello"), (2, REQUEST, b"")]
+
+
+async def running(client):
+    await client.container.create("fn", ALPINE)
+    await client.container.start("fn")
+
+
+@pytest.mark.asyncio
+async def test_session_calls():
+    """
+    Many calls share one exec instance and responses reach their callers.
+    """
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await running(client)
+            async with ExecSession(client, "fn", WORKER, concurrency=8,
+                                   max_queued=100) as session:
+                payloads = [b"call-%d" % i for i in range(100)]
+                results = await asyncio.gather(*[session.call(p)
+                                                 for p in payloads])
+                assert results == payloads
+                with pytest.raises(ExecSessionException):
+                    await session.call(b"fail")
+                assert await session.call(b"after") == b"after"
+            assert len(engine.execs) == 1
+            with pytest.raises(ExecSessionClosed):
+                await session.call(b"closed")
+
+
+@pytest.mark.asyncio
+async def test_session_backpressure():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await running(client)
+            async with ExecSession(client, "fn", WORKER, concurrency=1,
+                                   max_queued=2) as session:
+                calls = [asyncio.ensure_future(session.call(b"sleep:0.05"))
+                         for _ in range(3)]
+                await asyncio.sleep(0.01)
+                assert (session.in_flight, session.queued) == (1, 2)
+                with pytest.raises(ExecSessionBusy):
+                    await session.call(b"rejected")
+                await asyncio.gather(*calls)
+                assert session.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_session_close_timeout():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await running(client)
+            session = ExecSession(client, "fn", WORKER)
+            await session.start()
+            call = asyncio.ensure_future(session.call(b"sleep:60"))
+            await asyncio.sleep(0.01)
+            # A worker that doesn't exit is given up on.
+            await asyncio.wait_for(session.close(timeout=0.05), 1)
+            assert session.closed
+            with pytest.raises(ExecSessionClosed):
+                await call
+
+
+@pytest.mark.asyncio
+async def test_session_pool():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await running(client)
+            async with ExecSessionPool(client, WORKER) as pool:
+                results = await asyncio.gather(*[pool.call("fn", b"x")
+                                                 for _ in range(10)])
+                assert results == [b"x"] * 10
+                # Concurrent first calls share a single worker.
+                assert len(engine.execs) == 1
+                await pool.discard("fn")
+                assert await pool.call("fn", b"y") == b"y"
+                assert len(engine.execs) == 2
@@ -0,0 +1,152 @@
+import asyncio
+import ssl
+from contextlib import AsyncExitStack
+
+import pytest
+
+# The client must be imported first as the API modules import each other.
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.exceptions import DockerAPIException
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+from ufaas_dockerapi.sharding import (LeastContainers, LeastLatency, Node,
+                                      ShardedDockerClient)
+from ufaas_dockerapi.transports import (DockerSock, DockerTCP,
+                                        transport_from_url)
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+def test_transport_from_url():
+    sock = transport_from_url("unix:///var/run/docker.sock")
+    assert isinstance(sock, DockerSock)
+    assert sock.path == "/var/run/docker.sock"
+    assert sock.base_url == "http://docker"
+
+    tcp = transport_from_url("tcp://10.0.0.1:2380", limit=5)
+    assert isinstance(tcp, DockerTCP)
+    assert (tcp.host, tcp.port) == ("10.0.0.1", 2380)
+    assert tcp.base_url == "http://10.0.0.1:2380"
+
+    tls = transport_from_url("tcp://docker.example.com",
+                             ssl_context=ssl.create_default_context())
+    assert tls.base_url == "https://docker.example.com:2376"
+
+    with pytest.raises(ValueError):
+        transport_from_url("ssh://docker.example.com")
+
+
+@pytest.mark.asyncio
+async def test_tcp_transport():
+    async with FakeDockerEngine(port=0) as engine:
+        transport = engine.transport()
+        assert isinstance(transport, DockerTCP)
+        async with DockerClient(transport) as client:
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            _, info = await client.container.inspect("fn")
+            assert info["State"]["Running"]
+
+
+def test_policies():
+    a, b, c = (Node(name, None) for name in "abc")
+    a.containers, b.containers, c.containers = 2, 1, 1
+    assert LeastContainers().choose([a, b, c]) is b
+
+    a.record_latency(0.1)
+    b.record_latency(0.3)
+    assert LeastLatency().choose([a, b, c]) is c
+    c.record_latency(0.2)
+    assert LeastLatency().choose([a, b, c]) is a
+    for _ in range(10):
+        a.record_latency(1.0)
+    assert LeastLatency().choose([a, b, c]) is c
+
+    # Calls in progress count against a node.
+    c.in_flight = 9
+    assert LeastLatency().choose([a, b, c]) is b
+
+
+@pytest.mark.asyncio
+async def test_sharded_client():
+    async with AsyncExitStack() as stack:
+        engines = [await stack.enter_async_context(FakeDockerEngine())
+                   for _ in range(3)]
+        # A container which exists before the client starts.
+        async with DockerClient(engines[2].transport()) as client:
+            await client.container.create("existing", ALPINE)
+
+        client = await stack.enter_async_context(ShardedDockerClient({
+            "node%d" % i: e.transport() for i, e in enumerate(engines)}))
+        await client.start()
+        assert client.owner("existing").name == "node2"
+        assert client.nodes["node2"].containers == 1
+
+        for i in range(5):
+            await client.create("fn-%d" % i, ALPINE)
+        assert [n.containers for n in client.nodes.values()] == [2, 2, 2]
+
+        # Each container lives on exactly the node it was placed on.
+        for i in range(5):
+            name = "fn-%d" % i
+            node = client.owner(name)
+            await client.start_container(name)
+            _, info = await client.inspect(name)
+            assert info["State"]["Running"]
+            assert client.owner(info["Id"]) is node
+            for other, engine in zip(client.nodes.values(), engines):
+                assert (info["Id"] in engine.containers) == (other is node)
+
+        listed = await client.list(all=True)
+        assert sorted(len(cs) for cs in listed.values()) == [2, 2, 2]
+
+        await client.stop("fn-0")
+        await client.delete("fn-0")
+        assert client.owner("fn-0") is None
+        assert sum(n.containers for n in client.nodes.values()) == 5
+        with pytest.raises(DockerAPIException) as exc_info:
+            await client.inspect("fn-0")
+        assert exc_info.value.http_status == 404
+
+        # Containers created behind the client's back are found.
+        async with DockerClient(engines[1].transport()) as other:
+            await other.container.create("elsewhere", ALPINE)
+        assert (await client.client_for("elsewhere") is
+                client.nodes["node1"].client)
+        assert client.owner("elsewhere").name == "node1"
+
+
+@pytest.mark.asyncio
+async def test_sharded_client_latency():
+    async with AsyncExitStack() as stack:
+        slow = await stack.enter_async_context(FakeDockerEngine(latency=0.05))
+        fast = await stack.enter_async_context(FakeDockerEngine())
+        client = await stack.enter_async_context(ShardedDockerClient(
+            {"slow": slow.transport(), "fast": fast.transport()},
+            policy=LeastLatency()))
+        await client.start()
+        for i in range(6):
+            await client.create("fn-%d" % i, ALPINE)
+        assert client.nodes["fast"].containers == 6
+        assert len(fast.containers) == 6 and not slow.containers
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", [LeastContainers(), LeastLatency()])
+async def test_sharded_client_concurrent_creates(policy):
+    async with AsyncExitStack() as stack:
+        engines = [await stack.enter_async_context(
+            FakeDockerEngine(latency=0.01)) for _ in range(3)]
+        client = await stack.enter_async_context(ShardedDockerClient(
+            {name: e.transport() for name, e in zip("abc", engines)},
+            policy=policy))
+        await asyncio.gather(*[client.create("fn-%d" % i, ALPINE)
+                               for i in range(30)])
+        counts = [n.containers for n in client.nodes.values()]
+        assert counts == [len(e.containers) for e in engines]
+        assert sum(counts) == 30 and min(counts) >= 5
+
+        # A failed create gives its place back.
+        with pytest.raises(DockerAPIException):
+            await client.create("fn-0", ALPINE)
+        assert sum(n.containers for n in client.nodes.values()) == 30
@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import pytest
+
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.container import Container
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+from ufaas_dockerapi.state import StateCache
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+def event(action, cid="c1", name="fn", **attrs):
+    attrs["name"] = name
+    return {"Type": "container", "Action": action, "time": time.time(),
+            "Actor": {"ID": cid, "Attributes": attrs}}
+
+
+async def until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_apply_events():
+    cache = StateCache(None)
+    cache.apply(event("create"))
+    assert cache.get("fn").status == "created"
+    cache.apply(event("start"))
+    cache.apply(event("health_status: healthy"))
+    assert cache.get("c1").status == "running"
+    assert cache.get("fn").health == "healthy"
+    cache.apply(event("oom"))
+    cache.apply(event("die", exitCode="137"))
+    state = cache.get("fn")
+    assert (state.status, state.exit_code, state.oom_killed) == \
+        ("exited", 137, True)
+    cache.apply(event("rename", name="fn2", oldName="/fn"))
+    assert cache.get("fn") is None and cache.get("fn2") is state
+    cache.apply(event("destroy", name="fn2"))
+    assert len(cache) == 0
+
+
+def test_load_list():
+    cache = StateCache(None)
+    cache.load([
+        {"Id": "a" * 64, "Names": ["/up"], "State": "running",
+         "Status": "Up 2 hours (unhealthy)"},
+        {"Id": "b" * 64, "Names": ["/down"], "State": "exited",
+         "Status": "Exited (2) 5 seconds ago"},
+    ])
+    assert cache.get("up").health == "unhealthy"
+    assert cache.get("down").exit_code == 2
+    # Short IDs are accepted.
+    assert cache.get("b" * 12).name == "down"
+
+
+@pytest.mark.asyncio
+async def test_container_state_clock_skew():
+    """
+    A container trusts the cache by when events were received, not by the
+    daemon's clock.
+    """
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            container = Container(client, "fn", ALPINE, created=False)
+            await container.start()
+            cache = StateCache(None)
+            client.state_cache = cache
+            cache.apply(event("die", exitCode="1"))
+            await container.refresh()
+            # Received before the refresh, so not trusted.
+            assert container.running
+
+            stopped = event("die", exitCode="0")
+            stopped["time"] -= 3600
+            cache.apply(stopped)
+            assert not container.running
+            client.state_cache = None
+
+
+@pytest.mark.asyncio
+async def test_events_since_until():
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            start = time.time()
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            events = [e async for e in client.system.events(
+                since=start, until=time.time(),
+                filters={"event": ["start"]})]
+            assert [e["Action"] for e in events] == ["start"]
+
+
+@pytest.mark.asyncio
+async def test_state_cache():
+    """
+    The cache is populated from a list, then follows events and resyncs
+    when the stream is reconnected.
+    """
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("old", ALPINE)
+            cache = StateCache(client, reconnect_delay=0.01)
+            await cache.start()
+            assert cache.get("old").status == "created"
+
+            container = Container(client, "fn", ALPINE, created=False)
+            await container.start()
+            await until(lambda: cache.get("fn") is not None)
+            assert container.running
+
+            engine.requests = 0
+            engine.exit_container("fn", exit_code=3)
+            await until(lambda: not container.running)
+            assert container.state.exit_code == 3
+            # Reading state never calls the API.
+            assert engine.requests == 0
+
+            engine.drop_event_streams()
+            await until(lambda: cache.resyncs == 2)
+            await client.container.delete("old")
+            await until(lambda: cache.get("old") is None)
+
+            await cache.stop()
+            assert client.state_cache is None
+
+
+@pytest.mark.asyncio
+async def test_state_cache_survives_errors():
+    """
+    Any error following events, such as a call timing out, is recorded and
+    the stream reconnected rather than ending the cache's task.
+    """
+    async with FakeDockerEngine() as engine:
+        async with DockerClient(engine.transport()) as client:
+            cache = StateCache(client, reconnect_delay=0.01)
+            await cache.start()
+            resync = cache.resync
+            failures = []
+
+            async def flaky_resync():
+                if not failures:
+                    failures.append(1)
+                    raise asyncio.TimeoutError()
+                await resync()
+
+            cache.resync = flaky_resync
+            await until(lambda: engine.event_streams == 1)
+            engine.drop_event_streams()
+            await until(lambda: cache.resyncs == 2)
+            assert isinstance(cache.last_error, asyncio.TimeoutError)
+
+            await client.container.create("fn", ALPINE)
+            await until(lambda: cache.get("fn") is not None)
+            await cache.stop()
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from ufaas_dockerapi import stats as stats_module
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+from ufaas_dockerapi.stats import StatsBuffer, StatsCollector, parse_time
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def vectorised(request, monkeypatch):
+    """
+    Runs a test with and without numpy.
+    """
+    if request.param == "numpy" and stats_module.numpy is None:
+        pytest.skip("numpy is not installed")
+    if request.param == "python":
+        monkeypatch.setattr(stats_module, "numpy", None)
+
+
+def sample(second, cpu, system, rx=0, mem=100):
+    return {
+        "read": "2019-01-01T00:00:%02d.123456789Z" % second,
+        "cpu_stats": {"cpu_usage": {"total_usage": cpu},
+                      "system_cpu_usage": system, "online_cpus": 4},
+        "memory_stats": {"usage": mem, "limit": 1000,
+                         "stats": {"inactive_file": 50}},
+        "networks": {"eth0": {"rx_bytes": rx, "tx_bytes": 0},
+                     "eth1": {"rx_bytes": rx, "tx_bytes": 0}},
+    }
+
+
+def test_parse_time():
+    assert parse_time("0001-01-01T00:00:00Z") == 0
+    assert parse_time("1970-01-01T00:00:01.5000001Z") == 1.5
+    assert parse_time("1970-01-01T00:00:02Z") == 2
+
+
+def test_buffer_usage(vectorised):
+    buf = StatsBuffer(capacity=3, max_containers=2)
+    buf.record("a", sample(0, 0, 0))
+    assert buf.usage() == {}
+    buf.record("a", sample(2, 100, 800, rx=1000))
+    buf.record("b", sample(0, 0, 0))
+    buf.record("b", sample(1, 400, 800, mem=550))
+    usage = buf.usage()
+    assert set(usage) == {"a", "b"}
+    # 100 of 800 ns of host CPU time on 4 CPUs.
+    assert usage["a"].cpu_percent == 50
+    assert usage["a"].mem_usage == 50
+    assert usage["a"].mem_percent == 5
+    assert usage["a"].net_rx_rate == 1000
+    assert usage["b"].cpu_percent == 200
+    assert usage["b"].mem_percent == 50
+
+
+def test_buffer_ring(vectorised):
+    buf = StatsBuffer(capacity=3, max_containers=1)
+    for i in range(5):
+        buf.record("a", sample(i, i * 10, i * 100))
+    assert buf.series("a", "cpu_total") == [20, 30, 40]
+    assert buf.usage()["a"].cpu_percent == 40
+    with pytest.raises(ValueError):
+        buf.record("b", sample(0, 0, 0))
+    buf.remove("a")
+    buf.record("b", sample(0, 0, 0))
+    assert buf.containers == ["b"]
+    assert buf.series("b", "cpu_total") == [0]
+
+
+def test_buffer_precpu(vectorised):
+    stats = sample(1, 300, 1000)
+    stats["precpu_stats"] = {"cpu_usage": {"total_usage": 100},
+                             "system_cpu_usage": 200}
+    stats["preread"] = "2019-01-01T00:00:00Z"
+    buf = StatsBuffer()
+    buf.record("a", stats)
+    assert buf.usage()["a"].cpu_percent == 100
+
+
+@pytest.mark.asyncio
+async def test_stats_collector():
+    async with FakeDockerEngine(stats_interval=0.01) as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.container.create("fn", ALPINE)
+            await client.container.start("fn")
+            samples = [s async for s in client.container.stats(
+                "fn", stream=False)]
+            assert len(samples) == 1
+
+            async with StatsCollector(client, capacity=10) as stats:
+                stats.follow("fn")
+                while len(stats.buffer.series("fn", "time")
+                          if "fn" in stats.buffer else []) < 3:
+                    await asyncio.sleep(0.01)
+                usage = stats.usage()["fn"]
+                assert usage.cpu_percent == pytest.approx(10, rel=0.2)
+                assert usage.mem_usage == 16 * 1024 * 1024
+                assert usage.net_rx_rate == pytest.approx(1000, rel=0.2)
+
+                # The stream ends when the container stops.
+                await client.container.stop("fn")
+                while stats.following("fn"):
+                    await asyncio.sleep(0.01)
+                assert "fn" in stats.usage()
+                await stats.discard("fn")
+                assert stats.usage() == {}
@@ -0,0 +1,134 @@
+import asyncio
+import struct
+
+import pytest
+
+from ufaas_dockerapi.exceptions import DockerStreamException
+from ufaas_dockerapi.streams import (DemuxedStream, JSONStreamDecoder,
+                                     STDERR, STDOUT, StreamDemuxer)
+
+
+def frame(stream_id, payload):
+    return struct.pack(">BxxxL", stream_id, len(payload)) + payload
+
+
+class ReaderStream(DemuxedStream):
+    def __init__(self, reader, **kwargs):
+        super().__init__(**kwargs)
+        self.reader = reader
+
+    async def _chunks(self):
+        while True:
+            chunk = await self.reader.read(1024)
+            if not chunk:
+                return
+            yield chunk
+
+    def _release(self):
+        pass
+
+    def _abort(self):
+        pass
+
+
+def test_json_stream_split_messages():
+    """
+    Messages split across chunk boundaries are only returned once complete.
+    """
+    decoder = JSONStreamDecoder()
+    assert decoder.feed(b'{"status": "Pulling') == []
+    assert decoder.feed(b' fs layer"}\r\n{"sta') == [
+        {"status": "Pulling fs layer"}]
+    assert decoder.feed(b'tus": "Done"}\r\n\r\n') == [{"status": "Done"}]
+    assert decoder.flush() == []
+
+
+def test_json_stream_flush_without_newline():
+    """
+    The last message of a stream doesn't need a trailing newline.
+    """
+    decoder = JSONStreamDecoder()
+    assert decoder.feed(b'{"a": 1}\n{"b": 2}') == [{"a": 1}]
+    assert decoder.flush() == [{"b": 2}]
+
+
+def test_json_stream_bounded():
+    """
+    A message that never ends must not grow the buffer without bound.
+    """
+    decoder = JSONStreamDecoder(max_message_size=16)
+    decoder.feed(b'{"status": "')
+    with pytest.raises(DockerStreamException):
+        decoder.feed(b'x' * 32)
+
+
+def test_demux_whole_frames():
+    """
+    Several frames in one chunk are all returned, in order.
+    """
+    demuxer = StreamDemuxer()
+    data = frame(STDOUT, b"hello ") + frame(STDERR, b"oops") + \
+        frame(STDOUT, b"") + frame(STDOUT, b"world")
+    assert demuxer.feed(data) == [(STDOUT, b"hello "), (STDERR, b"oops"),
+                                  (STDOUT, b""), (STDOUT, b"world")]
+    assert not demuxer.pending
+
+
+def test_demux_split_frames():
+    """
+    Headers and payloads split at every possible position are reassembled.
+    """
+    data = frame(STDOUT, b"x" * 100) + frame(STDERR, b"y" * 3) + \
+        frame(STDOUT, b"z" * 20)
+    demuxer = StreamDemuxer()
+    frames = []
+    for i in range(len(data)):
+        frames.extend(demuxer.feed(data[i:i + 1]))
+    assert frames == [(STDOUT, b"x" * 100), (STDERR, b"y" * 3),
+                      (STDOUT, b"z" * 20)]
+    assert not demuxer.pending
+
+
+def test_demux_bounded():
+    """
+    Frame headers claiming huge payloads raise, and large frames aren't kept
+    in the buffer once assembled.
+    """
+    demuxer = StreamDemuxer(max_frame_size=1024 * 1024)
+    data = frame(STDOUT, b"x" * 512 * 1024)
+    assert demuxer.feed(data[:1000]) == []
+    assert demuxer.feed(data[1000:]) == [(STDOUT, b"x" * 512 * 1024)]
+    assert len(demuxer._payload) == 0
+    with pytest.raises(DockerStreamException):
+        demuxer.feed(struct.pack(">BxxxL", STDOUT, 2 ** 32 - 1))
+
+
+def test_demux_tty():
+    """
+    TTY output isn't multiplexed, everything is stdout.
+    """
+    demuxer = StreamDemuxer(tty=True)
+    assert demuxer.feed(b"raw output") == [(STDOUT, b"raw output")]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("started", [True, False])
+async def test_demuxed_stream_close(started):
+    """
+    Closing the stream ends the separate iterators, even with their queues
+    full or before anything was read.
+    """
+    reader = asyncio.StreamReader()
+    stream = ReaderStream(reader, queue_size=1)
+    stdout, stderr = stream.stdout(), stream.stderr()
+    if started:
+        reader.feed_data(frame(STDOUT, b"a") + frame(STDOUT, b"b"))
+        await asyncio.sleep(0.01)
+    stream.close()
+    out, err = await asyncio.wait_for(
+        asyncio.gather(*[_collect(it) for it in (stdout, stderr)]), 1)
+    assert out in ([], [b"a"]) and err == []
+
+
+async def _collect(it):
+    return [item async for item in it]
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+# The client must be imported first as the API modules import each other.
+from ufaas_dockerapi.client import DockerClient  # noqa: F401
+from ufaas_dockerapi.utils import bounded_map
+
+
+@pytest.mark.asyncio
+async def test_bounded_map():
+    """
+    No more than `concurrency` calls are in flight and a failing call doesn't
+    stop the rest.
+    """
+    in_flight = 0
+    peak = 0
+
+    async def work(i):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001 * (i % 3))
+        in_flight -= 1
+        if i == 7:
+            raise RuntimeError("container 7 failed")
+        return i * 2
+
+    results = {}
+    errors = {}
+    async for item, res, exc in bounded_map(work, range(20), 4):
+        if exc is None:
+            results[item] = res
+        else:
+            errors[item] = exc
+
+    assert peak == 4
+    assert set(errors) == {7}
+    assert results == {i: i * 2 for i in range(20) if i != 7}
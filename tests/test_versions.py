@@ -0,0 +1,115 @@
+import asyncio
+import subprocess
+import sys
+
+from aiohttp import web
+
+import pytest
+
+# The client must be imported first as the API modules import each other.
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.exceptions import APIVersionError, DockerAPIException
+from ufaas_dockerapi.fake_engine import FakeDockerEngine
+from ufaas_dockerapi.versions import (MAX_API_VERSION, choose_version,
+                                      parse_version)
+
+ALPINE = ContainerConfig(image="alpine:3.8", cmd=["/bin/ash"], tty=False)
+
+
+class OldFakeDockerEngine(FakeDockerEngine):
+    """
+    An engine whose pings don't say which API version it supports.
+    """
+    async def _ping(self, request: web.Request) -> web.StreamResponse:
+        return web.Response(text="OK")
+
+
+def test_choose_version():
+    assert parse_version("1.39") == (1, 39)
+    assert parse_version("v1.25") == (1, 25)
+    with pytest.raises(ValueError):
+        parse_version("latest")
+
+    assert choose_version((1, 41)) == MAX_API_VERSION
+    assert choose_version((1, 30), (1, 12)) == (1, 30)
+    with pytest.raises(APIVersionError):
+        choose_version((1, 24))
+    with pytest.raises(APIVersionError):
+        choose_version((1, 45), (1, 40))
+
+
+def test_lazy_api_modules():
+    code = ("import asyncio, sys\n"
+            "from ufaas_dockerapi.client import DockerClient\n"
+            "from ufaas_dockerapi.transports import DockerSock\n"
+            "async def main():\n"
+            "    async with DockerClient(DockerSock()) as client:\n"
+            "        print(sorted(m for m in sys.modules\n"
+            "                     if m.startswith('ufaas_dockerapi.')))\n"
+            "        client.container\n"
+            "        print('ufaas_dockerapi.container' in sys.modules,\n"
+            "              'ufaas_dockerapi.archive' in sys.modules)\n"
+            "asyncio.run(main())\n")
+    out = subprocess.check_output([sys.executable, "-c", code]).decode()
+    loaded, container = out.splitlines()
+    for name in ("container", "exec", "image", "system", "utils"):
+        assert "ufaas_dockerapi.%s'" % name not in loaded
+    assert container == "True False"
+
+    # The API types can be imported at runtime, which loads their modules.
+    code = ("import sys\n"
+            "from ufaas_dockerapi.types import TransportType\n"
+            "print('ufaas_dockerapi.container' in sys.modules)\n"
+            "from ufaas_dockerapi.types import ContainerAPIType, ConfigType\n"
+            "print(ContainerAPIType.__name__, ConfigType.__name__)\n")
+    out = subprocess.check_output([sys.executable, "-c", code]).decode()
+    assert out.splitlines() == ["False", "ContainerAPIBase ConfigBase"]
+
+
+@pytest.mark.asyncio
+async def test_negotiation():
+    async with FakeDockerEngine(api_version="1.30") as engine:
+        transport = engine.transport()
+        async with DockerClient(transport) as client:
+            assert client.version is None
+            await asyncio.gather(*[client.container.list()
+                                   for _ in range(10)])
+            assert client.version == (1, 30)
+            assert transport.api_version == (1, 30)
+            # One ping, shared by the concurrent calls.
+            assert engine.requests == 11
+
+        # Later clients of the transport reuse the version.
+        async with DockerClient(transport) as client:
+            assert client.version == (1, 30)
+            await client.container.create("fn", ALPINE)
+            assert engine.requests == 12
+
+        # A version given to the client is used as is.
+        async with DockerClient(engine.transport(),
+                                version=(1, 39)) as client:
+            with pytest.raises(DockerAPIException) as exc_info:
+                await client.container.list()
+            assert exc_info.value.http_status == 400
+
+    with pytest.raises(APIVersionError):
+        DockerClient(engine.transport(), version=(1, 24))
+
+
+@pytest.mark.asyncio
+async def test_negotiation_fallback():
+    async with OldFakeDockerEngine(api_version="1.35") as engine:
+        async with DockerClient(engine.transport()) as client:
+            assert await client.api_version() == (1, 35)
+            _, info = await client.container.create("fn", ALPINE)
+            assert info["Id"]
+
+    async with FakeDockerEngine(api_version="1.24") as engine:
+        async with DockerClient(engine.transport()) as client:
+            with pytest.raises(APIVersionError):
+                await client.container.list()
+            # A failed negotiation is tried again.
+            engine.api_version = "1.25"
+            await client.container.list()
+            assert client.version == (1, 25)
@@ -0,0 +1,228 @@
+"""
+Tar archives streamed from files on disk, as used for build contexts and for
+copying files into containers, without ever holding the archive in memory.
+
+    entries = scan_context("fn/", "Dockerfile")
+    digest = context_hash(entries)
+    async for chunk in tar_stream(entries):
+        ...
+"""
+
+import asyncio
+import fnmatch
+import hashlib
+import os
+import stat
+import tarfile
+from typing import (AsyncIterator, Callable, Dict, Generator, List, NamedTuple,
+                    Optional, Tuple)
+
+from ufaas_dockerapi.utils import FILE_CHUNK_SIZE
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+# (path, size, mtime, inode) of a file to the SHA-256 of its contents.
+DigestCache = Dict[Tuple[str, int, int, int], bytes]
+
+
+class ArchiveEntry(NamedTuple):
+    """
+    A file, directory or symlink at `path` stored in the archive as
+    `arcname`.
+    """
+    path: str
+    arcname: str
+    stat: os.stat_result
+
+
+def read_dockerignore(context_dir: str) -> List[Tuple[bool, str]]:
+    """
+    The patterns in a context's .dockerignore as `(exception, pattern)`
+    pairs, an exception being a pattern starting with "!".
+    """
+    patterns = []
+    try:
+        with open(os.path.join(context_dir, ".dockerignore")) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                exception = line.startswith("!")
+                pattern = os.path.normpath(line.lstrip("!").strip())
+                patterns.append((exception, pattern.lstrip("/")))
+    except FileNotFoundError:
+        pass
+    return patterns
+
+
+def ignored(arcname: str, patterns: List[Tuple[bool, str]]) -> bool:
+    """
+    Whether .dockerignore `patterns` exclude `arcname`. As in Docker the last
+    matching pattern wins and a pattern matching a directory matches
+    everything in it, but patterns are matched with `fnmatch`, so "*" also
+    matches "/" and "**" isn't special.
+    """
+    result = False
+    for exception, pattern in patterns:
+        if (fnmatch.fnmatchcase(arcname, pattern) or
+                arcname.startswith(pattern + "/")):
+            result = not exception
+    return result
+
+
+def scan_path(path: str, exclude: Optional[Callable[[str], bool]] = None
+              ) -> List[ArchiveEntry]:
+    """
+    The entries for archiving a directory's contents, sorted by name so that
+    the archive only changes when the files do, or for a single file. Names
+    for which `exclude` returns True are left out.
+
+    This touches the disk, so call it in an executor from the event loop.
+    """
+    if not os.path.isdir(path):
+        return [ArchiveEntry(path, os.path.basename(path), os.lstat(path))]
+    entries = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        rel_root = os.path.relpath(root, path)
+        for name in sorted(dirs + files):
+            full = os.path.join(root, name)
+            arcname = os.path.normpath(os.path.join(rel_root, name))
+            if exclude is not None and exclude(arcname):
+                continue
+            entries.append(ArchiveEntry(full, arcname, os.lstat(full)))
+    return entries
+
+
+def scan_context(context_dir: str,
+                 dockerfile: str = "Dockerfile") -> List[ArchiveEntry]:
+    """
+    The entries of a build context. Files excluded by .dockerignore are left
+    out, except for `dockerfile` and .dockerignore itself which Docker
+    always needs.
+
+    This touches the disk, so call it in an executor from the event loop.
+    """
+    patterns = read_dockerignore(context_dir)
+    keep = {os.path.normpath(dockerfile), ".dockerignore"}
+    return scan_path(context_dir, lambda arcname: (
+        arcname not in keep and ignored(arcname, patterns)))
+
+
+def _file_digest(entry: ArchiveEntry,
+                 cache: Optional[DigestCache]) -> bytes:
+    st = entry.stat
+    key = (entry.path, st.st_size, st.st_mtime_ns, st.st_ino)
+    if cache is not None and key in cache:
+        return cache[key]
+    h = hashlib.sha256()
+    with open(entry.path, "rb") as f:
+        for chunk in iter(lambda: f.read(FILE_CHUNK_SIZE), b""):
+            h.update(chunk)
+    digest = h.digest()
+    if cache is not None:
+        cache[key] = digest
+    return digest
+
+
+def context_hash(entries: List[ArchiveEntry], extra: bytes = b"",
+                 cache: Optional[DigestCache] = None) -> str:
+    """
+    A SHA-256 over the names, types, permissions and contents of `entries`
+    and `extra`, such as the build arguments. Modification times aren't
+    included, so touching a file doesn't change the hash.
+
+    File digests are looked up in and added to `cache` if given, keyed by
+    the file's size, mtime and inode, so unchanged files aren't read again.
+    This reads files, so call it in an executor from the event loop.
+    """
+    h = hashlib.sha256()
+    h.update(extra)
+    for entry in entries:
+        st = entry.stat
+        h.update(b"\0%s\0%o\0" % (entry.arcname.encode(
+            errors="surrogateescape"), st.st_mode))
+        if stat.S_ISREG(st.st_mode):
+            h.update(_file_digest(entry, cache))
+        elif stat.S_ISLNK(st.st_mode):
+            h.update(os.readlink(entry.path).encode(
+                errors="surrogateescape"))
+    return h.hexdigest()
+
+
+def _header(entry: ArchiveEntry) -> Optional[tarfile.TarInfo]:
+    st = entry.stat
+    info = tarfile.TarInfo(entry.arcname)
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.mtime = int(st.st_mtime)
+    if stat.S_ISREG(st.st_mode):
+        info.size = st.st_size
+    elif stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(st.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(entry.path)
+    else:
+        # Sockets, devices and pipes can't be copied.
+        return None
+    return info
+
+
+def _tar_chunks(entries: List[ArchiveEntry],
+                chunk_size: int) -> Generator[bytes, None, None]:
+    buf = bytearray()
+    for entry in entries:
+        info = _header(entry)
+        if info is None:
+            continue
+        buf += info.tobuf(tarfile.PAX_FORMAT)
+        if info.type == tarfile.REGTYPE:
+            left = info.size
+            with open(entry.path, "rb") as f:
+                while left:
+                    want = min(left, max(chunk_size - len(buf), BLOCK_SIZE))
+                    data = f.read(want)
+                    buf += data or b"\0" * want
+                    left -= len(data) or want
+                    if len(buf) >= chunk_size:
+                        yield bytes(buf)
+                        buf = bytearray()
+            buf += b"\0" * (-info.size % BLOCK_SIZE)
+        if len(buf) >= chunk_size:
+            yield bytes(buf)
+            buf = bytearray()
+    # The end of an archive is marked by two empty blocks.
+    buf += b"\0" * (2 * BLOCK_SIZE)
+    yield bytes(buf)
+
+
+async def tar_stream(entries: List[ArchiveEntry],
+                     chunk_size: int = FILE_CHUNK_SIZE
+                     ) -> AsyncIterator[bytes]:
+    """
+    Yield a tar archive of `entries` in chunks of `chunk_size` bytes, small
+    files being packed together. Each chunk is read in the default executor
+    as the archive is consumed, however many files it takes, and owners are
+    stored as root.
+
+    A file's size is taken from `entries`. If a file changes size while
+    being archived its contents are truncated or padded with zeros, so the
+    archive stays valid.
+    """
+    loop = asyncio.get_event_loop()
+    chunks = _tar_chunks(entries, chunk_size)
+    pending: Optional['asyncio.Future[Optional[bytes]]'] = None
+    try:
+        while True:
+            pending = loop.run_in_executor(None, next, chunks, None)
+            # Shielded so that being cancelled doesn't leave the read running
+            # unawaited.
+            chunk = await asyncio.shield(pending)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # The generator can't be closed while it's running in the executor.
+        if pending is not None:
+            await asyncio.wait([pending])
+        chunks.close()
@@ -0,0 +1,105 @@
+"""
+A TTL cache for API responses which coalesces concurrent requests for the
+same key, so that many callers asking for the same thing at once result in a
+single request to Docker.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import (Awaitable, Callable, Dict, Generic, Hashable, Optional,
+                    Tuple, TypeVar)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Caches values for `ttl` seconds, holding at most `max_size` of them and
+    evicting the least recently used first. With a `ttl` of 0 nothing is
+    kept, but concurrent requests are still coalesced.
+
+    Failed fetches are not cached, every caller waiting on one gets its
+    exception.
+    """
+    def __init__(self, ttl: float, max_size: int = 4096) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._values: 'OrderedDict[K, Tuple[float, V]]' = OrderedDict()
+        # Fetches in progress. Invalidating a key drops its fetch from here,
+        # so that a fetch started before the invalidation is neither shared
+        # nor stored afterwards, while fetches for other keys are untouched.
+        self._inflight: Dict[K, 'asyncio.Future[V]'] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    async def get(self, key: K, fetch: Callable[[], Awaitable[V]]) -> V:
+        """
+        The cached value for `key`, calling `fetch` to get it if there isn't
+        a fresh one and no other caller is already fetching it.
+        """
+        entry = self._values.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._values.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._values[key]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            future = asyncio.ensure_future(self._fetch(key, fetch))
+            # Retrieve the exception in case every caller was cancelled.
+            future.add_done_callback(
+                lambda f: f.cancelled() or f.exception())
+            self._inflight[key] = future
+        # Shielded so that a cancelled caller doesn't cancel the fetch for
+        # everybody else waiting on it.
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key: K, fetch: Callable[[], Awaitable[V]]) -> V:
+        try:
+            value = await fetch()
+        finally:
+            # If the key was invalidated while fetching, the value may have
+            # been read before a write and is not stored.
+            current = self._inflight.get(key) is asyncio.current_task()
+            if current:
+                del self._inflight[key]
+        if self.ttl > 0 and current:
+            self._values[key] = (time.monotonic() + self.ttl, value)
+            if len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+        return value
+
+    def invalidate(self, key: Optional[K] = None) -> None:
+        """
+        Forget the value for `key`, or every value if `key` is None.
+        """
+        if key is None:
+            self._values.clear()
+            self._inflight.clear()
+        else:
+            self._values.pop(key, None)
+            self._inflight.pop(key, None)
+
+    def invalidate_where(self,
+                         predicate: Callable[[K, Optional[V]], bool]) -> None:
+        """
+        Forget every value for which `predicate(key, value)` is True.
+        Fetches in progress are checked with a value of None, as their value
+        isn't known yet.
+        """
+        for key in [k for k, (_, v) in self._values.items()
+                    if predicate(k, v)]:
+            del self._values[key]
+        for key in [k for k in self._inflight if predicate(k, None)]:
+            del self._inflight[key]
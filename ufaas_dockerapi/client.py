@@ -1,56 +1,224 @@
-from typing import Optional, TYPE_CHECKING, Tuple
+import asyncio
+from types import TracebackType
+from typing import Optional, TYPE_CHECKING, Type
 
 from aiohttp import ClientSession
 
-from ufaas_dockerapi.config import AuthConfig
+from ufaas_dockerapi.codec import (DEFAULT_DECODE_THRESHOLD, JSONCodec,
+                                   default_codec)
+from ufaas_dockerapi.exceptions import APIVersionError
+from ufaas_dockerapi.limiter import ConcurrencyLimits, RetryPolicy
+from ufaas_dockerapi.metrics import MetricsSink, create_trace_config
 from ufaas_dockerapi.transports import DockerSock
-from ufaas_dockerapi.types import (ContainerAPIType, ExecAPIType, ImageAPIType,
-                                   SystemAPIType, TransportType)
+from ufaas_dockerapi.types import TransportType
+from ufaas_dockerapi.versions import (APIVersion, MIN_API_VERSION,
+                                      format_version, negotiate)
 
 if TYPE_CHECKING:
     from aiohttp import BaseConnector
 
+    from ufaas_dockerapi.config import AuthConfig
+    from ufaas_dockerapi.container import ContainerAPI
+    from ufaas_dockerapi.exec import ExecAPI
+    from ufaas_dockerapi.image import ImageAPI
+    from ufaas_dockerapi.state import StateCache
+    from ufaas_dockerapi.system import SystemAPI
+    from ufaas_dockerapi.types import (ContainerAPIType, ExecAPIType,
+                                       ImageAPIType, SystemAPIType)
+    from ufaas_dockerapi.waiter import ExitWaiter
+
 
 class DockerClient:
+    """
+    The connection pool settings `limit`, `keepalive_timeout` and
+    `stream_limit` override those of the transport, see `DockerSock`.
+
+    The client should be closed when no longer needed, either with `close` or
+    by using it as an async context manager.
+
+    If `metrics` is given every request is timed and reported to it, see
+    `ufaas_dockerapi.metrics`.
+
+    If `cache_ttl` is given list and inspect responses are cached for that
+    many seconds and concurrent identical requests share a single request,
+    see `ufaas_dockerapi.cache`. A `cache_ttl` of 0 only shares requests.
+
+    `limits` adapts the number of requests in flight to how dockerd copes,
+    `retry` retries idempotent requests which failed from overload and
+    `call_timeout` limits the seconds any call may take, see
+    `ufaas_dockerapi.limiter`.
+
+    Request and response bodies are encoded and decoded with `codec`,
+    orjson if it is installed and the standard library otherwise. Responses
+    of more than `decode_threshold` bytes are decoded in the default
+    executor, see `ufaas_dockerapi.codec`.
+
+    `state_cache` is set while a `StateCache` is following this client's
+    events, see `ufaas_dockerapi.state`. Waits on container exits share a
+    single events subscription, see `ufaas_dockerapi.waiter`.
+
+    Requests are made with API `version` if given. Otherwise the highest
+    version both the client and Docker support is negotiated before the
+    first request, unless the transport already knows it, see
+    `ufaas_dockerapi.versions`.
+
+    The API namespaces, such as `container`, are imported and created on
+    first use so that a client which only needs some of them starts quickly.
+    """
     def __init__(self, transport: TransportType,
-                 auth: Optional[AuthConfig] = None,
-                 version: Tuple[int, int] = (1, 25)):
-        self._version = version
+                 auth: Optional['AuthConfig'] = None,
+                 version: Optional[APIVersion] = None,
+                 limit: Optional[int] = None,
+                 keepalive_timeout: Optional[float] = None,
+                 stream_limit: Optional[int] = None,
+                 metrics: Optional[MetricsSink] = None,
+                 cache_ttl: Optional[float] = None,
+                 limits: Optional[ConcurrencyLimits] = None,
+                 retry: Optional[RetryPolicy] = None,
+                 call_timeout: Optional[float] = None,
+                 codec: Optional[JSONCodec] = None,
+                 decode_threshold: int = DEFAULT_DECODE_THRESHOLD):
+        if version is not None and version < MIN_API_VERSION:
+            raise APIVersionError("API version %s is older than %s." % (
+                format_version(version), format_version(MIN_API_VERSION)))
+        self._version: Optional[APIVersion] = None
+        self._prefix: Optional[str] = None
+        self._negotiation: Optional['asyncio.Future[APIVersion]'] = None
+        self._set_version(version or transport.api_version)
         self._transport = transport
-        self._session = ClientSession(connector=self.conn)
+        self._base_url = transport.base_url
+        self._metrics = metrics
+        self._cache_ttl = cache_ttl
+        self._limits = limits
+        self._retry = retry
+        self._call_timeout = call_timeout
+        self._codec = codec if codec is not None else default_codec()
+        self._decode_threshold = decode_threshold
+        self.state_cache: Optional['StateCache'] = None
+        self._exits: Optional['ExitWaiter'] = None
+        # Only trace requests if there's somewhere for the metrics to go.
+        trace_configs = [create_trace_config()] if metrics else None
+        self._connector = transport.create_connection(
+            limit=limit, keepalive_timeout=keepalive_timeout)
+        self._session = ClientSession(connector=self._connector,
+                                      trace_configs=trace_configs)
 
-        if version >= (1, 25):
-            from .container import ContainerAPI
-            from .image import ImageAPI
-            from .exec import ExecAPI
-            from .system import SystemAPI
-            self._container = ContainerAPI(self)
-            self._image = ImageAPI(self)
-            self._exec = ExecAPI(self)
-            self._system = SystemAPI(self)
+        # Long-lived streams use the ordinary session unless the transport
+        # has been given a separate pool for them.
+        stream_conn = transport.create_stream_connection(limit=stream_limit)
+        if stream_conn is not None:
+            self._stream_session = ClientSession(connector=stream_conn,
+                                                 trace_configs=trace_configs)
+        else:
+            self._stream_session = self._session
+
+        self._container: Optional['ContainerAPI'] = None
+        self._image: Optional['ImageAPI'] = None
+        self._exec: Optional['ExecAPI'] = None
+        self._system: Optional['SystemAPI'] = None
+
+    async def __aenter__(self) -> 'DockerClient':
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """
+        Close the connection pools. The client can't be used afterwards.
+        """
+        if self._exits is not None:
+            await self._exits.close()
+        if self._stream_session is not self._session:
+            await self._stream_session.close()
+        await self._session.close()
+
+    def _set_version(self, version: Optional[APIVersion]) -> None:
+        self._version = version
+        if version is not None:
+            self._prefix = "/v%s" % format_version(version)
+
+    @property
+    def version(self) -> Optional[APIVersion]:
+        """
+        The API version requests are made with, None until it's negotiated.
+        """
+        return self._version
+
+    async def api_version(self) -> APIVersion:
+        """
+        The API version requests are made with, negotiating it with Docker
+        if that hasn't been done yet. Concurrent callers share a single
+        negotiation.
+        """
+        if self._version is not None:
+            return self._version
+        if self._negotiation is None:
+            self._negotiation = asyncio.ensure_future(negotiate(self))
+        negotiation = self._negotiation
+        try:
+            version = await asyncio.shield(negotiation)
+        except Exception:
+            # A failed negotiation is tried again by the next caller.
+            if negotiation.done() and self._negotiation is negotiation:
+                self._negotiation = None
+            raise
+        self._set_version(version)
+        self._transport.api_version = version
+        return version
+
+    @property
+    def metrics(self) -> Optional[MetricsSink]:
+        return self._metrics
+
+    @property
+    def limits(self) -> Optional[ConcurrencyLimits]:
+        return self._limits
+
+    @property
+    def codec(self) -> JSONCodec:
+        return self._codec
+
+    @property
+    def closed(self) -> bool:
+        return self._session.closed
 
     @property
     def conn(self) -> 'BaseConnector':
         """
-        Helper that returns the aiohttp connection object for the transport
-        in use.
+        Helper that returns the aiohttp connection pool shared by all requests
+        made with this client.
         """
-        return self._transport.create_connection()
+        return self._connector
 
     @property
-    def container(self) -> ContainerAPIType:
+    def container(self) -> 'ContainerAPIType':
+        if self._container is None:
+            from ufaas_dockerapi.container import ContainerAPI
+            self._container = ContainerAPI(self)
         return self._container
 
     @property
-    def image(self) -> ImageAPIType:
+    def image(self) -> 'ImageAPIType':
+        if self._image is None:
+            from ufaas_dockerapi.image import ImageAPI
+            self._image = ImageAPI(self)
         return self._image
 
     @property
-    def exec(self) -> ExecAPIType:
+    def exec(self) -> 'ExecAPIType':
+        if self._exec is None:
+            from ufaas_dockerapi.exec import ExecAPI
+            self._exec = ExecAPI(self)
         return self._exec
 
     @property
-    def system(self) -> SystemAPIType:
+    def system(self) -> 'SystemAPIType':
+        if self._system is None:
+            from ufaas_dockerapi.system import SystemAPI
+            self._system = SystemAPI(self)
         return self._system
 
 
@@ -0,0 +1,118 @@
+"""
+The JSON codec used for request bodies and responses. orjson is used if it
+is installed as it is several times quicker than the standard library, which
+is the fallback.
+
+Decoding holds the GIL, so a large response decoded in a thread stalls the
+event loop just as much as one decoded on it. `loads_yielding` decodes a
+large array a chunk at a time instead, letting other threads run in
+between, which is how `DockerClient` decodes big list responses off the loop.
+"""
+
+import json
+import re
+import time
+from typing import Any, Union
+
+# orjson is optional, without it the standard library's json is used.
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+# Responses larger than this many bytes are decoded in the default executor.
+DEFAULT_DECODE_THRESHOLD = 256 * 1024
+# Bytes of an array decoded by `loads_yielding` between giving up the GIL.
+_YIELD_BYTES = 64 * 1024
+
+# The end of an object or array that may be an element of the top-level
+# array, and the comma after it.
+_BOUNDARY = re.compile(rb"[}\]]\s*,")
+
+
+class JSONCodec:
+    """
+    Encodes and decodes JSON with the standard library.
+    """
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    Encodes and decodes JSON with orjson, which must be installed.
+    """
+    name = "orjson"
+
+    def __init__(self) -> None:
+        if orjson is None:
+            raise RuntimeError("orjson is not installed.")
+
+    def dumps(self, obj: Any) -> bytes:
+        data: bytes = orjson.dumps(obj)
+        return data
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+
+def default_codec() -> JSONCodec:
+    """
+    An `OrjsonCodec` if orjson is installed, otherwise a `JSONCodec`.
+    """
+    return OrjsonCodec() if orjson is not None else JSONCodec()
+
+
+def _depth(data: bytes, start: int, end: int) -> int:
+    return (data.count(b"{", start, end) + data.count(b"[", start, end) -
+            data.count(b"}", start, end) - data.count(b"]", start, end))
+
+
+def loads_yielding(codec: JSONCodec, data: bytes) -> Any:
+    """
+    Decode `data` with `codec`, for use in a thread. A top-level array is
+    decoded a chunk of elements at a time, sleeping for 0 seconds between
+    chunks so that the event loop's thread gets the GIL back promptly.
+    Anything else is decoded in one go.
+
+    The array is cut after an element that is an object or array, found by
+    counting brackets as the data is scanned, once. Brackets in strings can
+    throw the count off, in which case the rest of the array is decoded in
+    one go: a count that never balances finds no more cuts, and a cut that
+    doesn't decode ends the chunking.
+    """
+    start = len(data) - len(data.lstrip())
+    if not data.startswith(b"[", start):
+        return codec.loads(data)
+    start += 1
+    items = []
+    # Brackets opened and not closed between `start` and `scanned`.
+    depth = 0
+    scanned = start
+    pos = start + _YIELD_BYTES
+    while True:
+        match = _BOUNDARY.search(data, pos)
+        if match is None:
+            break
+        end = match.start() + 1
+        pos = match.end()
+        depth += _depth(data, scanned, end)
+        scanned = end
+        if depth != 0:
+            continue
+        try:
+            chunk = codec.loads(b"[" + data[start:end] + b"]")
+        except ValueError:
+            break
+        items.extend(chunk)
+        start = scanned = pos
+        pos = start + _YIELD_BYTES
+        time.sleep(0)
+    # The rest, with the closing bracket, is checked for errors here.
+    items.extend(codec.loads(b"[" + data[start:]))
+    return items
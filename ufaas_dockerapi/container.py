@@ -1,16 +1,55 @@
+import asyncio
+import json
+import tempfile
+import time
 from abc import ABC
-from dataclasses import asdict
-from typing import Optional, TYPE_CHECKING
+from typing import (AsyncIterable, AsyncIterator, Dict, Hashable, Iterable,
+                    List, NamedTuple, Optional, TYPE_CHECKING, Tuple, Union,
+                    cast)
 
 from aiohttp import ClientWebSocketResponse
 
-from ufaas_dockerapi.config import ContainerConfig, config_dict_factory
-from ufaas_dockerapi.types import DockerJSONResponse
-from ufaas_dockerapi.utils import (api_delete, api_post, convert_bool,
-                                   get_websocket, strip_nulls)
+from ufaas_dockerapi.cache import TTLCache
+from ufaas_dockerapi.config import ContainerConfig, serialize_config
+from ufaas_dockerapi.exceptions import DockerAPIException
+from ufaas_dockerapi.streams import MultiplexedStream, RingBuffer
+from ufaas_dockerapi.types import DockerJSONResponse, JsonDict
+from ufaas_dockerapi.utils import (FILE_CHUNK_SIZE, STREAM_TIMEOUT,
+                                   api_delete, api_get, api_open, api_post,
+                                   api_stream, api_upload, bounded_map,
+                                   convert_bool, decode_json, get_websocket,
+                                   read_file, strip_nulls)
+from ufaas_dockerapi.waiter import ExitStatus, ExitWaiter
 
 if TYPE_CHECKING:
     from ufaas_dockerapi.client import DockerClient
+    from ufaas_dockerapi.state import ContainerState
+
+# Default number of simultaneous requests made by the bulk operations.
+DEFAULT_BULK_CONCURRENCY = 16
+
+# A local file or directory, or a tar archive.
+ArchiveSource = Union[str, bytes, Iterable[bytes], AsyncIterable[bytes]]
+
+# The status a `Container` has for Docker's states it doesn't track itself.
+_LIFECYCLE = {"restarting": "running", "removing": "exited",
+              "dead": "exited"}
+# Signals a `Container` is assumed to exit on when killed with them.
+_KILL_SIGNALS = ("9", "KILL", "SIGKILL")
+
+
+class BulkResult(NamedTuple):
+    """
+    The outcome of one container's operation in a bulk operation, exactly one
+    of `result` and `error` is set.
+    """
+    container: str
+    result: Optional[DockerJSONResponse]
+    error: Optional[Exception]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
 
 class ContainerAPIBase(ABC):
@@ -28,7 +67,95 @@ class ContainerAPI(ContainerAPIBase):
     """
     def __init__(self, client: 'DockerClient') -> None:
         super().__init__(client)
-        self._baseuri = "http://v1.25/containers"
+        self._baseuri = "%s/containers" % client._base_url
+        self._cache: Optional[TTLCache[Hashable, DockerJSONResponse]] = None
+        if client._cache_ttl is not None:
+            self._cache = TTLCache(client._cache_ttl)
+
+    @property
+    def cache(self) -> Optional[TTLCache[Hashable, DockerJSONResponse]]:
+        return self._cache
+
+    def invalidate(self, container: Optional[str] = None) -> None:
+        """
+        Drop cached responses that may be out of date after a change to
+        `container`, given by name or ID: its inspect responses and every
+        list. If `container` is None the whole cache is dropped.
+
+        Changes made through this API are invalidated automatically, this is
+        for changes made elsewhere, for example as seen in Docker's events.
+        """
+        cache = self._cache
+        if cache is None:
+            return
+        if container is None:
+            cache.invalidate()
+            return
+        ref = container.lstrip("/")
+
+        def stale(key: Hashable,
+                  value: Optional[DockerJSONResponse]) -> bool:
+            if not isinstance(key, tuple) or key[0] == "list":
+                return True
+            if value is None:
+                # A fetch in progress, which may be by an ID prefix.
+                return key[1] == ref or ref.startswith(key[1])
+            res = value[1]
+            return key[1] == ref or (
+                isinstance(res, dict) and
+                (res.get("Name", "").lstrip("/") == ref or
+                 res.get("Id", "").startswith(ref)))
+
+        cache.invalidate_where(stale)
+
+    async def list(self, filters: Optional[Dict[str, List[str]]] = None,
+                   all: bool = False, limit: Optional[int] = None,
+                   size: bool = False, use_cache: bool = True
+                   ) -> DockerJSONResponse:
+        """
+        List containers, only running ones unless `all` is True. `filters`
+        are applied by Docker, for example
+        `{"status": ["exited"], "label": ["ufaas.function=resize"]}`.
+
+        The response is cached if the client has a cache, unless `use_cache`
+        is False.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ContainerList`
+        """
+        d = convert_bool(strip_nulls({
+            "all": all or None,
+            "limit": limit,
+            "size": size or None,
+            "filters": json.dumps(filters, sort_keys=True) if filters else None
+            }))
+        uri = "%s/json" % self._baseuri
+
+        async def fetch() -> DockerJSONResponse:
+            return await api_get(self._client, uri, params=d)
+
+        if self._cache is None or not use_cache:
+            return await fetch()
+        return await self._cache.get(("list", tuple(sorted(d.items()))),
+                                     fetch)
+
+    async def inspect(self, container: str, size: bool = False,
+                      use_cache: bool = True) -> DockerJSONResponse:
+        """
+        Low-level information about a container, by name or ID. The response
+        is cached if the client has a cache, unless `use_cache` is False.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ContainerInspect`
+        """
+        d = convert_bool(strip_nulls({"size": size or None}))
+        uri = "%s/%s/json" % (self._baseuri, container)
+
+        async def fetch() -> DockerJSONResponse:
+            return await api_get(self._client, uri, params=d)
+
+        if self._cache is None or not use_cache:
+            return await fetch()
+        return await self._cache.get(("inspect", container.lstrip("/"), size),
+                                     fetch)
 
     async def create(self, container_name: str,
                      config: ContainerConfig) -> DockerJSONResponse:
@@ -39,12 +166,14 @@ class ContainerAPI(ContainerAPIBase):
         """
         d = {"name": container_name}
 
-        container_config = strip_nulls(asdict(config,
-                                       dict_factory=config_dict_factory))
+        container_config = serialize_config(config)
 
-        return await api_post(self._client,
-                              "%s/create" % self._baseuri, params=d,
-                              json_body=container_config, streaming=False)
+        try:
+            return await api_post(self._client,
+                                  "%s/create" % self._baseuri, params=d,
+                                  json_body=container_config, streaming=False)
+        finally:
+            self.invalidate(container_name)
 
     async def delete(self, container: str, force_stop: Optional[bool] = None,
                      remove_volumes: Optional[bool] = None,
@@ -58,9 +187,12 @@ class ContainerAPI(ContainerAPIBase):
         d = {"v": remove_volumes, "force": force_stop, "link": remove_link}
         d = convert_bool(strip_nulls(d))
 
-        return await api_delete(self._client,
-                                "%s/%s" % (self._baseuri, container), params=d,
-                                streaming=True)
+        try:
+            return await api_delete(self._client,
+                                    "%s/%s" % (self._baseuri, container),
+                                    params=d, streaming=True)
+        finally:
+            self.invalidate(container)
 
     async def start(self, container_name: str,
                     detach_keysequence: Optional[str] = None
@@ -71,9 +203,13 @@ class ContainerAPI(ContainerAPIBase):
         `https://docs.docker.com/engine/api/v1.39/#operation/ContainerStart`
         """
         d = strip_nulls({"detachKeys": detach_keysequence})
-        return await api_post(self._client,
-                              "%s/%s/start" % (self._baseuri, container_name),
-                              params=d, streaming=False)
+        try:
+            # Repeating a start gets a 304, so it can be retried.
+            return await api_post(self._client, "%s/%s/start" % (
+                self._baseuri, container_name), params=d, streaming=False,
+                idempotent=True)
+        finally:
+            self.invalidate(container_name)
 
     async def stop(self, container_name: str,
                    timeout: Optional[int] = None) -> DockerJSONResponse:
@@ -83,9 +219,13 @@ class ContainerAPI(ContainerAPIBase):
         `https://docs.docker.com/engine/api/v1.39/#operation/ContainerStop`
         """
         d = strip_nulls({"t": timeout})
-        return await api_post(self._client,
-                              "%s/%s/stop" % (self._baseuri, container_name),
-                              params=d, streaming=False)
+        try:
+            # Repeating a stop gets a 304, so it can be retried.
+            return await api_post(self._client, "%s/%s/stop" % (
+                self._baseuri, container_name), params=d, streaming=False,
+                idempotent=True)
+        finally:
+            self.invalidate(container_name)
 
     async def restart(self, container_name: str,
                       timeout: Optional[int] = None) -> DockerJSONResponse:
@@ -96,7 +236,313 @@ class ContainerAPI(ContainerAPIBase):
         """
         d = strip_nulls({"t": timeout})
         uri = "%s/%s/restart" % (self._baseuri, container_name)
-        return await api_post(self._client, uri, params=d, streaming=False)
+        try:
+            return await api_post(self._client, uri, params=d,
+                                  streaming=False)
+        finally:
+            self.invalidate(container_name)
+
+    async def pause(self, container_name: str) -> DockerJSONResponse:
+        """
+        Pause a running container, freezing its processes until it is
+        unpaused. A paused container uses no CPU but keeps its memory.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ContainerPause`
+        """
+        uri = "%s/%s/pause" % (self._baseuri, container_name)
+        try:
+            return await api_post(self._client, uri, streaming=False)
+        finally:
+            self.invalidate(container_name)
+
+    async def unpause(self, container_name: str) -> DockerJSONResponse:
+        """
+        Resume a paused container.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ContainerUnpause`
+        """
+        uri = "%s/%s/unpause" % (self._baseuri, container_name)
+        try:
+            return await api_post(self._client, uri, streaming=False)
+        finally:
+            self.invalidate(container_name)
+
+    async def kill(self, container_name: str,
+                   signal: Optional[str] = None) -> DockerJSONResponse:
+        """
+        Send a signal to a running container, by default SIGKILL. `signal`
+        is a name such as "SIGHUP" or a number.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ContainerKill`
+        """
+        d = strip_nulls({"signal": signal})
+        uri = "%s/%s/kill" % (self._baseuri, container_name)
+        try:
+            return await api_post(self._client, uri, params=d,
+                                  streaming=False)
+        finally:
+            self.invalidate(container_name)
+
+    async def wait(self, container_name: str,
+                   condition: Optional[str] = None) -> DockerJSONResponse:
+        """
+        Wait for a container to stop and return its exit code as the
+        response's "StatusCode". `condition` is "not-running", the default,
+        "next-exit" or "removed".
+
+        The request is held open until the container stops, so it isn't
+        limited by the client's timeouts.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ContainerWait`
+        """
+        d = strip_nulls({"condition": condition})
+        uri = "%s/%s/wait" % (self._baseuri, container_name)
+        resp = await api_open(self._client, "POST", uri, params=d,
+                              timeout=STREAM_TIMEOUT)
+        try:
+            return (resp.status,
+                    await decode_json(self._client, await resp.read()))
+        finally:
+            resp.release()
+
+    @property
+    def exits(self) -> ExitWaiter:
+        """
+        The client's `ExitWaiter`, which `wait_many` uses.
+        """
+        if self._client._exits is None:
+            self._client._exits = ExitWaiter(self._client)
+        return self._client._exits
+
+    def wait_many(self, containers: Iterable[str],
+                  timeout: Optional[float] = None
+                  ) -> Dict[str, 'asyncio.Future[ExitStatus]']:
+        """
+        Futures resolved with the exit status of each container, by name or
+        ID, once it exits. They are all resolved from a single events
+        subscription instead of a `wait` request per container, see
+        `ufaas_dockerapi.waiter`.
+
+        A future fails with `asyncio.TimeoutError` if its container hasn't
+        exited within `timeout` seconds, or `DockerAPIException` if the
+        container doesn't exist.
+        """
+        return {name: self.exits.wait(name, timeout=timeout)
+                for name in containers}
+
+    async def create_many(self,
+                          containers: Iterable[Tuple[str, ContainerConfig]],
+                          concurrency: int = DEFAULT_BULK_CONCURRENCY
+                          ) -> AsyncIterator[BulkResult]:
+        """
+        Create many containers given `(name, config)` pairs, with at most
+        `concurrency` requests in flight. Results are yielded as each
+        container is created, in no particular order, and failures don't stop
+        the rest of the batch.
+        """
+        async def create(item: Tuple[str, ContainerConfig]
+                         ) -> DockerJSONResponse:
+            return await self.create(*item)
+
+        async for item, res, exc in bounded_map(create, containers,
+                                                concurrency):
+            yield BulkResult(item[0], res, exc)
+
+    async def start_many(self, containers: Iterable[str],
+                         concurrency: int = DEFAULT_BULK_CONCURRENCY,
+                         detach_keysequence: Optional[str] = None
+                         ) -> AsyncIterator[BulkResult]:
+        """
+        Start many containers, see `create_many`.
+        """
+        async def start(name: str) -> DockerJSONResponse:
+            return await self.start(name,
+                                    detach_keysequence=detach_keysequence)
+
+        async for name, res, exc in bounded_map(start, containers,
+                                                concurrency):
+            yield BulkResult(name, res, exc)
+
+    async def stop_many(self, containers: Iterable[str],
+                        concurrency: int = DEFAULT_BULK_CONCURRENCY,
+                        timeout: Optional[int] = None
+                        ) -> AsyncIterator[BulkResult]:
+        """
+        Stop many containers, see `create_many`.
+        """
+        async def stop(name: str) -> DockerJSONResponse:
+            return await self.stop(name, timeout=timeout)
+
+        async for name, res, exc in bounded_map(stop, containers,
+                                                concurrency):
+            yield BulkResult(name, res, exc)
+
+    async def delete_many(self, containers: Iterable[str],
+                          concurrency: int = DEFAULT_BULK_CONCURRENCY,
+                          force_stop: Optional[bool] = None,
+                          remove_volumes: Optional[bool] = None
+                          ) -> AsyncIterator[BulkResult]:
+        """
+        Delete many containers, see `create_many`.
+        """
+        async def delete(name: str) -> DockerJSONResponse:
+            return await self.delete(name, force_stop=force_stop,
+                                     remove_volumes=remove_volumes)
+
+        async for name, res, exc in bounded_map(delete, containers,
+                                                concurrency):
+            yield BulkResult(name, res, exc)
+
+    async def attach(self, container_name: str,
+                     detach_keysequence: Optional[str] = None,
+                     return_logs: Optional[bool] = None,
+                     return_stream: Optional[bool] = True,
+                     attach_stdout: Optional[bool] = True,
+                     attach_stderr: Optional[bool] = True,
+                     tty: bool = False) -> MultiplexedStream:
+        """
+        Attach to a container and return its output as a stream which is read
+        as it is produced. `tty` must match the container's config.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ContainerAttach`
+        """
+        d = convert_bool(strip_nulls({
+            "detachKeys": detach_keysequence,
+            "logs": return_logs,
+            "stream": return_stream,
+            "stdout": attach_stdout,
+            "stderr": attach_stderr
+            }))
+        uri = "%s/%s/attach" % (self._baseuri, container_name)
+        resp = await api_open(self._client, "POST", uri, params=d)
+        return MultiplexedStream(resp, tty=tty)
+
+    async def logs(self, container_name: str, follow: bool = False,
+                   since: Optional[float] = None,
+                   tail: Optional[Union[int, str]] = None,
+                   timestamps: bool = False, stdout: bool = True,
+                   stderr: bool = True, tty: bool = False,
+                   buffer: Optional[RingBuffer] = None) -> MultiplexedStream:
+        """
+        Return a container's logs as a stream which is read incrementally,
+        so a long log is never held in memory. With `follow` the stream
+        carries on with new output until the container stops. `since` is a
+        Unix timestamp and `tail` the number of lines from the end to start
+        at, or "all". `tty` must match the container's config.
+
+        Output read from the stream is also kept in `buffer` if given.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ContainerLogs`
+        """
+        d = convert_bool(strip_nulls({
+            "follow": follow,
+            "since": str(since) if since is not None else None,
+            "tail": tail,
+            "timestamps": timestamps,
+            "stdout": stdout,
+            "stderr": stderr
+            }))
+        uri = "%s/%s/logs" % (self._baseuri, container_name)
+        resp = await api_open(self._client, "GET", uri, params=d,
+                              timeout=STREAM_TIMEOUT if follow else None)
+        return MultiplexedStream(resp, tty=tty, buffer=buffer)
+
+    async def stats(self, container_name: str, stream: bool = True
+                    ) -> AsyncIterator[JsonDict]:
+        """
+        Yield a container's resource usage statistics. With `stream` Docker
+        sends a sample about once a second until the container stops,
+        otherwise a single sample. See `ufaas_dockerapi.stats` for turning
+        these into usage of many containers.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ContainerStats`
+        """
+        uri = "%s/%s/stats" % (self._baseuri, container_name)
+        async for sample in api_stream(
+                self._client, "GET", uri,
+                params=convert_bool({"stream": stream}),
+                timeout=STREAM_TIMEOUT if stream else None):
+            yield sample
+
+    async def put_archive(self, container_name: str, path: str,
+                          source: ArchiveSource,
+                          no_overwrite_dir_non_dir: bool = False
+                          ) -> DockerJSONResponse:
+        """
+        Extract files into a directory `path` of a container, which must
+        exist. `source` is the path of a local file or directory, whose
+        contents are copied, or a tar archive as bytes or an iterable or
+        async iterable of chunks. Local files are archived as they are sent, so
+        nothing is buffered however large they are.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/PutContainerArchive`
+        """
+        # tarfile is only imported when needed, see `DockerClient`.
+        from ufaas_dockerapi.archive import scan_path, tar_stream
+        if isinstance(source, str):
+            entries = await asyncio.get_event_loop().run_in_executor(
+                None, scan_path, source)
+            data = tar_stream(entries)
+        else:
+            data = _aiter_chunks(source)
+        d = convert_bool(strip_nulls({
+            "path": path,
+            "noOverwriteDirNonDir": no_overwrite_dir_non_dir or None
+            }))
+        return await api_upload(self._client, "PUT",
+                                "%s/%s/archive" % (self._baseuri,
+                                                   container_name),
+                                data, "application/x-tar", params=d)
+
+    async def put_archive_many(self, containers: Iterable[str], path: str,
+                               source: Union[str, bytes],
+                               concurrency: int = DEFAULT_BULK_CONCURRENCY,
+                               no_overwrite_dir_non_dir: bool = False
+                               ) -> AsyncIterator[BulkResult]:
+        """
+        Extract the same files into many containers, see `put_archive` and
+        `create_many`. A local file or directory is archived once to a
+        temporary file which is then streamed to every container.
+        """
+        from ufaas_dockerapi.archive import scan_path, tar_stream
+        loop = asyncio.get_event_loop()
+        with tempfile.NamedTemporaryFile(suffix=".tar") as f:
+            if isinstance(source, str):
+                entries = await loop.run_in_executor(None, scan_path, source)
+                async for chunk in tar_stream(entries):
+                    await loop.run_in_executor(None, f.write, chunk)
+                await loop.run_in_executor(None, f.flush)
+
+            async def put(name: str) -> DockerJSONResponse:
+                data = (source if isinstance(source, bytes) else
+                        read_file(f.name))
+                return await self.put_archive(
+                    name, path, data,
+                    no_overwrite_dir_non_dir=no_overwrite_dir_non_dir)
+
+            async for name, res, exc in bounded_map(put, containers,
+                                                    concurrency):
+                yield BulkResult(name, res, exc)
+
+    async def get_archive(self, container_name: str, path: str,
+                          chunk_size: int = FILE_CHUNK_SIZE
+                          ) -> AsyncIterator[bytes]:
+        """
+        Yield a tar archive of a file or directory in a container, in chunks
+        of at most `chunk_size` bytes as it arrives. A directory is archived
+        with its name as the top-level entry.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ContainerArchive`
+        """
+        resp = await api_open(self._client, "GET",
+                              "%s/%s/archive" % (self._baseuri,
+                                                 container_name),
+                              params={"path": path}, timeout=STREAM_TIMEOUT)
+        try:
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                yield chunk
+        finally:
+            resp.release()
 
     async def attach_websocket(self, container_name: str,
                                detach_keysequence: Optional[str] = None,
@@ -131,30 +577,233 @@ class ContainerAPI(ContainerAPIBase):
         return await get_websocket(self._client, uri)
 
 
+async def _aiter_chunks(
+        source: Union[bytes, Iterable[bytes], AsyncIterable[bytes]]
+        ) -> AsyncIterator[bytes]:
+    if isinstance(source, bytes):
+        yield source
+    elif isinstance(source, AsyncIterable):
+        async for chunk in source:
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+
 class Container:
     """
     Represents a created container. API methods can be called with this object
     providing a object-oriented interface.
+
+    The container's `status` is tracked locally, as one of "created",
+    "running", "paused" or "exited", or None if it doesn't exist, so that
+    calls which wouldn't change it aren't made. If the client has a
+    `StateCache` the status is read from it once it has caught up with the
+    calls made through this object.
+
+    Idle containers can be paused with `freeze` and resumed with `thaw`,
+    which is much quicker than starting a stopped container.
     """
 
-    def __init__(self, config: Optional[ContainerConfig] = None,
+    def __init__(self, client: 'DockerClient', name: str,
+                 config: Optional[ContainerConfig] = None,
                  created: bool = True, running: bool = False):
         """
         A container object configured based on the `config` object given.
         `created` should be True if the container already exists in Docker.
         `running` should be True if the container is already running in Docker.
         """
-        self._created = created
-        self._running = running
+        self._client = client
+        self._name = name
+        self._status: Optional[str] = None
+        if running:
+            self._status = "running"
+        elif created:
+            self._status = "created"
         self._config = config
+        # The `time.monotonic()` of the last call made through this object.
+        self._changed = 0.0
 
-    async def create(self) -> None:
+    @property
+    def _api(self) -> ContainerAPI:
+        # The client hands out the API base type, but this object is written
+        # against the API version implemented in this module.
+        return cast(ContainerAPI, self._client.container)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def config(self) -> Optional[ContainerConfig]:
+        return self._config
+
+    @property
+    def state(self) -> Optional['ContainerState']:
+        """
+        The container's state from the client's `StateCache`, None if the
+        client has no cache or the container isn't in it.
+        """
+        cache = self._client.state_cache
+        if cache is None:
+            return None
+        return cache.get(self._name)
+
+    def _cached_state(self) -> Optional['ContainerState']:
+        # The cache is only trusted once it has received something since the
+        # last call made through this object, as its events lag behind. Local
+        # times are compared as Docker's clock may not agree with ours.
+        state = self.state
+        if state is not None and state.received >= self._changed:
+            return state
+        return None
+
+    @property
+    def status(self) -> Optional[str]:
+        """
+        "created", "running", "paused" or "exited", or None if the container
+        doesn't exist.
+        """
+        state = self._cached_state()
+        if state is not None:
+            return _LIFECYCLE.get(state.status, state.status)
+        return self._status
+
+    @property
+    def created(self) -> bool:
+        return self.status is not None
+
+    @property
+    def running(self) -> bool:
+        return self.status == "running"
+
+    @property
+    def paused(self) -> bool:
+        return self.status == "paused"
+
+    def _set_status(self, status: Optional[str]) -> None:
+        self._status = status
+        self._changed = time.monotonic()
+
+    async def refresh(self) -> Optional[str]:
         """
-        Create this container in Docker.
+        Update the status from Docker, for when the container may have been
+        changed by something other than this object.
         """
-        if not self._running and not self._created:
-            # Go forward.
-            pass
+        try:
+            _, info = await self._api.inspect(self._name, use_cache=False)
+        except DockerAPIException as e:
+            if e.http_status != 404:
+                raise
+            self._set_status(None)
         else:
-            # Should we raise exception here? Or no news is good news?
+            assert isinstance(info, dict)
+            status = info["State"]["Status"]
+            self._set_status(_LIFECYCLE.get(status, status))
+        return self._status
+
+    async def create(self) -> None:
+        """
+        Create this container in Docker, unless it exists.
+        """
+        if self.created:
+            return
+        if self._config is None:
+            raise ValueError("Container %s has no config to be created "
+                             "with." % self._name)
+        await self._api.create(self._name, self._config)
+        self._set_status("created")
+
+    async def start(self) -> None:
+        """
+        Start this container, creating it first if needed, or unpause it if
+        it is paused.
+        """
+        status = self.status
+        if status == "running":
+            return
+        if status == "paused":
+            await self.unpause()
+            return
+        if status is None:
+            await self.create()
+        await self._api.start(self._name)
+        self._set_status("running")
+
+    async def stop(self, timeout: Optional[int] = None) -> None:
+        """
+        Stop this container if it is running or paused.
+        """
+        if self.status in ("running", "paused"):
+            await self._api.stop(self._name, timeout=timeout)
+            self._set_status("exited")
+
+    async def pause(self) -> None:
+        """
+        Pause this container if it is running.
+        """
+        if self.running:
+            await self._api.pause(self._name)
+            self._set_status("paused")
+
+    async def unpause(self) -> None:
+        """
+        Resume this container if it is paused.
+        """
+        if self.paused:
+            await self._api.unpause(self._name)
+            self._set_status("running")
+
+    async def freeze(self) -> bool:
+        """
+        Pause this container while it is idle. Returns False if it wasn't
+        running, so there was nothing to freeze.
+        """
+        if not self.running:
+            return False
+        await self.pause()
+        return True
+
+    async def thaw(self) -> None:
+        """
+        Make this container ready for work again: unpausing it if it was
+        frozen, otherwise starting it, and creating it first if needed.
+        """
+        await self.start()
+
+    async def kill(self, signal: Optional[str] = None) -> None:
+        """
+        Send a signal to this container if it is running or paused, by
+        default SIGKILL, see `ContainerAPI.kill`.
+        """
+        if self.status not in ("running", "paused"):
             return
+        await self._api.kill(self._name, signal=signal)
+        if signal is None or signal.upper() in _KILL_SIGNALS:
+            self._set_status("exited")
+        else:
+            # The container may or may not exit.
+            self._changed = time.monotonic()
+
+    def wait(self, timeout: Optional[float] = None
+             ) -> 'asyncio.Future[ExitStatus]':
+        """
+        A future resolved with this container's exit status once it exits,
+        see `ContainerAPI.wait_many`.
+        """
+        future = self._api.wait_many([self._name], timeout=timeout)[
+            self._name]
+        future.add_done_callback(self._exited)
+        return future
+
+    def _exited(self, future: 'asyncio.Future[ExitStatus]') -> None:
+        if not future.cancelled() and future.exception() is None:
+            self._set_status("exited")
+
+    async def delete(self, force_stop: bool = True) -> None:
+        """
+        Delete this container from Docker.
+        """
+        if self.created:
+            await self._api.delete(self._name, force_stop=force_stop)
+            self._set_status(None)
@@ -0,0 +1,442 @@
+"""
+Spreads invocations over several worker processes, each with its own event
+loop, `DockerClient` and connection pool, so that the client-side work of
+serialising configs, decoding JSON and demultiplexing output uses more than
+one core.
+
+Invocations of the same container always go to the same worker, so that its
+exec session stays in one place. Outputs of more than `inline_limit` bytes
+come back from the worker in a shared memory segment, copied once on each
+side, rather than being pickled through the worker's socket.
+
+Requests and responses are sent as length-prefixed pickles over a socket
+pair read and written with asyncio streams, so that neither side's event
+loop ever blocks on the other.
+
+    async with Dispatcher(DockerSock(), workers=8) as dispatcher:
+        result = await dispatcher.exec("fn-1", ExecConfig(cmd=["date"]))
+        print(result.exit_code, result.stdout)
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import pickle
+import socket
+import struct
+import zlib
+from multiprocessing.process import BaseProcess
+from multiprocessing.shared_memory import SharedMemory
+from types import TracebackType
+from typing import (Any, Dict, List, NamedTuple, Optional, Set,
+                    TYPE_CHECKING, Tuple, Type, Union, cast)
+
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ExecConfig
+from ufaas_dockerapi.exceptions import DispatcherError, DockerAPIException
+from ufaas_dockerapi.session import ExecSessionPool
+from ufaas_dockerapi.types import TransportType
+
+if TYPE_CHECKING:
+    from ufaas_dockerapi.exec import ExecAPI
+
+# Outputs of at most this many bytes are sent back through the socket.
+DEFAULT_INLINE_LIMIT = 64 * 1024
+
+# The length of a pickled message, sent before it.
+_HEADER = struct.Struct("!Q")
+
+_PING = 0
+_EXEC = 1
+_CALL = 2
+
+# Output from a worker: the bytes themselves, or the name of the shared
+# memory segment holding them.
+_Payload = Union[bytes, str]
+# (request ID, succeeded, result or error, output)
+_Response = Tuple[int, bool, Any, Optional[_Payload]]
+
+
+class ExecResult(NamedTuple):
+    """
+    The output and exit code of a command run by `Dispatcher.exec`.
+    """
+    stdout: bytes
+    stderr: bytes
+    exit_code: int
+
+
+def _export(parts: List[bytes], inline_limit: int) -> _Payload:
+    """
+    `parts` joined, or copied into a new shared memory segment if there's
+    more than `inline_limit` bytes of them. The receiver unlinks it.
+    """
+    size = sum(len(part) for part in parts)
+    if size <= inline_limit:
+        return b"".join(parts)
+    shm = SharedMemory(create=True, size=size)
+    try:
+        buf = shm.buf
+        assert buf is not None
+        offset = 0
+        for part in parts:
+            buf[offset:offset + len(part)] = part
+            offset += len(part)
+        buf.release()
+    finally:
+        shm.close()
+    return shm.name
+
+
+def _import(payload: _Payload, sizes: List[int]) -> List[bytes]:
+    """
+    Split the output of a worker into parts of `sizes`, unlinking its shared
+    memory segment if it has one.
+    """
+    shm = None
+    if isinstance(payload, bytes):
+        data = memoryview(payload)
+    else:
+        shm = SharedMemory(name=payload)
+        assert shm.buf is not None
+        data = shm.buf
+    try:
+        parts = []
+        offset = 0
+        for size in sizes:
+            parts.append(bytes(data[offset:offset + size]))
+            offset += size
+        return parts
+    finally:
+        data.release()
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+def _discard(payload: Optional[_Payload]) -> None:
+    if isinstance(payload, str):
+        try:
+            _import(payload, [])
+        except FileNotFoundError:  # pragma: no cover
+            pass
+
+
+async def _send(writer: asyncio.StreamWriter, message: Any) -> None:
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    # Both writes are buffered before anything else can run, so messages
+    # sent concurrently aren't interleaved.
+    writer.write(_HEADER.pack(len(data)))
+    writer.write(data)
+    await writer.drain()
+
+
+async def _receive(reader: asyncio.StreamReader) -> Any:
+    """
+    The next message from `reader`, raising `asyncio.IncompleteReadError`
+    if the other side has closed its end.
+    """
+    size, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+def _describe(e: Exception) -> Tuple[Any, ...]:
+    if isinstance(e, DockerAPIException):
+        return ("docker", e.http_status, e.json_message)
+    return ("error", "%s: %s" % (type(e).__name__, e))
+
+
+def _error(description: Tuple[Any, ...]) -> Exception:
+    if description[0] == "docker":
+        return DockerAPIException(description[1], description[2])
+    return DispatcherError(description[1])
+
+
+async def _exec(client: DockerClient, container: str, config: ExecConfig,
+                stdin: Optional[bytes], inline_limit: int
+                ) -> Tuple[Any, _Payload]:
+    api = cast('ExecAPI', client.exec)
+    async with await api.spawn(container, config) as proc:
+        if stdin is not None:
+            await proc.write(stdin)
+        if config.attach_stdin:
+            await proc.close_stdin()
+        stdout, stderr = await proc.read()
+        exit_code = await proc.wait()
+    return ((exit_code, len(stdout), len(stderr)),
+            _export([stdout, stderr], inline_limit))
+
+
+async def _serve(sock: socket.socket, transport: TransportType,
+                 kwargs: Dict[str, Any], session_cmd: Optional[List[str]],
+                 inline_limit: int) -> None:
+    loop = asyncio.get_event_loop()
+    reader, writer = await asyncio.open_connection(sock=sock)
+
+    async with DockerClient(transport, **kwargs) as client:
+        sessions = (ExecSessionPool(client, session_cmd)
+                    if session_cmd is not None else None)
+
+        async def handle(request_id: int, kind: int, args: Any) -> None:
+            response: _Response
+            try:
+                if kind == _EXEC:
+                    container, config, stdin = args
+                    value, payload = await _exec(client, container, config,
+                                                 stdin, inline_limit)
+                    response = (request_id, True, value, payload)
+                elif kind == _CALL:
+                    assert sessions is not None
+                    data = await sessions.call(*args)
+                    response = (request_id, True, len(data),
+                                _export([data], inline_limit))
+                else:
+                    response = (request_id, True, os.getpid(), None)
+            except Exception as e:
+                response = (request_id, False, _describe(e), None)
+            try:
+                await _send(writer, response)
+            except OSError:
+                _discard(response[3])
+
+        tasks: Set['asyncio.Task[None]'] = set()
+        try:
+            while True:
+                try:
+                    request = await _receive(reader)
+                except (asyncio.IncompleteReadError, OSError):
+                    break
+                if request is None:
+                    break
+                task = loop.create_task(handle(*request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+            if sessions is not None:
+                await sessions.close()
+
+
+def _worker_main(sock: socket.socket, transport: TransportType,
+                 kwargs: Dict[str, Any], session_cmd: Optional[List[str]],
+                 inline_limit: int) -> None:
+    try:
+        asyncio.run(_serve(sock, transport, kwargs, session_cmd,
+                           inline_limit))
+    except KeyboardInterrupt:  # pragma: no cover
+        pass
+
+
+class _Worker:
+    def __init__(self, process: BaseProcess, sock: socket.socket) -> None:
+        self.process = process
+        self.sock = sock
+        self.pending: Dict[int, 'asyncio.Future[Tuple[Any, Any]]'] = {}
+        # Set once the socket's streams are open, see `Dispatcher._open`.
+        self.opened: Optional['asyncio.Task[None]'] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.lost = False
+
+
+class Dispatcher:
+    """
+    Runs `workers` processes, by default one per CPU, each making requests
+    with its own `DockerClient` of `transport`. `kwargs` are passed on to
+    the clients. The transport and `kwargs` are pickled to reach the
+    workers, so a TLS transport can't be used.
+
+    Invocations are sent to the worker chosen by `worker_for`. A worker
+    which exits fails the invocations it had and is replaced by the next
+    invocation sent to it. Errors from Docker are raised as
+    `DockerAPIException`, others as `DispatcherError`.
+
+    `call` sends payloads to a persistent exec session running
+    `session_cmd` in the container, see `ufaas_dockerapi.session`.
+    """
+    def __init__(self, transport: TransportType,
+                 workers: Optional[int] = None,
+                 session_cmd: Optional[List[str]] = None,
+                 inline_limit: int = DEFAULT_INLINE_LIMIT,
+                 **kwargs: Any) -> None:
+        self._transport = transport
+        self._size = workers or os.cpu_count() or 1
+        self._session_cmd = session_cmd
+        self._inline_limit = inline_limit
+        self._kwargs = kwargs
+        # The workers mustn't inherit the parent's event loop.
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[Optional[_Worker]] = [None] * self._size
+        self._ids = itertools.count()
+        self._closed = False
+
+    async def __aenter__(self) -> 'Dispatcher':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> None:
+        await self.close()
+
+    @property
+    def workers(self) -> int:
+        return self._size
+
+    def worker_for(self, container: str) -> int:
+        """
+        The index of the worker invocations of `container` are sent to,
+        which is the same in every process.
+        """
+        return zlib.crc32(container.encode()) % self._size
+
+    async def start(self) -> None:
+        """
+        Start the workers and wait for them to be ready.
+        """
+        await asyncio.gather(*[self._submit(i, _PING, None)
+                               for i in range(self._size)])
+
+    async def exec(self, container: str, config: ExecConfig,
+                   stdin: Optional[bytes] = None) -> ExecResult:
+        """
+        Run a command in a running container and return its output and exit
+        code once it exits, see `ExecAPI.spawn`. `stdin` is written to the
+        command if `config` attaches stdin, which is then closed.
+        """
+        (exit_code, out_size, err_size), payload = await self._submit(
+            self.worker_for(container), _EXEC,
+            (container, config, stdin))
+        stdout, stderr = _import(payload, [out_size, err_size])
+        return ExecResult(stdout, stderr, exit_code)
+
+    async def call(self, container: str, payload: bytes) -> bytes:
+        """
+        Send `payload` to the container's exec session and return the
+        response, see `ExecSessionPool.call`.
+        """
+        if self._session_cmd is None:
+            raise ValueError("The dispatcher has no session_cmd.")
+        size, data = await self._submit(self.worker_for(container), _CALL,
+                                        (container, payload))
+        return _import(data, [size])[0]
+
+    async def close(self) -> None:
+        """
+        Stop the workers, failing any invocations still in progress.
+        """
+        self._closed = True
+        workers = [w for w in self._workers if w is not None]
+        for worker in workers:
+            assert worker.opened is not None
+            await asyncio.wait([worker.opened])
+            if worker.writer is not None and not worker.lost:
+                try:
+                    await _send(worker.writer, None)
+                except OSError:
+                    pass
+        loop = asyncio.get_event_loop()
+        for worker in workers:
+            await loop.run_in_executor(None, worker.process.join, 5.0)
+            if worker.process.is_alive():  # pragma: no cover
+                worker.process.terminate()
+                await loop.run_in_executor(None, worker.process.join)
+            self._lost(worker, DispatcherError("The dispatcher is closed."))
+
+    def _worker(self, index: int) -> _Worker:
+        worker = self._workers[index]
+        if worker is not None:
+            return worker
+        if self._closed:
+            raise DispatcherError("The dispatcher is closed.")
+        sock, child = socket.socketpair()
+        try:
+            process = self._context.Process(
+                target=_worker_main, name="ufaas-dispatcher-%d" % index,
+                args=(child, self._transport, self._kwargs,
+                      self._session_cmd, self._inline_limit),
+                daemon=True)
+            process.start()
+        except BaseException:
+            sock.close()
+            raise
+        finally:
+            child.close()
+        worker = _Worker(process, sock)
+        self._workers[index] = worker
+        worker.opened = asyncio.ensure_future(self._open(worker))
+        return worker
+
+    async def _open(self, worker: _Worker) -> None:
+        """
+        Open streams on the worker's socket, then read its responses until
+        it exits.
+        """
+        try:
+            reader, worker.writer = await asyncio.open_connection(
+                sock=worker.sock)
+        except OSError:  # pragma: no cover
+            self._lost(worker, DispatcherError(
+                "Worker %s exited." % worker.process.name))
+            return
+        asyncio.ensure_future(self._read(worker, reader))
+
+    async def _read(self, worker: _Worker,
+                    reader: asyncio.StreamReader) -> None:
+        try:
+            while not worker.lost:
+                request_id, ok, value, payload = await _receive(reader)
+                future = worker.pending.get(request_id)
+                if future is None or future.done():
+                    _discard(payload)
+                elif ok:
+                    future.set_result((value, payload))
+                else:
+                    future.set_exception(_error(value))
+        except (asyncio.IncompleteReadError, OSError):
+            self._lost(worker, DispatcherError(
+                "Worker %s exited." % worker.process.name))
+
+    async def _submit(self, index: int, kind: int,
+                      args: Any) -> Tuple[Any, Any]:
+        worker = self._worker(index)
+        request_id = next(self._ids)
+        future: 'asyncio.Future[Tuple[Any, Any]]' = \
+            asyncio.get_event_loop().create_future()
+        worker.pending[request_id] = future
+        try:
+            assert worker.opened is not None
+            await asyncio.shield(worker.opened)
+            # A worker lost in the meantime has failed the future.
+            if worker.writer is not None and not worker.lost:
+                try:
+                    await _send(worker.writer, (request_id, kind, args))
+                except OSError:
+                    self._lost(worker, DispatcherError(
+                        "Worker %s exited." % worker.process.name))
+            return await future
+        except asyncio.CancelledError:
+            # The output may have arrived just as the caller gave up.
+            if future.done() and not future.cancelled() and \
+                    future.exception() is None:
+                _discard(future.result()[1])
+            raise
+        finally:
+            worker.pending.pop(request_id, None)
+
+    def _lost(self, worker: _Worker, error: Exception) -> None:
+        if worker.lost:
+            return
+        worker.lost = True
+        if worker.writer is not None:
+            worker.writer.close()
+        else:
+            worker.sock.close()
+        index = self._workers.index(worker)
+        self._workers[index] = None
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(error)
@@ -11,3 +11,42 @@ class DockerAPIException(Exception):
     def __init__(self, http_status: int, json_message: 'DockerJSON'):
         self.http_status = http_status
         self.json_message = json_message
+
+
+class DockerStreamException(Exception):
+    """
+    Raised when a streamed response from the Docker API can't be decoded, for
+    example when a single message grows beyond the decoder's size limit.
+    """
+
+
+class ExecSessionException(Exception):
+    """
+    Raised by an exec session when its worker returns an error.
+    """
+
+
+class ExecSessionBusy(ExecSessionException):
+    """
+    Raised when an exec session already has as many requests queued as it
+    accepts.
+    """
+
+
+class ExecSessionClosed(ExecSessionException):
+    """
+    Raised when an exec session's worker has exited or been closed.
+    """
+
+
+class APIVersionError(Exception):
+    """
+    Raised when the client and Docker have no API version in common.
+    """
+
+
+class DispatcherError(Exception):
+    """
+    Raised when an invocation sent to a `Dispatcher` worker fails other than
+    with an error from Docker, or the worker exits.
+    """
@@ -1,15 +1,61 @@
+import asyncio
 from abc import ABC
-from dataclasses import asdict
-from typing import TYPE_CHECKING
+from typing import Optional, TYPE_CHECKING
 
-from ufaas_dockerapi.config import ExecConfig, config_dict_factory
+from ufaas_dockerapi.config import ExecConfig, serialize_config
+from ufaas_dockerapi.streams import HijackedStream, MultiplexedStream
 from ufaas_dockerapi.types import DockerJSONResponse
-from ufaas_dockerapi.utils import (api_post, strip_nulls)
+from ufaas_dockerapi.utils import api_get, api_hijack, api_open, api_post
 
 if TYPE_CHECKING:
     from ufaas_dockerapi.client import DockerClient
 
 
+class ExecProcess(HijackedStream):
+    """
+    A running exec instance connected by a hijacked connection, so stdin can
+    be written while output is read. See `ExecAPI.spawn`.
+    """
+    def __init__(self, api: 'ExecAPI', exec_id: str,
+                 reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 tty: bool = False) -> None:
+        super().__init__(reader, writer, tty=tty)
+        self._api = api
+        self._exec_id = exec_id
+        self._returncode: Optional[int] = None
+
+    async def __aenter__(self) -> 'ExecProcess':
+        return self
+
+    @property
+    def exec_id(self) -> str:
+        return self._exec_id
+
+    @property
+    def returncode(self) -> Optional[int]:
+        """
+        The exit code once `wait` has returned, otherwise None.
+        """
+        return self._returncode
+
+    async def wait(self, poll_interval: float = 0.001,
+                   max_poll_interval: float = 0.1) -> int:
+        """
+        Wait for the process to exit and return its exit code, inspecting the
+        exec instance with a backoff from `poll_interval` seconds. Docker
+        closes the output once the process exits, so reading it to the end
+        first means this normally needs a single inspect.
+        """
+        while self._returncode is None:
+            _, res = await self._api.exec_inspect(self._exec_id)
+            if not res["Running"]:  # type: ignore
+                self._returncode = res["ExitCode"]  # type: ignore
+                break
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, max_poll_interval)
+        return self._returncode
+
+
 class ExecAPIBase(ABC):
     """
     Base Class for Exec API versions.
@@ -25,17 +71,24 @@ class ExecAPI(ExecAPIBase):
     """
     def __init__(self, client: 'DockerClient') -> None:
         super().__init__(client)
-        self._baseuri = "http://1.25"
+        self._baseuri = client._base_url
 
     async def run(self, container_name: str,
-                  config: ExecConfig, detach: bool = False,
-                  tty: bool = True) -> DockerJSONResponse:
+                  config: ExecConfig, detach: bool = False
+                  ) -> MultiplexedStream:
         """
-        Performs a "docker exec". Note this only works with running containers.
+        Performs a "docker exec" and returns the command's output as a
+        stream, see `exec_start`. Note this only works with running
+        containers.
+
+            async with await client.exec.run("fn", ExecConfig(
+                    cmd=["echo", "hello"])) as output:
+                stdout, stderr = await output.read()
         """
         _, res = await self.exec_create(container_name, config)
         exec_id = res["Id"]  # type: ignore
-        return await self.exec_start(exec_id, detach=detach, tty=tty)
+        return await self.exec_start(exec_id, detach=detach,
+                                     tty=bool(config.tty))
 
     async def exec_create(self, container_name: str,
                           config: ExecConfig) -> DockerJSONResponse:
@@ -46,21 +99,77 @@ class ExecAPI(ExecAPIBase):
 
         `https://docs.docker.com/engine/api/v1.39/#operation/ContainerExec`
         """
-        exec_config = strip_nulls(asdict(config,
-                                         dict_factory=config_dict_factory))
+        exec_config = serialize_config(config)
         uri = "%s/containers/%s/exec" % (self._baseuri, container_name)
         return await api_post(self._client,
                               uri,
                               json_body=exec_config, streaming=False)
 
     async def exec_start(self, exec_id: str, detach: bool = False,
-                         tty: bool = True) -> DockerJSONResponse:
+                         tty: bool = False) -> MultiplexedStream:
         """
-        Starts are previously setup exec instance (eg. with `exec_create`).
+        Starts a previously setup exec instance (eg. with `exec_create`) and
+        returns its output as a stream which is read as it is produced, with
+        `stdout()` and `stderr()` iterators or `read()`. The stream should be
+        read to the end or closed. `tty` must match the `ExecConfig` the
+        instance was created with. A `detach`ed instance has no output.
+
         `https://docs.docker.com/engine/api/v1.39/#operation/ExecStart`
         """
         opts = {"detach": detach, "tty": tty}
-
-        return await api_post(self._client,
+        resp = await api_open(self._client, "POST",
                               "%s/exec/%s/start" % (self._baseuri, exec_id),
-                              json_body=opts, streaming=True)
+                              json_body=opts)
+        return MultiplexedStream(resp, tty=tty)
+
+    async def exec_start_stream(self, exec_id: str,
+                                tty: bool = False) -> MultiplexedStream:
+        """
+        Starts a previously setup exec instance and returns its output as a
+        stream, the same as `exec_start` without `detach`.
+        """
+        return await self.exec_start(exec_id, tty=tty)
+
+    async def exec_inspect(self, exec_id: str) -> DockerJSONResponse:
+        """
+        Return low-level information about an exec instance, including
+        whether it is running and its exit code.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ExecInspect`
+        """
+        return await api_get(self._client,
+                             "%s/exec/%s/json" % (self._baseuri, exec_id))
+
+    async def exec_start_hijacked(self, exec_id: str,
+                                  tty: bool = False) -> ExecProcess:
+        """
+        Starts a previously setup exec instance on its own connection which
+        Docker hands over to the process: stdin can be written and output is
+        read as it is produced. `tty` must match the `ExecConfig` the instance
+        was created with, which should set `attach_stdin` to write to stdin.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ExecStart`
+        """
+        opts = {"detach": False, "tty": tty}
+        reader, writer = await api_hijack(
+            self._client, "POST",
+            "%s/exec/%s/start" % (self._baseuri, exec_id), json_body=opts)
+        return ExecProcess(self, exec_id, reader, writer, tty=tty)
+
+    async def spawn(self, container_name: str,
+                    config: ExecConfig) -> ExecProcess:
+        """
+        Create and start an exec instance with a hijacked connection, see
+        `exec_start_hijacked`. Unlike `run` the output is available as soon as
+        it is written, rather than once the process has exited.
+
+            proc = await client.exec.spawn("fn", ExecConfig(
+                cmd=["cat"], attach_stdin=True))
+            await proc.write(b"hello")
+            await proc.close_stdin()
+            stdout, stderr = await proc.read()
+            exit_code = await proc.wait()
+        """
+        _, res = await self.exec_create(container_name, config)
+        return await self.exec_start_hijacked(res["Id"],  # type: ignore
+                                              tty=bool(config.tty))
@@ -0,0 +1,1371 @@
+"""
+An in-process fake Docker Engine which serves the endpoints used by this
+library over a Unix socket. It keeps just enough state to behave like dockerd
+for tests and benchmarks that can't rely on a real daemon.
+
+    async with FakeDockerEngine(latency=0.001) as engine:
+        async with DockerClient(engine.transport()) as client:
+            await client.system.version()
+
+The engine can also be run on its own, which is useful for benchmarks where
+the client and engine shouldn't share an event loop:
+
+    $ python -m ufaas_dockerapi.fake_engine --path /tmp/docker.sock
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import signal
+import struct
+import sys
+import tarfile
+import tempfile
+import time
+from collections import deque
+from datetime import datetime, timezone
+from types import TracebackType
+from typing import (Any, Awaitable, Callable, Deque, Dict, List, Optional,
+                    Set, Tuple, Type, Union, cast)
+from uuid import uuid4
+
+from aiohttp import WSMsgType, web
+
+from ufaas_dockerapi.session import serve
+from ufaas_dockerapi.transports import DockerSock, DockerTCP
+from ufaas_dockerapi.versions import parse_version
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+API_VERSION = "1.39"
+MIN_API_VERSION = "1.12"
+
+# dockerd writes exec and attach output in frames of at most this size.
+_FRAME_SIZE = 32 * 1024
+_FRAME_HEADER = struct.Struct(">BxxxL")
+_HIJACK_PATH = re.compile(r"^(?:/v[0-9.]+)?/exec/([^/]+)/start$")
+# Number of writes kept in each container's log.
+_LOG_HISTORY = 10000
+# Number of past events kept for replaying to `since` requests.
+_EVENT_HISTORY = 1000
+# An image load reports its progress every this many bytes.
+_LOAD_PROGRESS = 64 * 1024 * 1024
+_TAR_BLOCK = 512
+
+
+def _new_id() -> str:
+    return uuid4().hex + uuid4().hex
+
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({"message": message}, status=status)
+
+
+def _get(d: Dict[str, Any], key: str, default: Any = None) -> Any:
+    """
+    Docker decodes JSON bodies with case insensitive keys.
+    """
+    for k, v in d.items():
+        if k.lower() == key.lower():
+            return v
+    return default
+
+
+def _flag(request: web.Request, key: str) -> bool:
+    return request.query.get(key, "").lower() in ("1", "true")
+
+
+def _matches(container: 'FakeContainer', filters: Dict[str, Any]) -> bool:
+    """
+    Whether a container matches the list filters id, name, status and label.
+    """
+    for key, wanted in filters.items():
+        if isinstance(wanted, dict):
+            # Older clients send filters as {"value": true}.
+            wanted = list(wanted)
+        if key == "id":
+            ok = any(container.id.startswith(w) for w in wanted)
+        elif key == "name":
+            ok = any(w.lstrip("/") in container.name for w in wanted)
+        elif key == "status":
+            ok = container.status in wanted
+        elif key == "label":
+            labels = _get(container.config, "Labels", {}) or {}
+            ok = all(labels.get(w.split("=", 1)[0]) == w.split("=", 1)[1]
+                     if "=" in w else w in labels for w in wanted)
+        else:
+            ok = True
+        if not ok:
+            return False
+    return True
+
+
+def _tar_header(name: str, size: int) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    return info.tobuf(tarfile.USTAR_FORMAT)
+
+
+def _tar_padding(size: int) -> bytes:
+    return b"\0" * (-size % _TAR_BLOCK)
+
+
+def _tar_entry(header: bytes) -> Tuple[str, int, bool]:
+    # The name, size and whether it's a regular file from a ustar header,
+    # which is a lot quicker than `TarInfo.frombuf` for many small files.
+    if header[124] & 0x80:
+        # A base-256 size, from GNU tar.
+        info = tarfile.TarInfo.frombuf(header, "utf-8", "surrogateescape")
+        return info.name, info.size, info.isreg()
+    name = header[:100].split(b"\0", 1)[0]
+    if header[257:262] == b"ustar":
+        prefix = header[345:500].split(b"\0", 1)[0]
+        if prefix:
+            name = prefix + b"/" + name
+    size = int(header[124:136].strip(b" \0") or b"0", 8)
+    regular = header[156:157] in (b"0", b"\0", b"7")
+    if header[156:157] == b"5" or (regular and name.endswith(b"/")):
+        name, regular = name.rstrip(b"/"), False
+    return name.decode("utf-8", "surrogateescape"), size, regular
+
+
+class _TarScanner:
+    """
+    Reads the entries of a tar stream as it arrives without buffering it,
+    keeping the contents of only the files named in `keep`, or of every
+    regular file if it is None.
+    """
+    def __init__(self, keep: Optional[Set[str]]) -> None:
+        self._keep = keep
+        self._header = bytearray()
+        # Bytes left of the current entry's data and padding.
+        self._remaining = 0
+        self._kept: Optional[bytearray] = None
+        self._kept_left = 0
+        self._name = ""
+        self.names: List[str] = []
+        self.files: Dict[str, bytes] = {}
+
+    def feed(self, data: bytes) -> None:
+        pos = 0
+        while pos < len(data):
+            if self._remaining:
+                n = min(self._remaining, len(data) - pos)
+                if self._kept is not None:
+                    k = min(n, self._kept_left)
+                    self._kept += data[pos:pos + k]
+                    self._kept_left -= k
+                self._remaining -= n
+                pos += n
+                if not self._remaining:
+                    self._finish()
+                continue
+            chunk = data[pos:pos + _TAR_BLOCK - len(self._header)]
+            self._header += chunk
+            pos += len(chunk)
+            if len(self._header) < _TAR_BLOCK:
+                break
+            header, self._header = bytes(self._header), bytearray()
+            if not header.strip(b"\0"):
+                # The end of the archive is marked by empty blocks.
+                continue
+            name, size, regular = _tar_entry(header)
+            self.names.append(name)
+            self._name = name
+            self._remaining = size + len(_tar_padding(size))
+            if regular and (self._keep is None or name in self._keep):
+                self._kept = bytearray()
+                self._kept_left = size
+            if not self._remaining:
+                self._finish()
+
+    def _finish(self) -> None:
+        if self._kept is not None:
+            self.files[self._name] = bytes(self._kept)
+            self._kept = None
+
+
+class FakeContainer:
+    def __init__(self, name: str, config: Dict[str, Any]) -> None:
+        self.id = _new_id()
+        self.name = name
+        self.config = config
+        self.status = "created"
+        self.exit_code = 0
+        self.changed = time.time()
+        # (time, stream ID, data) of everything written to the log.
+        self.logs: Deque[Tuple[float, int, bytes]] = deque(
+            maxlen=_LOG_HISTORY)
+        self.log_followers: List['asyncio.Queue[Optional[bytes]]'] = []
+        # Files put in the container, by absolute path.
+        self.files: Dict[str, bytes] = {}
+        # Resolved by the next change of status, for waits.
+        self.changes: List['asyncio.Future[None]'] = []
+
+    @property
+    def tty(self) -> bool:
+        return bool(_get(self.config, "Tty", False))
+
+    @property
+    def status_text(self) -> str:
+        # The human readable status shown in container lists.
+        ago = int(time.time() - self.changed)
+        if self.status == "running":
+            return "Up %d seconds" % ago
+        elif self.status == "paused":
+            return "Up %d seconds (Paused)" % ago
+        elif self.status == "exited":
+            return "Exited (%d) %d seconds ago" % (self.exit_code, ago)
+        return self.status.capitalize()
+
+
+class FakeExec:
+    def __init__(self, container: FakeContainer,
+                 config: Dict[str, Any]) -> None:
+        self.id = _new_id()
+        self.container = container
+        self.config = config
+        self.running = False
+        self.exit_code: Optional[int] = None
+
+
+async def _session_echo(payload: bytes) -> bytes:
+    """
+    The exec session worker run by `ufaas-session-echo`: echoes requests,
+    except that "sleep:<seconds>" sleeps first and "fail" raises.
+    """
+    if payload.startswith(b"sleep:"):
+        await asyncio.sleep(float(payload[6:]))
+    elif payload == b"fail":
+        raise ValueError("Asked to fail")
+    return payload
+
+
+class _HijackProtocol(asyncio.Protocol):
+    """
+    Serves a connection to the engine. aiohttp can't hand a connection over
+    to a handler the way dockerd does for `Upgrade: tcp`, so the first request
+    on each connection is looked at here: exec starts asking for an upgrade
+    are served raw by the engine and everything else is passed on to aiohttp.
+    """
+    def __init__(self, engine: 'FakeDockerEngine',
+                 http_factory: Callable[[], asyncio.Protocol]) -> None:
+        self._engine = engine
+        self._http_factory = http_factory
+        self._http: Optional[asyncio.Protocol] = None
+        self._transport: Optional[asyncio.Transport] = None
+        self._buffer = b""
+        self._stdin: Optional[asyncio.StreamReader] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = cast(asyncio.Transport, transport)
+
+    def data_received(self, data: bytes) -> None:
+        if self._http is not None:
+            self._http.data_received(data)
+            return
+        if self._stdin is not None:
+            self._stdin.feed_data(data)
+            return
+        self._buffer += data
+        head, sep, rest = self._buffer.partition(b"\r\n\r\n")
+        if not sep:
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        headers = {}
+        for line in lines[1:]:
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        method, path = lines[0].split()[:2]
+        match = _HIJACK_PATH.match(path)
+        if (method != "POST" or match is None or
+                headers.get("upgrade", "").lower() != "tcp"):
+            self._http = self._http_factory()
+            assert self._transport is not None
+            self._http.connection_made(self._transport)
+            self._http.data_received(self._buffer)
+            self._buffer = b""
+            return
+        length = int(headers.get("content-length", 0))
+        if len(rest) < length:
+            return
+        self._stdin = asyncio.StreamReader()
+        self._stdin.feed_data(rest[length:])
+        assert self._transport is not None
+        self._engine._hijack(self._transport, match.group(1),
+                             json.loads(rest[:length] or b"{}"), self._stdin)
+
+    def eof_received(self) -> Optional[bool]:
+        if self._http is not None:
+            return self._http.eof_received()
+        if self._stdin is not None:
+            self._stdin.feed_eof()
+            # Keep the connection open to write the rest of the output.
+            return True
+        return None
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if self._http is not None:
+            self._http.connection_lost(exc)
+        elif self._stdin is not None:
+            self._stdin.feed_eof()
+
+    def pause_writing(self) -> None:
+        if self._http is not None:
+            self._http.pause_writing()
+
+    def resume_writing(self) -> None:
+        if self._http is not None:
+            self._http.resume_writing()
+
+
+class FakeDockerEngine:
+    """
+    A fake Docker Engine listening on the Unix socket `path`, a temporary
+    socket is used if not given, or on TCP `port` of 127.0.0.1 if that's
+    given, 0 picking a free port.
+
+    `latency` seconds are added to every request. Exec and attach output is
+    `payload_size` bytes of stdout, except for `echo` commands which print
+    their arguments and `true` which prints nothing. An image pull streams
+    `pull_messages` progress messages. Stats streams send a sample every
+    `stats_interval` seconds of a running container using a tenth of a CPU.
+    Saved images have a single layer of `image_size` bytes.
+
+    With `capacity` set at most that many requests are worked on at once,
+    the rest queueing, and the `latency` of each grows in proportion to the
+    queue so that an overloaded engine gets slower overall, as dockerd does
+    under lock contention. Requests given up on by the client are still
+    worked on.
+
+    API versions up to `api_version` are supported, requests for later ones
+    are refused as dockerd does.
+    """
+    def __init__(self, path: Optional[str] = None, latency: float = 0.0,
+                 payload_size: int = 0, pull_messages: int = 10,
+                 stats_interval: float = 1.0,
+                 image_size: int = 1024 * 1024,
+                 capacity: Optional[int] = None,
+                 port: Optional[int] = None,
+                 api_version: str = API_VERSION) -> None:
+        self._tmpdir: Optional[str] = None
+        self._port = port
+        if path is None and port is None:
+            self._tmpdir = tempfile.mkdtemp(prefix="ufaas-fake-engine-")
+            path = os.path.join(self._tmpdir, "docker.sock")
+        self._path = path or ""
+        self.latency = latency
+        self.payload_size = payload_size
+        self.pull_messages = pull_messages
+        self.stats_interval = stats_interval
+        self.image_size = image_size
+        self.capacity = capacity
+        self.api_version = api_version
+        self._slots = asyncio.Semaphore(capacity or 1)
+        self.queued = 0
+        self.images: Dict[str, Dict[str, Any]] = {}
+        self.containers: Dict[str, FakeContainer] = {}
+        self.execs: Dict[str, FakeExec] = {}
+        self.requests = 0
+        self.builds = 0
+        # The file names in the context of each build.
+        self.build_contexts: List[List[str]] = []
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=_EVENT_HISTORY)
+        self._subscribers: List['asyncio.Queue[Optional[Dict[str, Any]]]'] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._hijacked: Set['asyncio.Task[None]'] = set()
+        self._stopping = asyncio.Event()
+
+    async def __aenter__(self) -> 'FakeDockerEngine':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> None:
+        await self.stop()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def port(self) -> Optional[int]:
+        return self._port
+
+    def transport(self, **kwargs: Any) -> Union[DockerSock, DockerTCP]:
+        """
+        A transport connected to this engine, `kwargs` are passed on to
+        `DockerSock` or `DockerTCP`.
+        """
+        if self._port is not None:
+            return DockerTCP("127.0.0.1", self._port, **kwargs)
+        return DockerSock(self._path, **kwargs)
+
+    async def start(self) -> None:
+        self._stopping.clear()
+        self._runner = web.AppRunner(self._make_app())
+        await self._runner.setup()
+        http_factory = cast(Callable[[], asyncio.Protocol],
+                            self._runner.server)
+        loop = asyncio.get_event_loop()
+        if self._port is not None:
+            self._server = await loop.create_server(
+                lambda: _HijackProtocol(self, http_factory), "127.0.0.1",
+                self._port, backlog=4096)
+            self._port = self._server.sockets[0].getsockname()[1]
+        else:
+            self._server = await loop.create_unix_server(
+                lambda: _HijackProtocol(self, http_factory), self._path,
+                backlog=4096)
+
+    async def stop(self) -> None:
+        # Events streams, followed logs and stats never end on their own.
+        self._stopping.set()
+        self.drop_event_streams()
+        for container in self.containers.values():
+            for queue in container.log_followers:
+                queue.put_nowait(None)
+            container.log_followers = []
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for task in list(self._hijacked):
+            task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def exit_container(self, ref: str, exit_code: int = 0) -> None:
+        """
+        Make a running container exit as if its process had, by name or ID.
+        """
+        container = self._find(ref)
+        if container is None or container.status != "running":
+            raise ValueError("No running container %s" % ref)
+        container.exit_code = exit_code
+        self._set_status(container, "exited", "die",
+                         exitCode=str(exit_code))
+
+    def write_log(self, ref: str, data: bytes, stream_id: int = 1) -> None:
+        """
+        Write `data` to a container's log as if its process had printed it,
+        by name or ID.
+        """
+        container = self._find(ref)
+        if container is None:
+            raise ValueError("No container %s" % ref)
+        entry = (time.time(), stream_id, data)
+        container.logs.append(entry)
+        for queue in container.log_followers:
+            queue.put_nowait(self._log_frame(container, entry, False))
+
+    @property
+    def event_streams(self) -> int:
+        """
+        The number of events streams being followed.
+        """
+        return len(self._subscribers)
+
+    def drop_event_streams(self) -> None:
+        """
+        End every events stream, as if the connections had been lost.
+        """
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+        self._subscribers = []
+
+    def _emit(self, container: FakeContainer, action: str,
+              **attrs: str) -> None:
+        now = time.time()
+        attrs["name"] = container.name
+        attrs["image"] = _get(container.config, "Image", "")
+        self._publish({
+            "status": action,
+            "id": container.id,
+            "from": attrs["image"],
+            "Type": "container",
+            "Action": action,
+            "Actor": {"ID": container.id, "Attributes": attrs},
+            "scope": "local",
+            "time": int(now),
+            "timeNano": int(now * 1e9),
+        })
+
+    def _emit_image(self, action: str, actor: str, name: str) -> None:
+        now = time.time()
+        self._publish({
+            "status": action,
+            "id": actor,
+            "Type": "image",
+            "Action": action,
+            "Actor": {"ID": actor, "Attributes": {"name": name}},
+            "scope": "local",
+            "time": int(now),
+            "timeNano": int(now * 1e9),
+        })
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def _set_status(self, container: FakeContainer, status: str,
+                    *actions: str, **attrs: str) -> None:
+        container.status = status
+        container.changed = time.time()
+        self._notify(container)
+        if status not in ("running", "paused"):
+            # Followed logs end when the container stops.
+            for queue in container.log_followers:
+                queue.put_nowait(None)
+            container.log_followers = []
+        for action in actions:
+            self._emit(container, action, **attrs)
+
+    @staticmethod
+    def _notify(container: FakeContainer) -> None:
+        for future in container.changes:
+            if not future.done():
+                future.set_result(None)
+        container.changes = []
+
+    def _make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        routes: List[Tuple[str, str, Handler]] = [
+            ("GET", "/_ping", self._ping),
+            ("GET", "/version", self._version),
+            ("GET", "/events", self._events),
+            ("GET", "/images/json", self._image_list),
+            ("POST", "/images/create", self._image_create),
+            ("POST", "/images/load", self._image_load),
+            ("GET", "/images/get", self._image_get),
+            ("POST", "/build", self._build),
+            ("GET", "/images/{name:.+}/json", self._image_inspect),
+            ("DELETE", "/images/{name:.+}", self._image_delete),
+            ("GET", "/containers/json", self._container_list),
+            ("POST", "/containers/create", self._container_create),
+            ("GET", "/containers/{id}/json", self._container_inspect),
+            ("GET", "/containers/{id}/logs", self._container_logs),
+            ("GET", "/containers/{id}/stats", self._container_stats),
+            ("PUT", "/containers/{id}/archive", self._archive_put),
+            ("GET", "/containers/{id}/archive", self._archive_get),
+            ("DELETE", "/containers/{id}", self._container_delete),
+            ("POST", "/containers/{id}/start", self._container_start),
+            ("POST", "/containers/{id}/stop", self._container_stop),
+            ("POST", "/containers/{id}/restart", self._container_restart),
+            ("POST", "/containers/{id}/pause", self._container_pause),
+            ("POST", "/containers/{id}/unpause", self._container_unpause),
+            ("POST", "/containers/{id}/kill", self._container_kill),
+            ("POST", "/containers/{id}/wait", self._container_wait),
+            ("POST", "/containers/{id}/attach", self._container_attach),
+            ("GET", "/containers/{id}/attach/ws", self._container_attach_ws),
+            ("POST", "/containers/{id}/exec", self._exec_create),
+            ("POST", "/exec/{id}/start", self._exec_start),
+            ("GET", "/exec/{id}/json", self._exec_inspect),
+        ]
+        for method, path, handler in routes:
+            # Every endpoint is also served with an API version prefix.
+            app.router.add_route(method, path, handler)
+            app.router.add_route(method, "/v{version}" + path, handler)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request,
+                          handler: Handler) -> web.StreamResponse:
+        self.requests += 1
+        version = request.match_info.get("version")
+        if (version is not None and
+                parse_version(version) > parse_version(self.api_version)):
+            return _error(400, "client version %s is too new. Maximum "
+                          "supported API version is %s" % (
+                              version, self.api_version))
+        if self.capacity:
+            self.queued += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self.queued -= 1
+            try:
+                await asyncio.sleep(self.latency *
+                                    (1 + self.queued / self.capacity))
+            finally:
+                self._slots.release()
+        elif self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    def _find(self, ref: str) -> Optional[FakeContainer]:
+        # Like Docker, a full ID before a name before an ID prefix.
+        container = self.containers.get(ref)
+        if container is None:
+            for c in self.containers.values():
+                if c.name == ref:
+                    return c
+            for c in self.containers.values():
+                if c.id.startswith(ref):
+                    return c
+        return container
+
+    def _container(self, request: web.Request) -> FakeContainer:
+        ref = request.match_info["id"]
+        container = self._find(ref)
+        if container is None:
+            raise web.HTTPNotFound(
+                text=json.dumps({"message": "No such container: %s" % ref}),
+                content_type="application/json")
+        return container
+
+    def _output(self, cmd: List[str]) -> bytes:
+        if cmd and cmd[0] == "echo":
+            return (" ".join(cmd[1:]) + "\n").encode()
+        elif cmd and cmd[0] == "true":
+            return b""
+        return b"x" * self.payload_size
+
+    async def _write_output(self, request: web.Request, output: bytes,
+                            tty: bool) -> web.StreamResponse:
+        resp = web.StreamResponse(
+            headers={"Content-Type": "application/vnd.docker.raw-stream"})
+        await resp.prepare(request)
+        for i in range(0, len(output), _FRAME_SIZE):
+            chunk = output[i:i + _FRAME_SIZE]
+            if not tty:
+                chunk = _FRAME_HEADER.pack(1, len(chunk)) + chunk
+            await resp.write(chunk)
+        await resp.write_eof()
+        return resp
+
+    async def _ping(self, request: web.Request) -> web.StreamResponse:
+        return web.Response(text="OK",
+                            headers={"API-Version": self.api_version})
+
+    async def _version(self, request: web.Request) -> web.StreamResponse:
+        return web.json_response({
+            "Version": "18.09.0-fake",
+            "ApiVersion": self.api_version,
+            "MinAPIVersion": MIN_API_VERSION,
+            "Os": "linux",
+            "Arch": "amd64"
+        })
+
+    async def _events(self, request: web.Request) -> web.StreamResponse:
+        since = float(request.query.get("since", time.time()))
+        until = request.query.get("until")
+        filters = json.loads(request.query.get("filters", "{}"))
+
+        def match(event: Dict[str, Any]) -> bool:
+            actor = event["Actor"]
+            for key, value in (("type", event["Type"]),
+                               ("event", event["Action"]),
+                               ("container", actor["ID"])):
+                wanted = filters.get(key)
+                if wanted and value not in wanted and not (
+                        key == "container" and
+                        actor["Attributes"]["name"] in wanted):
+                    return False
+            return True
+
+        resp = web.StreamResponse(
+            headers={"Content-Type": "application/json"})
+        await resp.prepare(request)
+        queue: 'asyncio.Queue[Optional[Dict[str, Any]]]' = asyncio.Queue()
+        for event in self.events:
+            if event["timeNano"] / 1e9 >= since:
+                queue.put_nowait(event)
+        if until is None:
+            self._subscribers.append(queue)
+        else:
+            queue.put_nowait(None)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if match(item):
+                    await resp.write(json.dumps(item).encode() + b"\n")
+        finally:
+            if queue in self._subscribers:
+                self._subscribers.remove(queue)
+        await resp.write_eof()
+        return resp
+
+    def _add_image(self, ref: str, image_id: Optional[str] = None,
+                   action: str = "pull",
+                   labels: Optional[Dict[str, str]] = None) -> None:
+        self.images[ref] = {"Id": image_id or "sha256:" + _new_id(),
+                            "RepoTags": [ref], "Created": int(time.time()),
+                            "Size": self.image_size,
+                            "Config": {"Labels": labels or None}}
+        self._emit_image(action, ref, ref)
+
+    async def _build(self, request: web.Request) -> web.StreamResponse:
+        dockerfile = request.query.get("dockerfile", "Dockerfile")
+        tag = request.query.get("t", "")
+        if tag and ":" not in tag.rsplit("/", 1)[-1]:
+            tag += ":latest"
+        labels = json.loads(request.query.get("labels", "{}"))
+        scanner = _TarScanner({dockerfile})
+        async for chunk in request.content.iter_any():
+            scanner.feed(chunk)
+        self.builds += 1
+        self.build_contexts.append(scanner.names)
+
+        resp = web.StreamResponse(
+            headers={"Content-Type": "application/json"})
+        await resp.prepare(request)
+        if dockerfile not in scanner.files:
+            message = "Cannot locate specified Dockerfile: %s" % dockerfile
+            await resp.write(json.dumps({
+                "errorDetail": {"message": message},
+                "error": message}).encode() + b"\r\n")
+        else:
+            steps = [line for line in scanner.files[dockerfile].decode(
+                errors="replace").splitlines()
+                if line.strip() and not line.startswith("#")]
+            for i, step in enumerate(steps):
+                line = "Step %d/%d : %s\n" % (i + 1, len(steps), step)
+                await resp.write(json.dumps({"stream": line}).encode() +
+                                 b"\r\n")
+            image_id = "sha256:" + _new_id()
+            messages: List[Dict[str, Any]] = [
+                {"aux": {"ID": image_id}},
+                {"stream": "Successfully built %s\n" % image_id[7:19]}]
+            if tag:
+                self._add_image(tag, image_id, action="tag", labels=labels)
+                messages.append({"stream": "Successfully tagged %s\n" % tag})
+            for msg in messages:
+                await resp.write(json.dumps(msg).encode() + b"\r\n")
+        await resp.write_eof()
+        return resp
+
+    async def _image_create(self, request: web.Request) -> web.StreamResponse:
+        image = request.query.get("fromImage", request.query.get("repo", ""))
+        tag = request.query.get("tag")
+        if tag:
+            ref = "%s:%s" % (image, tag)
+        elif "@" in image or ":" in image.rsplit("/", 1)[-1]:
+            # Tagged in `fromImage`, like "alpine:3.8".
+            ref = image
+            image, _, tag = image.rpartition("@" if "@" in image else ":")
+        else:
+            tag = "latest"
+            ref = "%s:%s" % (image, tag)
+        if request.query.get("fromSrc") == "-":
+            # An import of the request body.
+            size = 0
+            async for chunk in request.content.iter_any():
+                size += len(chunk)
+            if not size:
+                return _error(500, "EOF")
+            self._add_image(ref, action="import")
+            return web.Response(
+                body=json.dumps({"status": self.images[ref]["Id"]}
+                                ).encode() + b"\r\n",
+                content_type="application/json")
+        resp = web.StreamResponse(
+            headers={"Content-Type": "application/json"})
+        await resp.prepare(request)
+        layer = uuid4().hex[:12]
+        await resp.write(json.dumps({
+            "status": "Pulling from library/%s" % image,
+            "id": tag}).encode() + b"\r\n")
+        for i in range(self.pull_messages):
+            await resp.write(json.dumps({
+                "status": "Downloading",
+                "progressDetail": {"current": i + 1,
+                                   "total": self.pull_messages},
+                "id": layer}).encode() + b"\r\n")
+        self._add_image(ref)
+        await resp.write(json.dumps({
+            "status": "Status: Downloaded newer image for %s" % ref}
+            ).encode() + b"\r\n")
+        await resp.write_eof()
+        return resp
+
+    async def _image_delete(self, request: web.Request) -> web.StreamResponse:
+        name = request.match_info["name"]
+        if ":" not in name:
+            name += ":latest"
+        image = self.images.pop(name, None)
+        if image is None:
+            return _error(404, "No such image: %s" % name)
+        self._emit_image("untag", image["Id"], name)
+        self._emit_image("delete", image["Id"], name)
+        return web.json_response([{"Untagged": name},
+                                  {"Deleted": image["Id"]}])
+
+    async def _image_load(self, request: web.Request) -> web.StreamResponse:
+        quiet = _flag(request, "quiet")
+        scanner = _TarScanner({"manifest.json"})
+        resp = web.StreamResponse(
+            headers={"Content-Type": "application/json"})
+        await resp.prepare(request)
+        received = reported = 0
+        async for chunk in request.content.iter_any():
+            scanner.feed(chunk)
+            received += len(chunk)
+            if not quiet and received - reported >= _LOAD_PROGRESS:
+                reported = received
+                await resp.write(json.dumps({
+                    "status": "Loading layer",
+                    "progressDetail": {"current": received}}).encode()
+                    + b"\r\n")
+        if "manifest.json" not in scanner.files:
+            await resp.write(json.dumps({
+                "errorDetail": {"message": "no manifest.json in archive"},
+                "error": "no manifest.json in archive"}).encode() + b"\r\n")
+        else:
+            for entry in json.loads(scanner.files["manifest.json"]):
+                image_id = "sha256:" + entry["Config"].split(".")[0]
+                for ref in entry.get("RepoTags") or ():
+                    self._add_image(ref, image_id, action="load")
+                    await resp.write(json.dumps({
+                        "stream": "Loaded image: %s\n" % ref}).encode()
+                        + b"\r\n")
+        await resp.write_eof()
+        return resp
+
+    async def _image_get(self, request: web.Request) -> web.StreamResponse:
+        names = request.query.getall("names", [])
+        images = []
+        for name in names:
+            image = self._find_image(name)
+            if image is None:
+                return _error(404, "No such image: %s" % name)
+            images.append(image)
+        resp = web.StreamResponse(
+            headers={"Content-Type": "application/x-tar"})
+        await resp.prepare(request)
+        manifest = []
+        zeros = b"\0" * min(self.image_size, 1024 * 1024)
+        for image in images:
+            layer = "%s/layer.tar" % image["Id"][7:]
+            await resp.write(_tar_header(layer, self.image_size))
+            left = self.image_size
+            while left:
+                await resp.write(zeros[:left])
+                left -= min(left, len(zeros))
+            await resp.write(_tar_padding(self.image_size))
+            manifest.append({"Config": "%s.json" % image["Id"][7:],
+                             "RepoTags": image["RepoTags"],
+                             "Layers": [layer]})
+        body = json.dumps(manifest).encode()
+        await resp.write(_tar_header("manifest.json", len(body)) + body +
+                         _tar_padding(len(body)) + b"\0" * 2 * _TAR_BLOCK)
+        await resp.write_eof()
+        return resp
+
+    def _find_image(self, ref: str) -> Optional[Dict[str, Any]]:
+        image = self.images.get(ref if ":" in ref else ref + ":latest")
+        if image is None:
+            for i in self.images.values():
+                if i["Id"].startswith(ref) or i["Id"][7:].startswith(ref):
+                    return i
+        return image
+
+    async def _image_list(self, request: web.Request) -> web.StreamResponse:
+        filters = json.loads(request.query.get("filters", "{}"))
+        references = filters.get("reference") or []
+        return web.json_response([
+            image for ref, image in self.images.items()
+            if not references or ref in references or
+            ref.split(":")[0] in references])
+
+    async def _image_inspect(self, request: web.Request
+                             ) -> web.StreamResponse:
+        name = request.match_info["name"]
+        image = self._find_image(name)
+        if image is None:
+            return _error(404, "No such image: %s" % name)
+        return web.json_response(image)
+
+    async def _container_list(self, request: web.Request
+                              ) -> web.StreamResponse:
+        filters = json.loads(request.query.get("filters", "{}"))
+        if isinstance(filters, dict) and filters.get("status"):
+            # Asking for a status other than running implies all.
+            show_all = True
+        else:
+            show_all = _flag(request, "all")
+        containers = [c for c in self.containers.values()
+                      if (c.status == "running" or show_all) and
+                      _matches(c, filters)]
+        # Newest first, as dockerd lists them.
+        containers.reverse()
+        if "limit" in request.query:
+            containers = containers[:int(request.query["limit"])]
+        return web.json_response([{
+            "Id": c.id,
+            "Names": ["/" + c.name],
+            "Image": _get(c.config, "Image", ""),
+            "Command": " ".join(_get(c.config, "Cmd", []) or []),
+            "Labels": _get(c.config, "Labels", {}) or {},
+            "State": c.status,
+            "Status": c.status_text,
+        } for c in containers])
+
+    async def _container_inspect(self, request: web.Request
+                                 ) -> web.StreamResponse:
+        c = self._container(request)
+        return web.json_response({
+            "Id": c.id,
+            "Name": "/" + c.name,
+            "Image": _get(c.config, "Image", ""),
+            "State": {
+                "Status": c.status,
+                "Running": c.status in ("running", "paused"),
+                "Paused": c.status == "paused",
+                "Restarting": False,
+                "OOMKilled": False,
+                "Dead": False,
+                "ExitCode": c.exit_code,
+            },
+            "Config": c.config,
+        })
+
+    @staticmethod
+    def _log_frame(container: FakeContainer,
+                   entry: Tuple[float, int, bytes],
+                   timestamps: bool) -> bytes:
+        when, stream_id, data = entry
+        if timestamps:
+            stamp = datetime.fromtimestamp(when, timezone.utc)
+            data = stamp.strftime("%Y-%m-%dT%H:%M:%S.%fZ ").encode() + data
+        if container.tty:
+            return data
+        return _FRAME_HEADER.pack(stream_id, len(data)) + data
+
+    async def _container_logs(self, request: web.Request
+                              ) -> web.StreamResponse:
+        container = self._container(request)
+        streams = {i for i, flag in ((1, "stdout"), (2, "stderr"))
+                   if _flag(request, flag)}
+        if not streams:
+            return _error(400, "Bad parameters: you must choose at least one "
+                               "stream")
+        since = float(request.query.get("since", 0))
+        tail = request.query.get("tail", "all")
+        timestamps = _flag(request, "timestamps")
+        entries = [e for e in container.logs
+                   if e[0] >= since and e[1] in streams]
+        if tail != "all":
+            entries = entries[len(entries) - int(tail):] if int(tail) else []
+
+        resp = web.StreamResponse(headers={
+            "Content-Type": "application/vnd.docker.raw-stream"})
+        await resp.prepare(request)
+        queue: 'asyncio.Queue[Optional[bytes]]' = asyncio.Queue()
+        for entry in entries:
+            queue.put_nowait(self._log_frame(container, entry, timestamps))
+        if _flag(request, "follow") and container.status == "running":
+            container.log_followers.append(queue)
+        else:
+            queue.put_nowait(None)
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    break
+                await resp.write(frame)
+        finally:
+            if queue in container.log_followers:
+                container.log_followers.remove(queue)
+        await resp.write_eof()
+        return resp
+
+    @staticmethod
+    def _stats_sample(container: FakeContainer, when: float) -> Dict[str, Any]:
+        # Counters as if the container had used a tenth of one of the host's
+        # two CPUs, and read and written at a steady rate, since it started.
+        up = max(when - container.changed, 0.0)
+        return {
+            "read": datetime.fromtimestamp(when, timezone.utc).strftime(
+                "%Y-%m-%dT%H:%M:%S.%f000Z"),
+            "cpu_stats": {
+                "cpu_usage": {"total_usage": int(up * 1e8)},
+                "system_cpu_usage": int(when * 2e9),
+                "online_cpus": 2,
+            },
+            "memory_stats": {
+                "usage": 20 * 1024 * 1024,
+                "limit": 256 * 1024 * 1024,
+                "stats": {"cache": 4 * 1024 * 1024},
+            },
+            "networks": {"eth0": {"rx_bytes": int(up * 1000),
+                                  "tx_bytes": int(up * 500)}},
+            "blkio_stats": {"io_service_bytes_recursive": [
+                {"major": 8, "minor": 0, "op": "Read",
+                 "value": int(up * 4096)},
+                {"major": 8, "minor": 0, "op": "Write",
+                 "value": int(up * 8192)},
+            ]},
+        }
+
+    async def _container_stats(self, request: web.Request
+                               ) -> web.StreamResponse:
+        container = self._container(request)
+        stream = request.query.get("stream", "1").lower() in ("1", "true")
+        resp = web.StreamResponse(headers={
+            "Content-Type": "application/json"})
+        await resp.prepare(request)
+        prev = self._stats_sample(container, time.time() - self.stats_interval)
+        while True:
+            sample = self._stats_sample(container, time.time())
+            sample["precpu_stats"] = prev["cpu_stats"]
+            sample["preread"] = prev["read"]
+            await resp.write(json.dumps(sample).encode() + b"\n")
+            prev = sample
+            if not stream:
+                break
+            try:
+                await asyncio.wait_for(self._stopping.wait(),
+                                       self.stats_interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            # Like the logs, stats end when the container stops.
+            if container.status != "running":
+                break
+        await resp.write_eof()
+        return resp
+
+    async def _archive_put(self, request: web.Request) -> web.StreamResponse:
+        container = self._container(request)
+        path = request.query.get("path")
+        if not path:
+            return _error(400, "Bad parameter: path cannot be empty")
+        scanner = _TarScanner(None)
+        async for chunk in request.content.iter_any():
+            scanner.feed(chunk)
+        for name, data in scanner.files.items():
+            container.files[os.path.normpath(os.path.join(path, name))] = data
+        return web.Response(status=200)
+
+    async def _archive_get(self, request: web.Request) -> web.StreamResponse:
+        container = self._container(request)
+        path = os.path.normpath(request.query.get("path", "/"))
+        if path in container.files:
+            names = [(os.path.basename(path), path)]
+        else:
+            top = os.path.basename(path)
+            prefix = path.rstrip("/") + "/"
+            names = [(os.path.join(top, p[len(prefix):]), p)
+                     for p in sorted(container.files) if p.startswith(prefix)]
+        if not names:
+            return _error(404, "Could not find the file %s in container %s"
+                          % (path, container.name))
+        resp = web.StreamResponse(
+            headers={"Content-Type": "application/x-tar"})
+        await resp.prepare(request)
+        for arcname, p in names:
+            data = container.files[p]
+            await resp.write(_tar_header(arcname, len(data)) + data +
+                             _tar_padding(len(data)))
+        await resp.write(b"\0" * 2 * _TAR_BLOCK)
+        await resp.write_eof()
+        return resp
+
+    async def _container_create(self, request: web.Request
+                                ) -> web.StreamResponse:
+        config = await request.json()
+        name = request.query.get("name") or uuid4().hex[:12]
+        if any(c.name == name for c in self.containers.values()):
+            return _error(409, "Conflict. The container name \"/%s\" is "
+                               "already in use." % name)
+        container = FakeContainer(name, config)
+        self.containers[container.id] = container
+        self._emit(container, "create")
+        return web.json_response({"Id": container.id, "Warnings": []},
+                                 status=201)
+
+    async def _container_delete(self, request: web.Request
+                                ) -> web.StreamResponse:
+        container = self._container(request)
+        running = container.status in ("running", "paused")
+        if running and not _flag(request, "force"):
+            return _error(409, "You cannot remove a running container %s."
+                          % container.id)
+        if running:
+            container.exit_code = 137
+            self._set_status(container, "exited", "kill", "die",
+                             exitCode="137")
+        del self.containers[container.id]
+        self._notify(container)
+        self._emit(container, "destroy")
+        return web.Response(status=204)
+
+    async def _container_start(self, request: web.Request
+                               ) -> web.StreamResponse:
+        container = self._container(request)
+        if container.status == "running":
+            return web.Response(status=304)
+        if container.status == "paused":
+            return _error(409, "cannot start a paused container, try unpause "
+                          "instead")
+        self._set_status(container, "running", "start")
+        output = self._output(_get(container.config, "Cmd", []) or [])
+        if output:
+            self.write_log(container.id, output)
+        return web.Response(status=204)
+
+    async def _container_stop(self, request: web.Request
+                              ) -> web.StreamResponse:
+        container = self._container(request)
+        if container.status not in ("running", "paused"):
+            return web.Response(status=304)
+        container.exit_code = 0
+        self._set_status(container, "exited", "die", exitCode="0")
+        self._emit(container, "stop")
+        return web.Response(status=204)
+
+    async def _container_restart(self, request: web.Request
+                                 ) -> web.StreamResponse:
+        container = self._container(request)
+        if container.status in ("running", "paused"):
+            container.exit_code = 0
+            self._emit(container, "die", exitCode="0")
+        self._set_status(container, "running", "start", "restart")
+        return web.Response(status=204)
+
+    async def _container_pause(self, request: web.Request
+                               ) -> web.StreamResponse:
+        container = self._container(request)
+        if container.status == "paused":
+            return _error(409, "Container %s is already paused"
+                          % container.id)
+        if container.status != "running":
+            return _error(409, "Container %s is not running" % container.id)
+        self._set_status(container, "paused", "pause")
+        return web.Response(status=204)
+
+    async def _container_unpause(self, request: web.Request
+                                 ) -> web.StreamResponse:
+        container = self._container(request)
+        if container.status != "paused":
+            return _error(409, "Container %s is not paused" % container.id)
+        self._set_status(container, "running", "unpause")
+        return web.Response(status=204)
+
+    async def _container_kill(self, request: web.Request
+                              ) -> web.StreamResponse:
+        container = self._container(request)
+        if container.status not in ("running", "paused"):
+            return _error(409, "Container %s is not running" % container.id)
+        name = request.query.get("signal", "SIGKILL").upper()
+        if not name.isdigit() and not name.startswith("SIG"):
+            name = "SIG" + name
+        try:
+            signum = (int(name) if name.isdigit()
+                      else signal.Signals[name].value)
+        except KeyError:
+            return _error(400, "Invalid signal: %s" % name)
+        self._emit(container, "kill", signal=str(signum))
+        if signum in (signal.SIGKILL, signal.SIGTERM, signal.SIGINT):
+            # The fake's processes don't handle any of these.
+            container.exit_code = 128 + signum
+            self._set_status(container, "exited", "die",
+                             exitCode=str(container.exit_code))
+        return web.Response(status=204)
+
+    async def _container_wait(self, request: web.Request
+                              ) -> web.StreamResponse:
+        container = self._container(request)
+        condition = request.query.get("condition", "not-running")
+        loop = asyncio.get_event_loop()
+        if condition == "next-exit" or (
+                condition == "not-running" and
+                container.status in ("running", "paused")):
+            while True:
+                future: 'asyncio.Future[None]' = loop.create_future()
+                container.changes.append(future)
+                await future
+                if (container.status == "exited" or
+                        container.id not in self.containers):
+                    break
+        elif condition == "removed":
+            while container.id in self.containers:
+                future = loop.create_future()
+                container.changes.append(future)
+                await future
+        elif condition != "not-running":
+            return _error(400, "invalid condition: %s" % condition)
+        return web.json_response({"StatusCode": container.exit_code})
+
+    async def _container_attach(self, request: web.Request
+                                ) -> web.StreamResponse:
+        container = self._container(request)
+        cmd = _get(container.config, "Cmd", []) or []
+        return await self._write_output(request, self._output(cmd),
+                                        container.tty)
+
+    async def _container_attach_ws(self, request: web.Request
+                                   ) -> web.StreamResponse:
+        self._container(request)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            # Behave like a shell that echoes back its input.
+            if msg.type == WSMsgType.TEXT:
+                await ws.send_str(msg.data)
+            elif msg.type == WSMsgType.BINARY:
+                await ws.send_bytes(msg.data)
+        return ws
+
+    async def _exec_create(self, request: web.Request) -> web.StreamResponse:
+        container = self._container(request)
+        if container.status == "paused":
+            return _error(409, "Container %s is paused, unpause the "
+                          "container before exec" % container.id)
+        if container.status != "running":
+            return _error(409, "Container %s is not running" % container.id)
+        config = await request.json()
+        instance = FakeExec(container, config)
+        self.execs[instance.id] = instance
+        return web.json_response({"Id": instance.id}, status=201)
+
+    async def _exec_start(self, request: web.Request) -> web.StreamResponse:
+        instance = self.execs.get(request.match_info["id"])
+        if instance is None:
+            return _error(404, "No such exec instance")
+        opts = await request.json() if request.can_read_body else {}
+        tty = bool(_get(opts, "Tty", False))
+        instance.running = True
+        output = self._output(_get(instance.config, "Cmd", []) or [])
+        if _get(opts, "Detach", False):
+            instance.running = False
+            instance.exit_code = 0
+            return web.Response(status=200)
+        resp = await self._write_output(request, output, tty)
+        instance.running = False
+        instance.exit_code = 0
+        return resp
+
+    async def _exec_inspect(self, request: web.Request) -> web.StreamResponse:
+        instance = self.execs.get(request.match_info["id"])
+        if instance is None:
+            return _error(404, "No such exec instance")
+        return web.json_response({
+            "ID": instance.id,
+            "ContainerID": instance.container.id,
+            "Running": instance.running,
+            "ExitCode": instance.exit_code,
+            "OpenStdin": bool(_get(instance.config, "AttachStdin", False)),
+            "ProcessConfig": {
+                "tty": bool(_get(instance.config, "Tty", False)),
+                "entrypoint": (_get(instance.config, "Cmd", []) or [""])[0],
+                "arguments": (_get(instance.config, "Cmd", []) or [])[1:],
+            },
+        })
+
+    def _hijack(self, transport: asyncio.Transport, exec_id: str,
+                opts: Dict[str, Any], stdin: asyncio.StreamReader) -> None:
+        task = asyncio.ensure_future(
+            self._run_hijacked(transport, exec_id, opts, stdin))
+        self._hijacked.add(task)
+        task.add_done_callback(self._hijacked.discard)
+
+    async def _run_hijacked(self, transport: asyncio.Transport, exec_id: str,
+                            opts: Dict[str, Any],
+                            stdin: asyncio.StreamReader) -> None:
+        """
+        Runs an exec instance over a hijacked connection. `cat` copies stdin
+        to stdout until stdin is closed and `ufaas-session-echo` is an exec
+        session worker, see `_session_echo`. Other commands behave as they do
+        for an ordinary exec start.
+        """
+        self.requests += 1
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            instance = self.execs.get(exec_id)
+            if instance is None:
+                body = json.dumps({"message": "No such exec instance"})
+                transport.write((
+                    "HTTP/1.1 404 Not Found\r\n"
+                    "Content-Type: application/json\r\n"
+                    "Content-Length: %d\r\n\r\n%s" % (len(body), body)
+                    ).encode())
+                return
+            tty = bool(_get(opts, "Tty", False))
+            transport.write(b"HTTP/1.1 101 UPGRADED\r\n"
+                            b"Content-Type: application/vnd.docker.raw-stream"
+                            b"\r\nConnection: Upgrade\r\n"
+                            b"Upgrade: tcp\r\n\r\n")
+
+            def write(data: bytes) -> None:
+                for i in range(0, len(data), _FRAME_SIZE):
+                    chunk = data[i:i + _FRAME_SIZE]
+                    if not tty:
+                        chunk = _FRAME_HEADER.pack(1, len(chunk)) + chunk
+                    transport.write(chunk)
+
+            instance.running = True
+            cmd = _get(instance.config, "Cmd", []) or []
+            if cmd and cmd[0] == "cat":
+                while True:
+                    data = await stdin.read(_FRAME_SIZE)
+                    if not data:
+                        break
+                    write(data)
+            elif cmd and cmd[0] == "ufaas-session-echo":
+
+                async def write_async(data: bytes) -> None:
+                    write(data)
+
+                await serve(stdin, write_async, _session_echo)
+            else:
+                write(self._output(cmd))
+            instance.running = False
+            instance.exit_code = 0
+        finally:
+            transport.close()
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    engine = FakeDockerEngine(args.path, latency=args.latency,
+                              payload_size=args.payload_size,
+                              pull_messages=args.pull_messages,
+                              stats_interval=args.stats_interval,
+                              image_size=args.image_size,
+                              capacity=args.capacity, port=args.port,
+                              api_version=args.api_version)
+    await engine.start()
+    if engine.port is not None:
+        sys.stdout.write("tcp://127.0.0.1:%d\n" % engine.port)
+    else:
+        sys.stdout.write("%s\n" % engine.path)
+    sys.stdout.flush()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await engine.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--path", help="Unix socket to listen on.")
+    parser.add_argument("--port", type=int,
+                        help="TCP port to listen on instead, 0 for any.")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--payload-size", type=int, default=0)
+    parser.add_argument("--pull-messages", type=int, default=10)
+    parser.add_argument("--stats-interval", type=float, default=1.0)
+    parser.add_argument("--image-size", type=int, default=1024 * 1024)
+    parser.add_argument("--capacity", type=int)
+    parser.add_argument("--api-version", default=API_VERSION)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,44 @@
+import asyncio
+import json
 from abc import ABC
-from typing import Optional, TYPE_CHECKING
+from typing import (AsyncIterator, Dict, Hashable, List, Optional,
+                    TYPE_CHECKING)
+from urllib.parse import urlencode
 
-from ufaas_dockerapi.types import DockerJSONResponse
-from ufaas_dockerapi.utils import (api_delete, api_post, convert_bool,
-                                   strip_nulls)
+from ufaas_dockerapi.cache import TTLCache
+from ufaas_dockerapi.exceptions import DockerAPIException
+from ufaas_dockerapi.types import DockerJSONResponse, JsonDict
+from ufaas_dockerapi.utils import (STREAM_TIMEOUT, api_delete, api_get,
+                                   api_open, api_post, api_stream,
+                                   convert_bool, read_file, strip_nulls,
+                                   write_file)
 
 if TYPE_CHECKING:
+    from ufaas_dockerapi.archive import DigestCache
     from ufaas_dockerapi.client import DockerClient
 
 
+# Label holding the hash of the build context an image was built from.
+CONTEXT_HASH_LABEL = "ufaas.context-hash"
+
+
+def _tagged(image: str) -> bool:
+    # A registry's port is before the last slash, a tag after it.
+    return "@" in image or ":" in image.rsplit("/", 1)[-1]
+
+
+def reference(image: str, tag: Optional[str] = None) -> str:
+    """
+    The full reference of an image, with the "latest" tag Docker assumes if
+    neither a tag nor a digest is given.
+    """
+    if tag:
+        return "%s:%s" % (image, tag)
+    if _tagged(image):
+        return image
+    return "%s:latest" % image
+
+
 class ImageAPIBase(ABC):
     """
     Base Class for Image API versions.
@@ -24,7 +54,158 @@ class ImageAPI(ImageAPIBase):
     """
     def __init__(self, client: 'DockerClient') -> None:
         super().__init__(client)
-        self._baseuri = "http://1.25/images"
+        self._baseuri = "%s/images" % client._base_url
+        self._builduri = "%s/build" % client._base_url
+        self._cache: Optional[TTLCache[Hashable, DockerJSONResponse]] = None
+        if client._cache_ttl is not None:
+            self._cache = TTLCache(client._cache_ttl)
+        self._ensuring: Dict[str, 'asyncio.Future[bool]'] = {}
+        # Digests of build context files, so unchanged files aren't hashed
+        # again by every build.
+        self._digests: 'DigestCache' = {}
+        # Counters of `ensure` calls: satisfied by an image that was already
+        # present, that had to pull it, and that joined another's pull.
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def cache(self) -> Optional[TTLCache[Hashable, DockerJSONResponse]]:
+        return self._cache
+
+    def invalidate(self, image: Optional[str] = None) -> None:
+        """
+        Drop cached responses that may be out of date after a change to
+        `image`, given by reference or ID: its inspect responses and every
+        list. If `image` is None the whole cache is dropped.
+
+        Changes made through this API are invalidated automatically, a
+        started `StateCache` does the same for changes seen in Docker's
+        events.
+        """
+        cache = self._cache
+        if cache is None:
+            return
+        if image is None:
+            cache.invalidate()
+            return
+        ref = reference(image)
+
+        def stale(key: Hashable,
+                  value: Optional[DockerJSONResponse]) -> bool:
+            if not isinstance(key, tuple) or key[0] == "list":
+                return True
+            if value is None:
+                return key[1] in (image, ref)
+            res = value[1]
+            return key[1] in (image, ref) or (
+                isinstance(res, dict) and
+                (res.get("Id", "").startswith(image) or
+                 ref in (res.get("RepoTags") or ())))
+
+        cache.invalidate_where(stale)
+
+    async def list(self, filters: Optional[Dict[str, List[str]]] = None,
+                   all: bool = False, digests: bool = False,
+                   use_cache: bool = True) -> DockerJSONResponse:
+        """
+        List images, without intermediate images unless `all` is True.
+        `filters` are applied by Docker, for example
+        `{"reference": ["alpine"]}`.
+
+        The response is cached if the client has a cache, unless `use_cache`
+        is False.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ImageList`
+        """
+        d = convert_bool(strip_nulls({
+            "all": all or None,
+            "digests": digests or None,
+            "filters": json.dumps(filters, sort_keys=True) if filters else None
+            }))
+        uri = "%s/json" % self._baseuri
+
+        async def fetch() -> DockerJSONResponse:
+            return await api_get(self._client, uri, params=d)
+
+        if self._cache is None or not use_cache:
+            return await fetch()
+        return await self._cache.get(("list", tuple(sorted(d.items()))),
+                                     fetch)
+
+    async def inspect(self, image: str,
+                      use_cache: bool = True) -> DockerJSONResponse:
+        """
+        Low-level information about an image, by reference or ID. The
+        response is cached if the client has a cache, unless `use_cache` is
+        False.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ImageInspect`
+        """
+        uri = "%s/%s/json" % (self._baseuri, image)
+
+        async def fetch() -> DockerJSONResponse:
+            return await api_get(self._client, uri)
+
+        if self._cache is None or not use_cache:
+            return await fetch()
+        return await self._cache.get(("inspect", reference(image)), fetch)
+
+    async def ensure(self, image: str, tag: Optional[str] = None,
+                     platform: str = "") -> bool:
+        """
+        Make sure an image is present, pulling it if it isn't. Returns True
+        if it was pulled. `tag` is only used if `image` has neither a tag nor
+        a digest, and defaults to "latest".
+
+        Concurrent calls for the same image share one check and one pull,
+        every caller gets its result or exception. With a client cache the
+        check is usually answered from the cache.
+        """
+        if _tagged(image):
+            tag = None
+        else:
+            tag = tag or "latest"
+        ref = reference(image, tag)
+        future = self._ensuring.get(ref)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(
+                self._ensure(ref, image, tag, platform))
+            self._ensuring[ref] = future
+
+            def done(f: 'asyncio.Future[bool]') -> None:
+                if self._ensuring.get(ref) is f:
+                    del self._ensuring[ref]
+                # Retrieve the exception in case every caller was cancelled.
+                if not f.cancelled():
+                    f.exception()
+
+            future.add_done_callback(done)
+        # Shielded so that a cancelled caller doesn't cancel the pull for
+        # everybody else waiting on it.
+        return await asyncio.shield(future)
+
+    async def _ensure(self, ref: str, image: str, tag: Optional[str],
+                      platform: str) -> bool:
+        try:
+            await self.inspect(ref)
+            self.hits += 1
+            return False
+        except DockerAPIException as e:
+            if e.http_status != 404:
+                raise
+        self.misses += 1
+        error: Optional[JsonDict] = None
+        async for msg in self.pull_stream(image, tag=tag, platform=platform):
+            # Failures part way through a pull are reported in the stream,
+            # after a 200 status, which then ends.
+            if "error" in msg and error is None:
+                error = msg
+        if error is not None:
+            raise DockerAPIException(500, error)
+        return True
 
     async def pull(self, img_name: str, repo_uri: Optional[str] = None,
                    tag: Optional[str] = None,
@@ -38,31 +219,168 @@ class ImageAPI(ImageAPIBase):
         d = strip_nulls({"fromImage": img_name, "fromSrc": repo_uri,
                          "tag": tag, "platform": platform})
 
-        return await api_post(self._client,
-                              "%s/create" % self._baseuri, params=d,
-                              streaming=True)
+        try:
+            return await api_post(self._client,
+                                  "%s/create" % self._baseuri, params=d,
+                                  streaming=True)
+        finally:
+            self.invalidate(reference(img_name, tag))
+
+    async def pull_stream(self, img_name: str,
+                          repo_uri: Optional[str] = None,
+                          tag: Optional[str] = None,
+                          platform: str = "") -> AsyncIterator[JsonDict]:
+        """
+        Same as `pull` but yields each progress message as it arrives instead
+        of returning them all once the pull has finished.
+        """
+        d = strip_nulls({"fromImage": img_name, "fromSrc": repo_uri,
+                         "tag": tag, "platform": platform})
+
+        try:
+            async for msg in api_stream(self._client, "POST",
+                                        "%s/create" % self._baseuri,
+                                        params=d):
+                yield msg
+        finally:
+            self.invalidate(reference(img_name, tag))
 
     async def import_source(self, image_uri: str, repo_identifier: str,
                             tag: Optional[str] = None,
                             platform: str = "") -> DockerJSONResponse:
         """
-        Create an image by pulling it from a URI or from a file.
+        Create an image from a root filesystem tarball, named
+        `repo_identifier:tag`. `image_uri` is either a URL for Docker to
+        fetch it from or the path of a local file, which is streamed to
+        Docker in chunks rather than read into memory. "-", which Docker
+        takes as the request body, raises ValueError as the body is always
+        the file: pass its path instead.
         Calls `https://docs.docker.com/engine/api/v1.39/#operation/ImageCreate`
-        but provides a simple API for the most common use-case which is simply
-        pulling from a Docker repository.
-        TODO: Create method to create image given a file.
         """
-        if image_uri != "-":
-            raise Exception("Supplying image as request body not supported by \
-                import_source().")
-
-        d = strip_nulls({"repo_identifier": repo_identifier,
-                         "fromSrc": image_uri, "tag": tag,
+        if image_uri == "-":
+            raise ValueError("import_source() needs the path or URL of the "
+                             "tarball, not \"-\".")
+        local = "://" not in image_uri
+        d = strip_nulls({"repo": repo_identifier,
+                         "fromSrc": "-" if local else image_uri, "tag": tag,
                          "platform": platform})
 
-        return await api_post(self._client,
-                              "%s/create" % self._baseuri, params=d,
-                              streaming=True)
+        try:
+            messages = [msg async for msg in api_stream(
+                self._client, "POST", "%s/create" % self._baseuri, params=d,
+                timeout=STREAM_TIMEOUT,
+                data=read_file(image_uri) if local else None,
+                content_type="application/x-tar")]
+            return (200, messages)
+        finally:
+            self.invalidate(reference(repo_identifier, tag))
+
+    async def load(self, path: str,
+                   quiet: bool = False) -> AsyncIterator[JsonDict]:
+        """
+        Load images from a tarball made by `save` or `docker save`, streaming
+        the file to Docker in chunks rather than reading it into memory.
+        Yields each progress message as it arrives, a `{"stream": "Loaded
+        image: ..."}` message for each image loaded.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ImageLoad`
+        """
+        d = convert_bool({"quiet": quiet})
+        try:
+            async for msg in api_stream(
+                    self._client, "POST", "%s/load" % self._baseuri,
+                    params=d, timeout=STREAM_TIMEOUT, data=read_file(path),
+                    content_type="application/x-tar"):
+                yield msg
+        finally:
+            # Which images are replaced isn't known until the end.
+            self.invalidate()
+
+    async def save(self, names: List[str], dest: str) -> int:
+        """
+        Export images, with their layers and tags, to a tarball at `dest`
+        which `load` accepts. The archive is written to disk as it arrives.
+        Returns its size in bytes.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ImageGetAll`
+        """
+        uri = "%s/get?%s" % (self._baseuri,
+                             urlencode({"names": names}, doseq=True))
+        resp = await api_open(self._client, "GET", uri,
+                              timeout=STREAM_TIMEOUT)
+        try:
+            return await write_file(resp, dest)
+        finally:
+            resp.release()
+
+    async def build(self, context_dir: str, tag: str,
+                    dockerfile: str = "Dockerfile",
+                    buildargs: Optional[Dict[str, str]] = None,
+                    labels: Optional[Dict[str, str]] = None,
+                    nocache: bool = False,
+                    force: bool = False) -> AsyncIterator[JsonDict]:
+        """
+        Build an image tagged `tag`, such as "fn:1" or "fn" for "fn:latest",
+        from a directory and yield the build's output messages as they
+        arrive. `dockerfile` is relative to `context_dir`, and files
+        excluded by its .dockerignore aren't sent. The build context is
+        streamed to Docker as a tar archive generated from the files as it
+        is sent.
+
+        A hash of the context, Dockerfile, build arguments and labels is
+        stored in the image's `CONTEXT_HASH_LABEL` label. If the image tagged
+        `tag` already has the same hash the build is skipped, unless `force`
+        is True, and only an `{"aux": {"ID": ...}}` message with its ID and a
+        `{"stream": ...}` message saying so are yielded, as a build would.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/ImageBuild`
+        """
+        from ufaas_dockerapi.archive import (context_hash, scan_context,
+                                             tar_stream)
+        loop = asyncio.get_event_loop()
+        entries = await loop.run_in_executor(None, scan_context, context_dir,
+                                             dockerfile)
+        extra = json.dumps({"dockerfile": dockerfile,
+                            "buildargs": buildargs or {},
+                            "labels": labels or {}}, sort_keys=True)
+        if len(self._digests) > 100000:
+            self._digests.clear()
+        digest = await loop.run_in_executor(None, context_hash, entries,
+                                            extra.encode(), self._digests)
+
+        if not force:
+            try:
+                _, image = await self.inspect(tag)
+            except DockerAPIException as e:
+                if e.http_status != 404:
+                    raise
+            else:
+                assert isinstance(image, dict)
+                config = image.get("Config") or {}
+                if (config.get("Labels") or {}).get(
+                        CONTEXT_HASH_LABEL) == digest:
+                    yield {"aux": {"ID": image["Id"]}}
+                    yield {"stream": "Build context unchanged, using %s\n"
+                                     % reference(tag)}
+                    return
+
+        d = convert_bool(strip_nulls({
+            "t": tag,
+            "dockerfile": dockerfile,
+            "buildargs": json.dumps(buildargs) if buildargs else None,
+            "labels": json.dumps(dict(labels or {},
+                                      **{CONTEXT_HASH_LABEL: digest})),
+            "nocache": nocache,
+            "rm": True
+            }))
+        try:
+            async for msg in api_stream(
+                    self._client, "POST", self._builduri, params=d,
+                    timeout=STREAM_TIMEOUT, data=tar_stream(entries),
+                    content_type="application/x-tar"):
+                yield msg
+        finally:
+            self.invalidate(tag)
 
     async def remove(self, image: str, force: bool = False,
                      noprune: bool = False) -> DockerJSONResponse:
@@ -74,6 +392,9 @@ class ImageAPI(ImageAPIBase):
         """
         d = convert_bool({"force": force, "noprune": noprune})
 
-        return await api_delete(self._client,
-                                "%s/%s" % (self._baseuri, image),
-                                params=d, streaming=True)
+        try:
+            return await api_delete(self._client,
+                                    "%s/%s" % (self._baseuri, image),
+                                    params=d, streaming=True)
+        finally:
+            self.invalidate(image)
@@ -0,0 +1,271 @@
+"""
+Client-side protection against overloading dockerd: an adaptive limit on the
+requests in flight per class of endpoint, jittered retries of idempotent
+requests, and deadlines for calls.
+
+    client = DockerClient(transport, limits=ConcurrencyLimits(),
+                          retry=RetryPolicy())
+    with deadline(2.0):
+        await client.container.inspect("fn")
+
+These apply to the requests made with `utils.api_call`, not to streams such
+as pulls, logs and attaches which can legitimately run for any time.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterator, Optional
+from urllib.parse import urlsplit
+
+from ufaas_dockerapi.metrics import endpoint_template
+
+# HTTP statuses which mean dockerd, or a proxy in front of it, is overloaded.
+OVERLOAD_STATUSES = frozenset((429, 502, 503, 504))
+# Methods which are safe to retry without the caller saying so.
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD"))
+
+# Seconds the slowest acceptable request of each class of endpoint takes.
+DEFAULT_LATENCY_TARGETS = {
+    "read": 0.25,
+    "lifecycle": 1.0,
+    "exec": 0.5,
+    "image": 5.0,
+}
+
+# Weights of each request's latency in a limiter's moving averages: the
+# recent latency follows a change in a few requests, the baseline in a few
+# hundred.
+RECENT_SMOOTHING = 0.2
+BASELINE_SMOOTHING = 0.01
+
+# Endpoints whose requests wait for a container's grace period or exit, or
+# move whole images, so take as long as they take however loaded dockerd is.
+_UNTIMED_ENDPOINTS = ("/stop", "/restart", "/wait", "/images/create",
+                      "/images/load", "/push", "/build")
+
+# The monotonic time by which the current call must have finished.
+_deadline: ContextVar[Optional[float]] = ContextVar("ufaas_deadline",
+                                                    default=None)
+
+
+def endpoint_class(method: str, uri: str) -> str:
+    """
+    The class of endpoint a request is limited as: "exec" for creating and
+    starting execs, "image" for images and builds, "lifecycle" for changes
+    to containers and "read" for the rest, such as inspects and lists.
+    """
+    path = endpoint_template(urlsplit(uri).path)
+    if path.startswith("/exec/") or path.endswith("/exec"):
+        return "exec"
+    if path.startswith("/images/") or path == "/build":
+        return "image"
+    if path.startswith("/containers/") and method.upper() != "GET":
+        return "lifecycle"
+    return "read"
+
+
+def latency_signal(method: str, uri: str) -> bool:
+    """
+    Whether a request's latency says how loaded dockerd is. Stops and
+    restarts wait for the container's grace period, 10 seconds by default,
+    and pulls, pushes, loads and builds take as long as the image does, so
+    they are left out. They aren't held to a `RetryPolicy.attempt_timeout`
+    either.
+    """
+    path = endpoint_template(urlsplit(uri).path)
+    return not path.endswith(_UNTIMED_ENDPOINTS)
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """
+    Calls made within the block raise `asyncio.TimeoutError` if they haven't
+    finished `seconds` from now, including any time spent waiting for a
+    limiter or between retries. A nested deadline can only shorten the one
+    it's in.
+    """
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(at, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(timeout: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds left for a call: the least of `timeout` and the time until the
+    current `deadline`, or None if neither is set.
+    """
+    at = _deadline.get()
+    if at is None:
+        return timeout
+    left = max(at - time.monotonic(), 0.0)
+    return left if timeout is None else min(left, timeout)
+
+
+class AIMDLimiter:
+    """
+    Limits the requests in flight, others waiting their turn in order. The
+    limit adapts to how dockerd copes: it grows by one for every `limit`
+    requests that finish in time, and is multiplied by `backoff` when one is
+    late, times out or is refused as overloaded. A request is late if it
+    took longer than `latency_target` seconds, or if the moving average of
+    recent latencies has grown to more than `tolerance` times the long-run
+    baseline average. That gradient is how dockerd shows it's queueing well
+    before any fixed target is reached, while the averaging keeps the
+    ordinary jitter of single requests from counting.
+
+    Requests which started before the last decrease don't decrease it again,
+    so a burst of slow responses only counts once.
+    """
+    def __init__(self, initial: int = 8, min_limit: int = 1,
+                 max_limit: int = 256, latency_target: float = 0.5,
+                 backoff: float = 0.7, tolerance: float = 2.0) -> None:
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError("Limits must satisfy "
+                             "1 <= min_limit <= initial <= max_limit.")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self._limit = float(initial)
+        self._waiters: Deque['asyncio.Future[float]'] = deque()
+        self._last_decrease = 0.0
+        self._recent: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self.inflight = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> float:
+        """
+        Wait for a slot, returning the time it was given which should be
+        passed to `release`.
+        """
+        if self.inflight < self.limit and not self._waiters:
+            self.inflight += 1
+            return time.monotonic()
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Given a slot just as it was cancelled, so pass it on.
+                self.inflight -= 1
+                self._wake()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    @property
+    def baseline(self) -> Optional[float]:
+        """
+        The long-run average latency, None until a request has finished.
+        """
+        return self._baseline
+
+    def release(self, started: float, overloaded: bool = False,
+                timed: bool = True) -> None:
+        """
+        Give back a slot taken at `started`, adapting the limit to how long
+        the request took or to it having been `overloaded`. The latency of a
+        request that isn't `timed`, see `latency_signal`, is ignored.
+        """
+        now = time.monotonic()
+        latency = now - started
+        self.inflight -= 1
+        if not timed and not overloaded:
+            self._wake()
+            return
+        late = False
+        if timed:
+            if self._recent is None or self._baseline is None:
+                self._recent = self._baseline = latency
+            else:
+                self._recent += RECENT_SMOOTHING * (latency - self._recent)
+                # The baseline follows dockerd getting slower for good,
+                # rather than holding the limit down.
+                self._baseline += BASELINE_SMOOTHING * (
+                    latency - self._baseline)
+            late = (latency > self.latency_target or
+                    self._recent > self.tolerance * self._baseline)
+        if overloaded or late:
+            if started >= self._last_decrease:
+                self._limit = max(self._limit * self.backoff,
+                                  float(self.min_limit))
+                self._last_decrease = now
+                self.decreases += 1
+        else:
+            self._limit = min(self._limit + 1 / self._limit,
+                              float(self.max_limit))
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(time.monotonic())
+
+
+class ConcurrencyLimits:
+    """
+    An `AIMDLimiter` for each class of endpoint, see `endpoint_class`, so
+    that slow container starts don't hold up inspects. Limiters can be given
+    in `limiters`, the rest are made as needed with `latency_targets` or
+    `DEFAULT_LATENCY_TARGETS`.
+    """
+    def __init__(self, limiters: Optional[Dict[str, AIMDLimiter]] = None,
+                 latency_targets: Optional[Dict[str, float]] = None) -> None:
+        self.limiters: Dict[str, AIMDLimiter] = dict(limiters or {})
+        self.latency_targets = dict(DEFAULT_LATENCY_TARGETS)
+        self.latency_targets.update(latency_targets or {})
+
+    def get(self, method: str, uri: str) -> AIMDLimiter:
+        cls = endpoint_class(method, uri)
+        limiter = self.limiters.get(cls)
+        if limiter is None:
+            limiter = AIMDLimiter(
+                latency_target=self.latency_targets.get(cls, 0.5))
+            self.limiters[cls] = limiter
+        return limiter
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How idempotent requests are retried when dockerd can't be reached, is
+    overloaded or doesn't answer within `attempt_timeout` seconds, which
+    doesn't apply to requests that aren't a `latency_signal`. Up to
+    `attempts` are made, waiting a random time of up to `base_delay` doubled
+    for each attempt so far, at most `max_delay`, so that clients which
+    failed together don't retry together.
+    """
+    attempts: int = 3
+    base_delay: float = 0.05
+    max_delay: float = 2.0
+    attempt_timeout: Optional[float] = None
+
+    def delay(self, attempt: int) -> float:
+        """
+        Seconds to wait before retrying after failed attempt `attempt`,
+        counting from 1.
+        """
+        return random.uniform(0, min(self.max_delay,
+                                     self.base_delay * 2 ** (attempt - 1)))
@@ -0,0 +1,114 @@
+"""
+Follows the logs of many containers at once, keeping only the most recent
+output of each in a bounded `RingBuffer`, so that what a failed invocation
+printed is at hand without holding on to whole logs.
+
+    collector = LogCollector(client, max_bytes=64 * 1024)
+    collector.follow("fn-1")
+    ...
+    print(collector.buffer("fn-1").getvalue())
+"""
+
+import asyncio
+import time
+from types import TracebackType
+from typing import Dict, Optional, TYPE_CHECKING, Type, cast
+
+from aiohttp import ClientError
+
+from ufaas_dockerapi.exceptions import (DockerAPIException,
+                                        DockerStreamException)
+from ufaas_dockerapi.streams import RingBuffer
+
+if TYPE_CHECKING:
+    from ufaas_dockerapi.client import DockerClient
+    from ufaas_dockerapi.container import ContainerAPI
+
+
+class LogCollector:
+    """
+    Keeps the last `max_bytes` of output of every container it follows.
+    Memory use is bounded by `max_bytes` per container plus one read buffer
+    per followed stream, however much the containers print.
+
+    A container's buffer is kept after it stops, until `discard` is called.
+    """
+    def __init__(self, client: 'DockerClient', max_bytes: int = 64 * 1024,
+                 tty: bool = False) -> None:
+        self._client = client
+        self._max_bytes = max_bytes
+        self._tty = tty
+        self._buffers: Dict[str, RingBuffer] = {}
+        self._tasks: Dict[str, 'asyncio.Task[None]'] = {}
+        self.errors: Dict[str, Exception] = {}
+
+    async def __aenter__(self) -> 'LogCollector':
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> None:
+        await self.close()
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def following(self, container: str) -> bool:
+        task = self._tasks.get(container)
+        return task is not None and not task.done()
+
+    def buffer(self, container: str) -> Optional[RingBuffer]:
+        return self._buffers.get(container)
+
+    def follow(self, container: str, since: Optional[float] = None,
+               tail: Optional[int] = None) -> RingBuffer:
+        """
+        Start following a container's logs, from `since` or the last `tail`
+        lines if given, otherwise from now. Returns the container's buffer.
+        """
+        buffer = self._buffers.get(container)
+        if buffer is None:
+            buffer = self._buffers[container] = RingBuffer(self._max_bytes)
+        if not self.following(container):
+            if since is None and tail is None:
+                since = time.time()
+            self._tasks[container] = asyncio.ensure_future(
+                self._follow(container, buffer, since, tail))
+        return buffer
+
+    async def unfollow(self, container: str) -> None:
+        """
+        Stop following a container, keeping its buffer.
+        """
+        task = self._tasks.pop(container, None)
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def discard(self, container: str) -> None:
+        """
+        Stop following a container and drop its buffer.
+        """
+        await self.unfollow(container)
+        self._buffers.pop(container, None)
+        self.errors.pop(container, None)
+
+    async def close(self) -> None:
+        for container in list(self._tasks):
+            await self.unfollow(container)
+
+    async def _follow(self, container: str, buffer: RingBuffer,
+                      since: Optional[float], tail: Optional[int]) -> None:
+        api = cast('ContainerAPI', self._client.container)
+        try:
+            stream = await api.logs(container, follow=True, since=since,
+                                    tail=tail, tty=self._tty, buffer=buffer)
+            async with stream:
+                async for _ in stream:
+                    pass
+        except (ClientError, DockerAPIException,
+                DockerStreamException) as e:
+            self.errors[container] = e
@@ -0,0 +1,289 @@
+"""
+Per-request instrumentation of the Docker API calls made by a client.
+
+Give a `DockerClient` a `MetricsSink` and every request is timed using
+aiohttp's `TraceConfig` events, then reported to the sink as a
+`RequestMetrics`. Clients without a sink don't install any trace hooks so pay
+nothing for this.
+"""
+
+import re
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from aiohttp import (ClientSession, TraceConfig,
+                     TraceConnectionQueuedEndParams,
+                     TraceConnectionQueuedStartParams,
+                     TraceRequestChunkSentParams, TraceRequestEndParams,
+                     TraceResponseChunkReceivedParams)
+
+_VERSION_PREFIX = re.compile(r"^/v[0-9]+\.[0-9]+")
+
+# Resources whose second path segment is an ID or name, unless it is one of
+# the collection level actions below.
+_ID_RESOURCES = frozenset(("containers", "exec", "networks", "volumes",
+                           "plugins", "secrets", "configs", "services",
+                           "tasks", "nodes"))
+_COLLECTION_ACTIONS = frozenset(("create", "json", "prune", "load", "get",
+                                 "search"))
+# Image names may contain slashes, so the action is found from the end.
+_IMAGE_ACTIONS = frozenset(("json", "history", "push", "tag"))
+
+
+def endpoint_template(path: str) -> str:
+    """
+    Replace the IDs and names in an API path with placeholders so that
+    requests for different containers are grouped together, for example
+    "/v1.25/containers/3f4e/start" becomes "/containers/{id}/start".
+    """
+    path = _VERSION_PREFIX.sub("", path)
+    parts = path.strip("/").split("/")
+    if len(parts) >= 2 and parts[1] not in _COLLECTION_ACTIONS:
+        if parts[0] in _ID_RESOURCES:
+            parts[1] = "{id}"
+        elif parts[0] == "images":
+            if len(parts) > 2 and parts[-1] in _IMAGE_ACTIONS:
+                parts = ["images", "{name}", parts[-1]]
+            else:
+                parts = ["images", "{name}"]
+    return "/" + "/".join(parts)
+
+
+@dataclass
+class RequestMetrics:
+    """
+    Timings, in seconds, and sizes of a single request.
+
+    `time_to_body` is None for streams which the caller reads at their own
+    pace, such as attached container output.
+    """
+    endpoint: str
+    method: str
+    status: int
+    queue_wait: float
+    time_to_headers: float
+    time_to_body: Optional[float]
+    bytes_out: int
+    bytes_in: int
+
+
+class MetricsSink(ABC):
+    """
+    Receives the metrics of every request made by a client.
+    """
+    @abstractmethod
+    def record(self, metrics: RequestMetrics) -> None:
+        """
+        Called once per request. Runs on the event loop so must not block.
+        """
+
+
+class RequestTrace:
+    """
+    The in-progress measurements of a request, passed to aiohttp as the
+    `trace_request_ctx` so that the trace hooks can fill it in.
+    """
+    __slots__ = ("method", "uri", "start", "queue_start", "queue_wait",
+                 "headers_at", "bytes_out", "bytes_in")
+
+    def __init__(self, method: str, uri: str) -> None:
+        self.method = method.upper()
+        self.uri = uri
+        self.start = time.perf_counter()
+        self.queue_start = 0.0
+        self.queue_wait = 0.0
+        self.headers_at: Optional[float] = None
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+    def finish(self, status: int, body: bool = True) -> RequestMetrics:
+        """
+        Complete the measurements once the response has been read. `body`
+        should be False if the body is left for the caller to read.
+        """
+        now = time.perf_counter()
+        headers_at = self.headers_at if self.headers_at is not None else now
+        return RequestMetrics(
+            endpoint=endpoint_template(urlsplit(self.uri).path),
+            method=self.method,
+            status=status,
+            queue_wait=self.queue_wait,
+            time_to_headers=headers_at - self.start,
+            time_to_body=now - self.start if body else None,
+            bytes_out=self.bytes_out,
+            bytes_in=self.bytes_in)
+
+
+# aiohttp doesn't pass a `trace_request_ctx` through `ws_connect`, so
+# websocket handshakes are traced through this instead.
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar(
+    "current_trace", default=None)
+
+
+def _trace(ctx: SimpleNamespace) -> Optional[RequestTrace]:
+    trace = ctx.trace_request_ctx
+    if isinstance(trace, RequestTrace):
+        return trace
+    return current_trace.get()
+
+
+async def _on_queued_start(session: ClientSession, ctx: SimpleNamespace,
+                           params: TraceConnectionQueuedStartParams) -> None:
+    trace = _trace(ctx)
+    if trace is not None:
+        trace.queue_start = time.perf_counter()
+
+
+async def _on_queued_end(session: ClientSession, ctx: SimpleNamespace,
+                         params: TraceConnectionQueuedEndParams) -> None:
+    trace = _trace(ctx)
+    if trace is not None:
+        trace.queue_wait += time.perf_counter() - trace.queue_start
+
+
+async def _on_chunk_sent(session: ClientSession, ctx: SimpleNamespace,
+                         params: TraceRequestChunkSentParams) -> None:
+    trace = _trace(ctx)
+    if trace is not None:
+        trace.bytes_out += len(params.chunk)
+
+
+async def _on_request_end(session: ClientSession, ctx: SimpleNamespace,
+                          params: TraceRequestEndParams) -> None:
+    trace = _trace(ctx)
+    if trace is not None:
+        trace.headers_at = time.perf_counter()
+
+
+async def _on_chunk_received(session: ClientSession, ctx: SimpleNamespace,
+                             params: TraceResponseChunkReceivedParams
+                             ) -> None:
+    trace = _trace(ctx)
+    if trace is not None:
+        trace.bytes_in += len(params.chunk)
+
+
+def create_trace_config() -> TraceConfig:
+    """
+    The aiohttp trace hooks which fill in each request's `RequestTrace`.
+    """
+    config = TraceConfig()
+    config.on_connection_queued_start.append(_on_queued_start)
+    config.on_connection_queued_end.append(_on_queued_end)
+    config.on_request_chunk_sent.append(_on_chunk_sent)
+    config.on_request_end.append(_on_request_end)
+    config.on_response_chunk_received.append(_on_chunk_received)
+    return config
+
+
+class Histogram:
+    """
+    A histogram of durations in seconds with logarithmic buckets, four per
+    doubling, from 10us to roughly 5 minutes. Percentiles are accurate to
+    within a bucket, about 19%.
+    """
+    BOUNDS: List[float] = [1e-5 * 2 ** (i / 4) for i in range(100)]
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        self.buckets[bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percentile: float) -> float:
+        """
+        The upper bound of the bucket holding `percentile` (0-100).
+        """
+        if not self.count:
+            return 0.0
+        rank = percentile / 100 * self.count
+        seen = 0
+        for idx, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                if idx < len(self.BOUNDS):
+                    return min(self.BOUNDS[idx], self.max)
+                break
+        return self.max
+
+
+class EndpointMetrics:
+    """
+    Aggregated metrics for a single endpoint.
+    """
+    def __init__(self) -> None:
+        self.queue_wait = Histogram()
+        self.time_to_headers = Histogram()
+        self.time_to_body = Histogram()
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.statuses: Counter[int] = Counter()
+
+    @property
+    def count(self) -> int:
+        return self.time_to_headers.count
+
+    def record(self, metrics: RequestMetrics) -> None:
+        self.queue_wait.record(metrics.queue_wait)
+        self.time_to_headers.record(metrics.time_to_headers)
+        if metrics.time_to_body is not None:
+            self.time_to_body.record(metrics.time_to_body)
+        self.bytes_out += metrics.bytes_out
+        self.bytes_in += metrics.bytes_in
+        self.statuses[metrics.status] += 1
+
+
+class InMemoryMetrics(MetricsSink):
+    """
+    Keeps histograms of every endpoint's metrics in memory. Endpoints are
+    keyed by method and path template, eg. "POST /containers/{id}/start".
+    """
+    def __init__(self) -> None:
+        self.endpoints: Dict[str, EndpointMetrics] = {}
+
+    def record(self, metrics: RequestMetrics) -> None:
+        key = "%s %s" % (metrics.method, metrics.endpoint)
+        try:
+            endpoint = self.endpoints[key]
+        except KeyError:
+            endpoint = self.endpoints[key] = EndpointMetrics()
+        endpoint.record(metrics)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        A JSON friendly summary of every endpoint, timings are in seconds.
+        """
+        out = {}
+        for key, m in self.endpoints.items():
+            out[key] = {
+                "count": m.count,
+                "statuses": dict(m.statuses),
+                "bytes_out": m.bytes_out,
+                "bytes_in": m.bytes_in,
+            }
+            for name, hist in (("queue_wait", m.queue_wait),
+                               ("time_to_headers", m.time_to_headers),
+                               ("time_to_body", m.time_to_body)):
+                out[key][name] = {"mean": hist.mean,
+                                  "p50": hist.percentile(50),
+                                  "p99": hist.percentile(99),
+                                  "max": hist.max}
+        return out
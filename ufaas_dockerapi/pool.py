@@ -0,0 +1,300 @@
+"""
+A pool of warm containers, so that invocations don't have to wait for a
+container to be created and started.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import (Deque, Dict, Optional, Set, TYPE_CHECKING, Tuple,
+                    Type, Union, cast)
+from uuid import uuid4
+
+from ufaas_dockerapi.config import ContainerConfig, serialize_config
+from ufaas_dockerapi.container import Container
+
+if TYPE_CHECKING:
+    from ufaas_dockerapi.client import DockerClient
+    from ufaas_dockerapi.container import ContainerAPI
+
+# Number of acquire latencies kept for calculating percentiles.
+LATENCY_SAMPLES = 10000
+
+
+def pool_key(config: ContainerConfig) -> str:
+    """
+    Containers are pooled by their configuration, two configs that would
+    produce the same container share a pool.
+    """
+    return json.dumps(serialize_config(config), sort_keys=True)
+
+
+@dataclass
+class PoolStats:
+    """
+    Counters for a `ContainerPool`. Latencies are in seconds.
+    """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    refill_errors: int = 0
+    acquire_latency: Deque[float] = field(
+        default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    def latency_percentile(self, percentile: float) -> float:
+        """
+        Acquire latency at `percentile` (0-100) of the recent samples.
+        """
+        if not self.acquire_latency:
+            return 0.0
+        samples = sorted(self.acquire_latency)
+        idx = int(round((percentile / 100) * (len(samples) - 1)))
+        return samples[idx]
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class _PoolEntry:
+    """
+    Warm containers for a single container config.
+    """
+    def __init__(self, config: ContainerConfig, size: int) -> None:
+        self.config = config
+        self.size = size
+        # (container, time it became idle), most recently warmed at the right.
+        self.idle: Deque[Tuple[Container, float]] = deque()
+        self.pending = 0
+        self.refill: Optional['asyncio.Task[None]'] = None
+
+
+class ContainerPool:
+    """
+    Keeps `size` created and started containers ready for every container
+    config it is asked for, and hands them out in O(1) with `acquire`.
+
+    At most `max_size` idle containers are kept across all configs, once the
+    limit is reached the least recently used configs lose their containers
+    first. Idle containers are deleted after `idle_ttl` seconds.
+    """
+    def __init__(self, client: 'DockerClient', size: int = 1,
+                 max_size: int = 32, idle_ttl: float = 300.0,
+                 name_prefix: str = "ufaas-pool-") -> None:
+        self._client = client
+        self._size = size
+        self._max_size = max_size
+        self._idle_ttl = idle_ttl
+        self._name_prefix = name_prefix
+        self._entries: 'OrderedDict[str, _PoolEntry]' = OrderedDict()
+        self._owners: Dict[str, str] = {}  # container name -> pool key.
+        self._tasks: Set['asyncio.Task[None]'] = set()
+        self._reaper: Optional['asyncio.Task[None]'] = None
+        self._stats = PoolStats()
+
+    async def __aenter__(self) -> 'ContainerPool':
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> None:
+        await self.close()
+
+    @property
+    def stats(self) -> PoolStats:
+        return self._stats
+
+    @property
+    def idle_count(self) -> int:
+        return sum(len(e.idle) for e in self._entries.values())
+
+    @property
+    def pending_count(self) -> int:
+        """
+        The number of containers being started to refill the pool.
+        """
+        return sum(e.pending for e in self._entries.values())
+
+    def start(self) -> None:
+        """
+        Start expiring idle containers in the background.
+        """
+        if self._reaper is None:
+            self._reaper = asyncio.ensure_future(self._reap())
+
+    async def close(self) -> None:
+        """
+        Stop background work and delete every idle container.
+        """
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        refills = [e.refill for e in self._entries.values()
+                   if e.refill is not None]
+        for refill in refills:
+            refill.cancel()
+        # Cancelled refills delete the containers they were starting.
+        await asyncio.gather(*refills, return_exceptions=True)
+        idle = [c for e in self._entries.values() for c, _ in e.idle]
+        self._entries.clear()
+        await asyncio.gather(*[self._destroy(c) for c in idle],
+                             *self._tasks, return_exceptions=True)
+
+    def prewarm(self, config: Union[str, ContainerConfig],
+                size: Optional[int] = None) -> None:
+        """
+        Start warming containers for `config` before they are first needed.
+        `size` overrides the pool's default number of warm containers.
+        """
+        entry = self._entry(self._config(config))
+        if size is not None:
+            entry.size = size
+        self._schedule_refill(entry)
+
+    async def acquire(self, config: Union[str, ContainerConfig]
+                      ) -> Container:
+        """
+        Return a running container for `config`, which may be an image name.
+        Warm containers are used when available, otherwise one is created and
+        started before returning.
+        """
+        start = time.perf_counter()
+        cfg = self._config(config)
+        key = pool_key(cfg)
+        entry = self._entry(cfg, key)
+        self._entries.move_to_end(key)
+
+        if entry.idle:
+            container, _ = entry.idle.pop()
+            self._stats.hits += 1
+        else:
+            self._stats.misses += 1
+            container = self._new_container(cfg, key)
+            try:
+                await container.start()
+            except BaseException:
+                self._destroy_later(container)
+                raise
+
+        self._schedule_refill(entry)
+        self._stats.acquire_latency.append(time.perf_counter() - start)
+        return container
+
+    async def release(self, container: Container, reuse: bool = True
+                      ) -> None:
+        """
+        Give a container back to the pool. Containers that aren't reused, or
+        that don't fit in the pool, are deleted.
+        """
+        key = self._owners.get(container.name)
+        entry = self._entries.get(key) if key is not None else None
+        if (reuse and entry is not None and container.running and
+                len(entry.idle) < entry.size and self._make_room(key)):
+            entry.idle.append((container, time.monotonic()))
+        else:
+            await self._destroy(container)
+
+    def evict_idle(self) -> int:
+        """
+        Delete containers that have been idle longer than the idle TTL.
+        Returns the number of containers evicted.
+        """
+        deadline = time.monotonic() - self._idle_ttl
+        evicted = 0
+        for entry in self._entries.values():
+            while entry.idle and entry.idle[0][1] < deadline:
+                container, _ = entry.idle.popleft()
+                self._destroy_later(container)
+                evicted += 1
+        self._stats.evictions += evicted
+        return evicted
+
+    def _config(self, config: Union[str, ContainerConfig]
+                ) -> ContainerConfig:
+        if isinstance(config, str):
+            return ContainerConfig(image=config)
+        return config
+
+    def _entry(self, config: ContainerConfig,
+               key: Optional[str] = None) -> _PoolEntry:
+        if key is None:
+            key = pool_key(config)
+        try:
+            return self._entries[key]
+        except KeyError:
+            entry = _PoolEntry(config, self._size)
+            self._entries[key] = entry
+            return entry
+
+    def _new_container(self, config: ContainerConfig, key: str) -> Container:
+        name = "%s%s" % (self._name_prefix, uuid4().hex[:12])
+        self._owners[name] = key
+        return Container(self._client, name, config, created=False)
+
+    def _make_room(self, key: Optional[str]) -> bool:
+        """
+        Evict idle containers of the least recently used configs until there
+        is room for one more, counting those still being started. Returns
+        False if no room could be made.
+        """
+        while self.idle_count + self.pending_count >= self._max_size:
+            victim = next((e for k, e in self._entries.items()
+                           if e.idle and k != key), None)
+            if victim is None:
+                return False
+            container, _ = victim.idle.popleft()
+            self._destroy_later(container)
+            self._stats.evictions += 1
+        return True
+
+    def _schedule_refill(self, entry: _PoolEntry) -> None:
+        if entry.refill is None or entry.refill.done():
+            entry.refill = asyncio.ensure_future(self._refill(entry))
+
+    async def _refill(self, entry: _PoolEntry) -> None:
+        key = pool_key(entry.config)
+        while len(entry.idle) + entry.pending < entry.size:
+            if self._entries.get(key) is not entry or \
+                    not self._make_room(key):
+                return
+            container = self._new_container(entry.config, key)
+            entry.pending += 1
+            try:
+                await container.start()
+            except asyncio.CancelledError:
+                # The pool is closing, the container may have been created.
+                self._destroy_later(container)
+                raise
+            except Exception:
+                self._stats.refill_errors += 1
+                self._destroy_later(container)
+                return
+            finally:
+                entry.pending -= 1
+            entry.idle.append((container, time.monotonic()))
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(max(self._idle_ttl / 2, 0.01))
+            self.evict_idle()
+
+    def _destroy_later(self, container: Container) -> None:
+        task = asyncio.ensure_future(self._destroy(container))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _destroy(self, container: Container) -> None:
+        self._owners.pop(container.name, None)
+        try:
+            # Deleted by name rather than through the container, which
+            # doesn't know it was created if its start was cancelled.
+            api = cast('ContainerAPI', self._client.container)
+            await api.delete(container.name, force_stop=True)
+        except Exception:
+            # The container may already be gone, there's nothing else to do.
+            pass
@@ -0,0 +1,330 @@
+"""
+Persistent exec sessions: one long-lived worker process per container, to
+which many invocations are sent over a hijacked exec connection, so that hot
+functions don't pay for creating an exec instance every time.
+
+The worker reads requests from stdin and writes responses to stdout, both
+framed with the same 9 byte header followed by the payload:
+
+    request ID   uint32, big-endian
+    kind         uint8, REQUEST, RESPONSE or ERROR
+    length       uint32, big-endian, of the payload
+
+A response has the ID of its request and may be sent in any order. An ERROR
+response's payload is a UTF-8 error message. `serve` implements the worker's
+side of this for workers written with asyncio.
+"""
+
+import asyncio
+import struct
+from types import TracebackType
+from typing import (Awaitable, Callable, Dict, List, Optional, Set,
+                    TYPE_CHECKING, Tuple, Type, cast)
+
+from ufaas_dockerapi.config import ExecConfig
+from ufaas_dockerapi.exceptions import (ExecSessionBusy, ExecSessionClosed,
+                                        ExecSessionException)
+from ufaas_dockerapi.streams import STDOUT
+
+if TYPE_CHECKING:
+    from ufaas_dockerapi.client import DockerClient
+    from ufaas_dockerapi.exec import ExecAPI, ExecProcess
+
+REQUEST = 0
+RESPONSE = 1
+ERROR = 2
+
+HEADER = struct.Struct(">IBI")
+
+# (request ID, kind, payload)
+SessionFrame = Tuple[int, int, bytes]
+Handler = Callable[[bytes], Awaitable[bytes]]
+
+
+class FrameDecoder:
+    """
+    Splits a byte stream into `(request ID, kind, payload)` frames, holding
+    on to an incomplete frame until the rest of it arrives.
+    """
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[SessionFrame]:
+        buf = self._buffer
+        buf += data
+        frames: List[SessionFrame] = []
+        pos = 0
+        while len(buf) - pos >= HEADER.size:
+            request_id, kind, length = HEADER.unpack_from(buf, pos)
+            end = pos + HEADER.size + length
+            if len(buf) < end:
+                break
+            frames.append((request_id, kind,
+                           bytes(buf[pos + HEADER.size:end])))
+            pos = end
+        del buf[:pos]
+        return frames
+
+
+def encode_frame(request_id: int, kind: int, payload: bytes) -> bytes:
+    return HEADER.pack(request_id, kind, len(payload)) + payload
+
+
+class ExecSession:
+    """
+    A worker process started with `cmd` in a running container, which
+    handles requests sent with `call`.
+
+    At most `concurrency` requests are sent to the worker at once and at most
+    `max_queued` more wait for their turn, beyond that `call` raises
+    `ExecSessionBusy` straight away rather than letting a backlog build up.
+    Writes also wait for the worker to keep up with its stdin.
+    """
+    def __init__(self, client: 'DockerClient', container: str,
+                 cmd: List[str], concurrency: int = 1,
+                 max_queued: int = 64) -> None:
+        self._client = client
+        self._container = container
+        self._cmd = cmd
+        self._max_queued = max_queued
+        self._slots = asyncio.Semaphore(concurrency)
+        self._queued = 0
+        self._next_id = 0
+        self._pending: Dict[int, 'asyncio.Future[bytes]'] = {}
+        self._proc: Optional['ExecProcess'] = None
+        self._reader: Optional['asyncio.Task[None]'] = None
+        self._closed = False
+        self.calls = 0
+        self.rejected = 0
+
+    async def __aenter__(self) -> 'ExecSession':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> None:
+        await self.close()
+
+    @property
+    def container(self) -> str:
+        return self._container
+
+    @property
+    def closed(self) -> bool:
+        """
+        True once the session has been closed or its worker has exited.
+        """
+        return self._closed
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    async def start(self) -> None:
+        """
+        Start the worker process.
+        """
+        if self._proc is not None:
+            return
+        api = cast('ExecAPI', self._client.exec)
+        self._proc = await api.spawn(self._container, ExecConfig(
+            cmd=self._cmd, attach_stdin=True, attach_stdout=True,
+            attach_stderr=True, tty=False))
+        self._reader = asyncio.ensure_future(self._read(self._proc))
+
+    async def call(self, payload: bytes) -> bytes:
+        """
+        Send `payload` to the worker and return its response. Raises
+        `ExecSessionBusy` if too many requests are already waiting and
+        `ExecSessionClosed` if the worker has gone.
+        """
+        if self._closed or self._proc is None:
+            raise ExecSessionClosed("Session with %s is closed"
+                                    % self._container)
+        if self._slots.locked() and self._queued >= self._max_queued:
+            self.rejected += 1
+            raise ExecSessionBusy("Session with %s has %d requests queued"
+                                  % (self._container, self._queued))
+        self._queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+        try:
+            if self._closed:
+                raise ExecSessionClosed("Session with %s is closed"
+                                        % self._container)
+            request_id = self._next_id
+            self._next_id = (self._next_id + 1) & 0xffffffff
+            future = asyncio.get_event_loop().create_future()
+            self._pending[request_id] = future
+            try:
+                await self._proc.write(
+                    encode_frame(request_id, REQUEST, payload))
+                self.calls += 1
+                return await future
+            finally:
+                self._pending.pop(request_id, None)
+        finally:
+            self._slots.release()
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """
+        Close the worker's stdin, which should make it exit, and wait up to
+        `timeout` seconds for its outstanding responses. After that the
+        connection is closed and calls still waiting raise
+        `ExecSessionClosed`.
+        """
+        if self._proc is None or self._reader is None:
+            self._closed = True
+            return
+        if not self._closed:
+            try:
+                await self._proc.close_stdin()
+            except (ConnectionError, OSError):
+                pass
+        try:
+            await asyncio.wait([self._reader], timeout=timeout)
+            if not self._reader.done():
+                self._reader.cancel()
+                await asyncio.wait([self._reader])
+            elif not self._reader.cancelled():
+                self._reader.result()
+        finally:
+            self._proc.close()
+
+    async def _read(self, proc: 'ExecProcess') -> None:
+        decoder = FrameDecoder()
+        error: ExecSessionException = ExecSessionClosed(
+            "Worker in %s exited" % self._container)
+        try:
+            async for stream_id, data in proc.frames():
+                if stream_id != STDOUT:
+                    continue
+                for request_id, kind, payload in decoder.feed(data):
+                    future = self._pending.get(request_id)
+                    if future is None or future.done():
+                        continue
+                    if kind == ERROR:
+                        future.set_exception(ExecSessionException(
+                            payload.decode(errors="replace")))
+                    else:
+                        future.set_result(payload)
+        except (ConnectionError, OSError) as e:
+            error = ExecSessionClosed("Lost connection to worker in %s: %r"
+                                      % (self._container, e))
+        finally:
+            self._closed = True
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+
+class ExecSessionPool:
+    """
+    Keeps one `ExecSession` running `cmd` per container, started the first
+    time a container is called and replaced if its worker exits.
+    """
+    def __init__(self, client: 'DockerClient', cmd: List[str],
+                 concurrency: int = 1, max_queued: int = 64) -> None:
+        self._client = client
+        self._cmd = cmd
+        self._concurrency = concurrency
+        self._max_queued = max_queued
+        self._sessions: Dict[str, 'asyncio.Future[ExecSession]'] = {}
+
+    async def __aenter__(self) -> 'ExecSessionPool':
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> None:
+        await self.close()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def session(self, container: str) -> ExecSession:
+        """
+        The session for `container`, starting one if there isn't a live one.
+        Concurrent callers share the same start.
+        """
+        future = self._sessions.get(container)
+        if future is not None and future.done() and (
+                future.exception() is not None or future.result().closed):
+            del self._sessions[container]
+            future = None
+        if future is None:
+            future = asyncio.ensure_future(self._start(container))
+            self._sessions[container] = future
+        return await asyncio.shield(future)
+
+    async def call(self, container: str, payload: bytes) -> bytes:
+        """
+        Send `payload` to the worker in `container`, see `ExecSession.call`.
+        """
+        session = await self.session(container)
+        return await session.call(payload)
+
+    async def discard(self, container: str) -> None:
+        """
+        Close the session with `container`, for example before it is stopped.
+        """
+        future = self._sessions.pop(container, None)
+        if future is not None and future.done() and not future.exception():
+            await future.result().close()
+
+    async def close(self) -> None:
+        """
+        Close every session.
+        """
+        for container in list(self._sessions):
+            await self.discard(container)
+
+    async def _start(self, container: str) -> ExecSession:
+        session = ExecSession(self._client, container, self._cmd,
+                              concurrency=self._concurrency,
+                              max_queued=self._max_queued)
+        await session.start()
+        return session
+
+
+async def serve(reader: asyncio.StreamReader,
+                write: Callable[[bytes], Awaitable[None]],
+                handler: Handler) -> None:
+    """
+    The worker's side of a session: read requests from `reader` until it
+    ends, call `handler` for each concurrently and `write` back its response
+    or an error if it raises.
+
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    """
+    tasks: Set['asyncio.Future[None]'] = set()
+
+    async def handle(request_id: int, payload: bytes) -> None:
+        try:
+            response = encode_frame(request_id, RESPONSE,
+                                    await handler(payload))
+        except Exception as e:
+            response = encode_frame(request_id, ERROR, str(e).encode())
+        await write(response)
+
+    decoder = FrameDecoder()
+    while True:
+        data = await reader.read(64 * 1024)
+        if not data:
+            break
+        for request_id, kind, payload in decoder.feed(data):
+            if kind == REQUEST:
+                task = asyncio.ensure_future(handle(request_id, payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
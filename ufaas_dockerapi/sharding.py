@@ -0,0 +1,289 @@
+"""
+A client for several Docker daemons at once, which places new containers on
+one of them by a pluggable policy and sends every later operation on a
+container to the daemon it lives on.
+
+    async with ShardedDockerClient({
+            "node1": transport_from_url("tcp://10.0.0.1:2375"),
+            "node2": transport_from_url("tcp://10.0.0.2:2375")},
+            policy=LeastLatency()) as client:
+        await client.start()
+        await client.create("fn", config)
+        await client.start_container("fn")
+"""
+
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from types import TracebackType
+from typing import (Any, Awaitable, Callable, Dict, List, Optional,
+                    TYPE_CHECKING, Tuple, Type, TypeVar, cast)
+
+from ufaas_dockerapi.client import DockerClient
+from ufaas_dockerapi.config import ContainerConfig
+from ufaas_dockerapi.exceptions import DockerAPIException
+from ufaas_dockerapi.streams import MultiplexedStream
+from ufaas_dockerapi.types import DockerJSONResponse, TransportType
+
+if TYPE_CHECKING:
+    from ufaas_dockerapi.container import ContainerAPI
+
+T = TypeVar("T")
+
+# Weight of the newest sample in a node's moving average latency.
+LATENCY_SMOOTHING = 0.2
+
+
+class Node:
+    """
+    A daemon of a `ShardedDockerClient` and what is known about it: the
+    number of containers on it, counting those being created, the number of
+    calls to it in progress and the moving average of how long calls to it
+    take, in seconds.
+    """
+    def __init__(self, name: str, client: DockerClient) -> None:
+        self.name = name
+        self.client = client
+        self.containers = 0
+        self.latency = 0.0
+        self.calls = 0
+        self.in_flight = 0
+
+    @property
+    def api(self) -> 'ContainerAPI':
+        return cast('ContainerAPI', self.client.container)
+
+    def record_latency(self, seconds: float) -> None:
+        if self.calls == 0:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+        self.calls += 1
+
+    def __repr__(self) -> str:
+        return "<Node %s containers=%d in_flight=%d latency=%.4f>" % (
+            self.name, self.containers, self.in_flight, self.latency)
+
+
+class PlacementPolicy(ABC):
+    """
+    Chooses the node a new container is created on.
+    """
+    @abstractmethod
+    def choose(self, nodes: List[Node]) -> Node:
+        """
+        One of `nodes`, which is never empty.
+        """
+
+
+class LeastContainers(PlacementPolicy):
+    """
+    Places containers on the node with the fewest, the first given winning
+    ties.
+    """
+    def choose(self, nodes: List[Node]) -> Node:
+        return min(nodes, key=lambda n: n.containers)
+
+
+class LeastLatency(PlacementPolicy):
+    """
+    Places containers on the node whose calls have recently been quickest,
+    allowing for the calls already waiting on it. Nodes that haven't been
+    called yet are tried first, the one with the fewest calls in progress
+    first.
+    """
+    def choose(self, nodes: List[Node]) -> Node:
+        return min(nodes, key=lambda n: (
+            n.calls > 0, n.latency * (n.in_flight + 1), n.in_flight))
+
+
+class ShardedDockerClient:
+    """
+    Holds a `DockerClient`, with its own connection pool, for each of the
+    named `transports`. `kwargs` are passed on to every client.
+
+    Containers are created on the node chosen by `policy`, by default
+    `LeastContainers`. The client remembers which node each container it
+    created lives on, by name and ID. Containers it doesn't know of are
+    looked for on every node and remembered once found. `start` counts the
+    containers already on each node.
+    """
+    def __init__(self, transports: Dict[str, TransportType],
+                 policy: Optional[PlacementPolicy] = None,
+                 **kwargs: Any) -> None:
+        if not transports:
+            raise ValueError("At least one transport is needed.")
+        self.policy = policy if policy is not None else LeastContainers()
+        self.nodes = {name: Node(name, DockerClient(transport, **kwargs))
+                      for name, transport in transports.items()}
+        # Name or ID to the owning node and both of the container's keys.
+        self._owners: Dict[str, Tuple[Node, str, str]] = {}
+
+    async def __aenter__(self) -> 'ShardedDockerClient':
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await asyncio.gather(*[node.client.close()
+                               for node in self.nodes.values()])
+
+    async def _timed(self, node: Node, call: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        node.in_flight += 1
+        try:
+            return await call
+        finally:
+            node.in_flight -= 1
+            node.record_latency(time.perf_counter() - start)
+
+    def _remember(self, node: Node, name: str, container_id: str) -> None:
+        entry = (node, name.lstrip("/"), container_id)
+        self._owners[entry[1]] = entry
+        self._owners[container_id] = entry
+
+    def _forget(self, container: str) -> None:
+        entry = self._owners.pop(container, None)
+        if entry is not None:
+            self._owners.pop(entry[1], None)
+            self._owners.pop(entry[2], None)
+
+    async def start(self) -> None:
+        """
+        Learn which containers are on each node.
+        """
+        async def scan(node: Node) -> None:
+            _, containers = await self._timed(
+                node, node.api.list(all=True, use_cache=False))
+            assert isinstance(containers, list)
+            node.containers = len(containers)
+            for c in containers:
+                for name in c.get("Names") or []:
+                    self._remember(node, name, c["Id"])
+
+        await asyncio.gather(*[scan(node) for node in self.nodes.values()])
+
+    def owner(self, container: str) -> Optional[Node]:
+        """
+        The node `container` is known to be on, by name or ID.
+        """
+        entry = self._owners.get(container)
+        return entry[0] if entry is not None else None
+
+    async def locate(self, container: str) -> Node:
+        """
+        The node `container` is on, asking every node if it isn't known.
+        Raises the 404 `DockerAPIException` if no node has it.
+        """
+        known = self.owner(container)
+        if known is not None:
+            return known
+
+        async def inspect(node: Node) -> DockerJSONResponse:
+            return await self._timed(node, node.api.inspect(
+                container, use_cache=False))
+
+        nodes = list(self.nodes.values())
+        results = await asyncio.gather(*[inspect(n) for n in nodes],
+                                       return_exceptions=True)
+        missing: Optional[DockerAPIException] = None
+        for node, res in zip(nodes, results):
+            if isinstance(res, DockerAPIException) and res.http_status == 404:
+                missing = res
+            elif isinstance(res, BaseException):
+                raise res
+            else:
+                info = res[1]
+                assert isinstance(info, dict)
+                self._remember(node, info["Name"], info["Id"])
+                return node
+        assert missing is not None
+        raise missing
+
+    async def client_for(self, container: str) -> DockerClient:
+        """
+        The client of the node `container` is on, for operations that this
+        class doesn't route itself.
+        """
+        return (await self.locate(container)).client
+
+    async def _route(self, container: str,
+                     call: Callable[['ContainerAPI'], Awaitable[T]]) -> T:
+        node = await self.locate(container)
+        return await self._timed(node, call(node.api))
+
+    async def create(self, name: str, config: ContainerConfig
+                     ) -> DockerJSONResponse:
+        """
+        Create a container on the node chosen by the placement policy.
+        """
+        node = self.policy.choose(list(self.nodes.values()))
+        # Counted before the create is sent, so that creates made at the
+        # same time are placed knowing of each other.
+        node.containers += 1
+        try:
+            res = await self._timed(node, node.api.create(name, config))
+        except BaseException:
+            node.containers -= 1
+            raise
+        info = res[1]
+        assert isinstance(info, dict)
+        self._remember(node, name, info["Id"])
+        return res
+
+    async def inspect(self, container: str) -> DockerJSONResponse:
+        return await self._route(
+            container, lambda api: api.inspect(container))
+
+    async def start_container(self, container: str) -> DockerJSONResponse:
+        return await self._route(
+            container, lambda api: api.start(container))
+
+    async def stop(self, container: str,
+                   timeout: Optional[int] = None) -> DockerJSONResponse:
+        return await self._route(
+            container, lambda api: api.stop(container, timeout))
+
+    async def restart(self, container: str,
+                      timeout: Optional[int] = None) -> DockerJSONResponse:
+        return await self._route(
+            container, lambda api: api.restart(container, timeout))
+
+    async def delete(self, container: str,
+                     force_stop: Optional[bool] = None
+                     ) -> DockerJSONResponse:
+        """
+        Delete a container and forget where it was.
+        """
+        node = await self.locate(container)
+        res = await self._timed(node, node.api.delete(
+            container, force_stop=force_stop))
+        self._forget(container)
+        node.containers = max(node.containers - 1, 0)
+        return res
+
+    async def logs(self, container: str, **kwargs: Any
+                   ) -> MultiplexedStream:
+        """
+        A container's logs, see `ContainerAPI.logs`.
+        """
+        return await self._route(
+            container, lambda api: api.logs(container, **kwargs))
+
+    async def list(self, **kwargs: Any) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        The containers on every node by node name, see `ContainerAPI.list`.
+        """
+        names = list(self.nodes)
+        results = await asyncio.gather(*[
+            self._timed(self.nodes[name],
+                        self.nodes[name].api.list(**kwargs))
+            for name in names])
+        out = {}
+        for name, (_, containers) in zip(names, results):
+            assert isinstance(containers, list)
+            out[name] = containers
+        return out
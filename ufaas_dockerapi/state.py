@@ -0,0 +1,260 @@
+"""
+A live, in-memory view of the state of every container, kept up to date from
+Docker's events stream rather than by polling.
+
+    cache = StateCache(client)
+    await cache.start()
+    cache.get("my-container").status  # "running"
+
+While started the cache is attached to its client, and `Container` objects
+made with that client read their state from it without any API calls. It
+also keeps the client's container and image response caches in step with
+the events, if the client has them.
+"""
+
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, TYPE_CHECKING, cast
+
+if TYPE_CHECKING:
+    from ufaas_dockerapi.client import DockerClient
+    from ufaas_dockerapi.container import ContainerAPI
+    from ufaas_dockerapi.image import ImageAPI
+    from ufaas_dockerapi.system import SystemAPI
+    from ufaas_dockerapi.types import JsonDict
+
+# Container events which change its status, others such as "kill" and
+# "exec_start" are ignored.
+_STATUS_ACTIONS = {
+    "create": "created",
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "stop": "exited",
+}
+_EXIT_CODE = re.compile(r"^Exited \((-?[0-9]+)\)")
+_HEALTH = re.compile(r"\((healthy|unhealthy|health: starting)\)")
+
+
+@dataclass
+class ContainerState:
+    """
+    The last known state of a container. `status` is one of Docker's states:
+    "created", "running", "paused", "restarting", "removing", "exited" or
+    "dead". `health` is None unless the container has a health check.
+    `updated` is the Unix time of the event, or list, it was last updated by,
+    by Docker's clock. `received` is the `time.monotonic()` of this process
+    when that was received.
+    """
+    id: str
+    name: str
+    status: str
+    exit_code: Optional[int] = None
+    health: Optional[str] = None
+    oom_killed: bool = False
+    updated: float = 0.0
+    received: float = 0.0
+
+
+class StateCache:
+    """
+    Keeps a map of container ID and name to `ContainerState` fed by the
+    events stream. The containers are listed once each time the stream is
+    (re)connected, which catches changes missed while it was down; events
+    from that point on are replayed so none fall between the two.
+
+    The stream is reconnected after `reconnect_delay` seconds if it drops.
+    States are updated in place between resyncs, so look them up again with
+    `get` rather than holding on to them.
+    """
+    def __init__(self, client: 'DockerClient',
+                 reconnect_delay: float = 1.0) -> None:
+        self._client = client
+        self._reconnect_delay = reconnect_delay
+        self._by_id: Dict[str, ContainerState] = {}
+        self._by_name: Dict[str, ContainerState] = {}
+        self._task: Optional['asyncio.Task[None]'] = None
+        self.resyncs = 0
+        self.event_count = 0
+        # Why the events stream last failed, if it has.
+        self.last_error: Optional[Exception] = None
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[ContainerState]:
+        return iter(list(self._by_id.values()))
+
+    async def start(self) -> None:
+        """
+        Populate the cache, then follow events in the background and attach
+        the cache to the client. Errors listing the containers are raised.
+        """
+        if self._task is None:
+            since = time.time() - 1
+            await self.resync()
+            self._client.state_cache = self
+            self._task = asyncio.ensure_future(self._run(since))
+
+    async def stop(self) -> None:
+        """
+        Stop following events and detach the cache from the client. The last
+        known state is kept.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client.state_cache is self:
+            self._client.state_cache = None
+
+    def get(self, container: str) -> Optional[ContainerState]:
+        """
+        The state of a container by name or ID, None if it is not known.
+        """
+        state = self._by_id.get(container)
+        if state is None:
+            state = self._by_name.get(container.lstrip("/"))
+        if state is None and len(container) >= 12:
+            # Docker accepts unique ID prefixes, the short form is 12 chars.
+            for cid, s in self._by_id.items():
+                if cid.startswith(container):
+                    return s
+        return state
+
+    def apply(self, event: 'JsonDict') -> None:
+        """
+        Update the cache from a single event.
+        """
+        if event.get("Type") != "container":
+            return
+        self.event_count += 1
+        action = event.get("Action", "")
+        actor = event.get("Actor", {})
+        cid = actor.get("ID", "")
+        attrs = actor.get("Attributes", {})
+        name = attrs.get("name", "")
+
+        if action == "destroy":
+            self._remove(cid)
+            return
+        state = self._by_id.get(cid)
+        if state is None:
+            if action not in _STATUS_ACTIONS:
+                # Only events that tell us the status can add a container.
+                return
+            state = ContainerState(id=cid, name=name, status="created")
+            self._add(state)
+        if "timeNano" in event:
+            state.updated = event["timeNano"] / 1e9
+        else:
+            state.updated = event.get("time", time.time())
+        state.received = time.monotonic()
+
+        if action == "rename":
+            self._by_name.pop(attrs.get("oldName", "").lstrip("/"), None)
+            state.name = name
+            self._by_name[name] = state
+        elif action == "oom":
+            state.oom_killed = True
+        elif action.startswith("health_status"):
+            state.health = action.split(":", 1)[1].strip()
+        elif action in _STATUS_ACTIONS:
+            state.status = _STATUS_ACTIONS[action]
+            if action == "die":
+                code = attrs.get("exitCode")
+                state.exit_code = int(code) if code is not None else None
+            elif state.status == "running":
+                state.exit_code = None
+                state.oom_killed = False
+                if state.health is not None:
+                    state.health = "starting"
+
+    async def resync(self) -> None:
+        """
+        Replace the cache with the current state of every container.
+        """
+        api = cast('ContainerAPI', self._client.container)
+        _, res = await api.list(all=True, use_cache=False)
+        self.load(res)  # type: ignore
+
+    def load(self, containers: List['JsonDict']) -> None:
+        """
+        Replace the cache with the containers in a container list response.
+        """
+        now = time.time()
+        received = time.monotonic()
+        self._by_id = {}
+        self._by_name = {}
+        for c in containers:
+            status = c.get("Status") or ""
+            exit_code = _EXIT_CODE.match(status)
+            health = _HEALTH.search(status)
+            names = c.get("Names") or [""]
+            self._add(ContainerState(
+                id=c["Id"],
+                name=names[0].lstrip("/"),
+                status=c.get("State", ""),
+                exit_code=int(exit_code.group(1)) if exit_code else None,
+                health=(health.group(1).replace("health: ", "")
+                        if health else None),
+                updated=now,
+                received=received))
+        self.resyncs += 1
+
+    def _add(self, state: ContainerState) -> None:
+        self._by_id[state.id] = state
+        if state.name:
+            self._by_name[state.name] = state
+
+    def _remove(self, cid: str) -> None:
+        state = self._by_id.pop(cid, None)
+        if state is not None and self._by_name.get(state.name) is state:
+            del self._by_name[state.name]
+
+    async def _run(self, since: float) -> None:
+        # The cache was populated by `start`, after that the containers are
+        # listed again whenever the stream is reconnected.
+        resync = False
+        while True:
+            try:
+                if resync:
+                    # Events are replayed from just before the list so that
+                    # changes made while it is being read aren't lost.
+                    since = time.time() - 1
+                    await self.resync()
+                resync = True
+                system = cast('SystemAPI', self._client.system)
+                api = cast('ContainerAPI', self._client.container)
+                images = cast('ImageAPI', self._client.image)
+                async for event in system.events(
+                        since=since,
+                        filters={"type": ["container", "image"]}):
+                    # Keep the client's list and inspect caches in step.
+                    actor = event.get("Actor", {})
+                    if event.get("Type") == "image":
+                        images.invalidate(actor.get("ID"))
+                        name = actor.get("Attributes", {}).get("name")
+                        if name:
+                            images.invalidate(name)
+                        continue
+                    self.apply(event)
+                    api.invalidate(actor.get("ID"))
+                    # Inspects in progress are only known by the reference
+                    # they were made with, which may be the name.
+                    name = actor.get("Attributes", {}).get("name")
+                    if name:
+                        api.invalidate(name)
+            except Exception as e:
+                # Timeouts from the client's `call_timeout` or retry policy
+                # included, so that the cache is never left attached but no
+                # longer followed.
+                self.last_error = e
+            await asyncio.sleep(self._reconnect_delay)
@@ -0,0 +1,330 @@
+"""
+Resource usage of many containers, collected from Docker's stats streams.
+
+Samples are stored as numbers in fixed-size ring buffers rather than as the
+JSON Docker sends, one flat `array.array` per metric shared by every
+container, so memory use is fixed when the collector is created. CPU and
+memory percentages and network and block IO rates are computed for all
+containers in one pass, vectorised with numpy if it is installed.
+
+    async with StatsCollector(client) as stats:
+        stats.follow("fn-1")
+        ...
+        usage = stats.usage()
+        usage["fn-1"].cpu_percent
+"""
+
+import asyncio
+from array import array
+from datetime import datetime
+from types import TracebackType
+from typing import (Dict, List, NamedTuple, Optional, TYPE_CHECKING, Type,
+                    cast)
+
+from aiohttp import ClientError
+
+from ufaas_dockerapi.exceptions import (DockerAPIException,
+                                        DockerStreamException)
+
+if TYPE_CHECKING:
+    from ufaas_dockerapi.client import DockerClient
+    from ufaas_dockerapi.container import ContainerAPI
+    from ufaas_dockerapi.types import JsonDict
+
+# numpy is optional, without it usage is computed in plain Python.
+try:
+    import numpy  # type: ignore
+except ImportError:  # pragma: no cover
+    numpy = None  # type: ignore
+
+# The metrics kept for every sample, in order.
+FIELDS = ("time", "cpu_total", "cpu_system", "online_cpus", "mem_usage",
+          "mem_limit", "net_rx", "net_tx", "blk_read", "blk_write")
+(_TIME, _CPU_TOTAL, _CPU_SYSTEM, _ONLINE_CPUS, _MEM_USAGE, _MEM_LIMIT,
+ _NET_RX, _NET_TX, _BLK_READ, _BLK_WRITE) = range(len(FIELDS))
+
+
+class Usage(NamedTuple):
+    """
+    A container's resource usage between its two most recent samples. Rates
+    are in bytes per second.
+    """
+    cpu_percent: float
+    mem_usage: float
+    mem_percent: float
+    net_rx_rate: float
+    net_tx_rate: float
+    blk_read_rate: float
+    blk_write_rate: float
+
+
+def parse_time(value: str) -> float:
+    """
+    Convert Docker's RFC 3339 timestamps, which have nanoseconds, to a Unix
+    time. Returns 0 for Go's zero time.
+    """
+    if value.startswith("0001-"):
+        return 0.0
+    base, _, frac = value.rstrip("Z").partition(".")
+    return datetime.fromisoformat(
+        "%s.%s+00:00" % (base, frac[:6].ljust(6, "0"))).timestamp()
+
+
+def parse_stats(stats: 'JsonDict') -> List[float]:
+    """
+    The values of `FIELDS` from a stats response, which uses the same layout
+    on cgroups v1 and v2 except for the page cache.
+    """
+    cpu = stats.get("cpu_stats") or {}
+    mem = stats.get("memory_stats") or {}
+    mem_stats = mem.get("stats") or {}
+    # Like `docker stats`, page cache that can be reclaimed isn't counted.
+    cache = mem_stats.get("inactive_file", mem_stats.get("cache", 0))
+    rx = tx = 0
+    for net in (stats.get("networks") or {}).values():
+        rx += net.get("rx_bytes", 0)
+        tx += net.get("tx_bytes", 0)
+    blk_read = blk_write = 0
+    blkio = stats.get("blkio_stats") or {}
+    for entry in blkio.get("io_service_bytes_recursive") or ():
+        op = entry.get("op", "").lower()
+        if op == "read":
+            blk_read += entry.get("value", 0)
+        elif op == "write":
+            blk_write += entry.get("value", 0)
+    usage = cpu.get("cpu_usage") or {}
+    online = cpu.get("online_cpus") or len(usage.get("percpu_usage") or ())
+    return [parse_time(stats.get("read", "0001-")),
+            usage.get("total_usage", 0),
+            cpu.get("system_cpu_usage", 0),
+            online or 1,
+            max(mem.get("usage", 0) - cache, 0),
+            mem.get("limit", 0),
+            rx, tx, blk_read, blk_write]
+
+
+class StatsBuffer:
+    """
+    Ring buffers of the last `capacity` samples of up to `max_containers`
+    containers. Each metric is one flat array of `max_containers * capacity`
+    doubles, a container's samples are in the row at its slot.
+    """
+    def __init__(self, capacity: int = 60,
+                 max_containers: int = 1024) -> None:
+        if capacity < 2:
+            raise ValueError("At least two samples are needed for rates")
+        self.capacity = capacity
+        self.max_containers = max_containers
+        size = capacity * max_containers
+        self._columns = [array("d", bytes(8 * size)) for _ in FIELDS]
+        self._slots: Dict[str, int] = {}
+        self._free = list(range(max_containers - 1, -1, -1))
+        # Per slot: index of the newest sample and the number of samples.
+        self._head = array("l", [0] * max_containers)
+        self._count = array("l", [0] * max_containers)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, container: object) -> bool:
+        return container in self._slots
+
+    @property
+    def containers(self) -> List[str]:
+        return list(self._slots)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory used by the samples, which doesn't change as they are added.
+        """
+        return sum(c.itemsize * len(c) for c in self._columns)
+
+    def record(self, container: str, stats: 'JsonDict') -> None:
+        """
+        Add a stats response as the container's newest sample. The first
+        sample of a container also records Docker's previous CPU reading, so
+        that CPU usage is known straight away.
+        """
+        slot = self._slots.get(container)
+        values = parse_stats(stats)
+        if slot is None:
+            if not self._free:
+                raise ValueError("Stats buffer is full, %d containers"
+                                 % self.max_containers)
+            slot = self._slots[container] = self._free.pop()
+            self._count[slot] = 0
+            pre = stats.get("precpu_stats") or {}
+            if pre.get("system_cpu_usage"):
+                prev = list(values)
+                prev[_TIME] = parse_time(stats.get("preread", "0001-"))
+                prev[_CPU_TOTAL] = (pre.get("cpu_usage") or {}).get(
+                    "total_usage", 0)
+                prev[_CPU_SYSTEM] = pre["system_cpu_usage"]
+                self._write(slot, prev)
+        self._write(slot, values)
+
+    def remove(self, container: str) -> None:
+        slot = self._slots.pop(container, None)
+        if slot is not None:
+            self._count[slot] = 0
+            self._free.append(slot)
+
+    def series(self, container: str, field: str) -> List[float]:
+        """
+        A container's samples of `field`, oldest first.
+        """
+        slot = self._slots[container]
+        column = self._columns[FIELDS.index(field)]
+        cap = self.capacity
+        head, count = self._head[slot], self._count[slot]
+        base = slot * cap
+        return [column[base + (head - i) % cap]
+                for i in range(count - 1, -1, -1)]
+
+    def usage(self) -> Dict[str, Usage]:
+        """
+        The usage of every container with at least two samples.
+        """
+        containers = [c for c, s in self._slots.items()
+                      if self._count[s] >= 2]
+        if not containers:
+            return {}
+        slots = [self._slots[c] for c in containers]
+        if numpy is not None:
+            rows = self._usage_numpy(slots)
+        else:
+            rows = self._usage_python(slots)
+        return {c: Usage(*row) for c, row in zip(containers, rows)}
+
+    def _write(self, slot: int, values: List[float]) -> None:
+        cap = self.capacity
+        head = (self._head[slot] + 1) % cap if self._count[slot] else 0
+        idx = slot * cap + head
+        for column, value in zip(self._columns, values):
+            column[idx] = value
+        self._head[slot] = head
+        if self._count[slot] < cap:
+            self._count[slot] += 1
+
+    def _usage_python(self, slots: List[int]) -> List[List[float]]:
+        cap = self.capacity
+        (time_, cpu, system, online, mem, limit,
+         rx, tx, blk_r, blk_w) = self._columns
+        rows = []
+        for slot in slots:
+            head = self._head[slot]
+            cur = slot * cap + head
+            prev = slot * cap + (head - 1) % cap
+            elapsed = time_[cur] - time_[prev]
+            system_delta = system[cur] - system[prev]
+            cpu_percent = ((cpu[cur] - cpu[prev]) / system_delta *
+                           online[cur] * 100 if system_delta > 0 else 0.0)
+            rates = [(col[cur] - col[prev]) / elapsed if elapsed > 0 else 0.0
+                     for col in (rx, tx, blk_r, blk_w)]
+            rows.append([cpu_percent, mem[cur],
+                         mem[cur] / limit[cur] * 100 if limit[cur] else 0.0]
+                        + rates)
+        return rows
+
+    def _usage_numpy(self, slots: List[int]) -> List[List[float]]:
+        cap = self.capacity
+        idx = numpy.asarray(slots)
+        heads = numpy.frombuffer(self._head, dtype=self._head.typecode)[idx]
+        cur = idx * cap + heads
+        prev = idx * cap + (heads - 1) % cap
+        # Zero-copy views of the arrays.
+        cols = [numpy.frombuffer(c, dtype=numpy.float64)
+                for c in self._columns]
+        (time_, cpu, system, online, mem, limit,
+         rx, tx, blk_r, blk_w) = cols
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            elapsed = time_[cur] - time_[prev]
+            system_delta = system[cur] - system[prev]
+            cpu_percent = numpy.where(
+                system_delta > 0,
+                (cpu[cur] - cpu[prev]) / system_delta * online[cur] * 100,
+                0.0)
+            mem_percent = numpy.where(limit[cur] > 0,
+                                      mem[cur] / limit[cur] * 100, 0.0)
+            rates = [numpy.where(elapsed > 0,
+                                 (col[cur] - col[prev]) / elapsed, 0.0)
+                     for col in (rx, tx, blk_r, blk_w)]
+        table = numpy.stack([cpu_percent, mem[cur], mem_percent] + rates,
+                            axis=1)
+        return cast(List[List[float]], table.tolist())
+
+
+class StatsCollector:
+    """
+    Follows the stats streams of many containers into a `StatsBuffer`.
+    Docker sends a sample about once a second per container. A container's
+    samples are kept after its stream ends, until `discard` is called.
+    """
+    def __init__(self, client: 'DockerClient', capacity: int = 60,
+                 max_containers: int = 1024) -> None:
+        self._client = client
+        self.buffer = StatsBuffer(capacity, max_containers)
+        self._tasks: Dict[str, 'asyncio.Task[None]'] = {}
+        self.errors: Dict[str, Exception] = {}
+
+    async def __aenter__(self) -> 'StatsCollector':
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> None:
+        await self.close()
+
+    def following(self, container: str) -> bool:
+        task = self._tasks.get(container)
+        return task is not None and not task.done()
+
+    def follow(self, container: str) -> None:
+        """
+        Start following a container's stats.
+        """
+        if not self.following(container):
+            self._tasks[container] = asyncio.ensure_future(
+                self._follow(container))
+
+    async def unfollow(self, container: str) -> None:
+        """
+        Stop following a container, keeping its samples.
+        """
+        task = self._tasks.pop(container, None)
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def discard(self, container: str) -> None:
+        """
+        Stop following a container and drop its samples.
+        """
+        await self.unfollow(container)
+        self.buffer.remove(container)
+        self.errors.pop(container, None)
+
+    async def close(self) -> None:
+        for container in list(self._tasks):
+            await self.unfollow(container)
+
+    def usage(self) -> Dict[str, Usage]:
+        """
+        The usage of every container with at least two samples, see
+        `StatsBuffer.usage`.
+        """
+        return self.buffer.usage()
+
+    async def _follow(self, container: str) -> None:
+        api = cast('ContainerAPI', self._client.container)
+        record = self.buffer.record
+        try:
+            async for stats in api.stats(container, stream=True):
+                record(container, stats)
+        except (ClientError, DockerAPIException, DockerStreamException,
+                ValueError) as e:
+            self.errors[container] = e
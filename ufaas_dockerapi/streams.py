@@ -0,0 +1,470 @@
+"""
+Incremental decoders for the streamed response bodies produced by the Docker
+API. Decoders are fed raw chunks as they arrive off the socket and only ever
+hold on to the incomplete tail of the stream, so memory use is bounded by the
+largest single message rather than by the size of the whole response.
+"""
+
+import asyncio
+import json
+import struct
+from abc import ABC, abstractmethod
+from collections import deque
+from types import TracebackType
+from typing import (Any, AsyncIterator, Callable, Deque, Dict, List,
+                    Optional, TYPE_CHECKING, Tuple, Type, Union)
+
+from ufaas_dockerapi.exceptions import DockerStreamException
+
+if TYPE_CHECKING:
+    from aiohttp import ClientResponse
+
+    from ufaas_dockerapi.types import JsonDict  # noqa: F401
+
+# Progress messages from Docker are tiny, anything larger than this is
+# certainly not a well behaved stream.
+DEFAULT_MAX_MESSAGE_SIZE = 4 * 1024 * 1024
+
+# Docker writes output in frames of at most a few tens of KiB, a frame header
+# claiming more than this is corrupt.
+DEFAULT_MAX_FRAME_SIZE = 16 * 1024 * 1024
+# Frames split across chunks are assembled in a buffer kept for the next one,
+# unless they are larger than this.
+_REUSED_PAYLOAD_SIZE = 256 * 1024
+
+# Stream IDs of Docker's multiplexed stream format.
+STDIN = 0
+STDOUT = 1
+STDERR = 2
+
+# Each frame starts with the stream ID, three bytes of padding and the size of
+# the payload as a big-endian uint32.
+_FRAME_HEADER = struct.Struct(">BxxxL")
+
+Frame = Tuple[int, bytes]
+
+
+class JSONStreamDecoder:
+    """
+    Decodes a newline delimited stream of JSON documents, such as the progress
+    messages returned when pulling an image.
+
+    Docker separates documents with "\\r\\n" on some endpoints and "\\n" on
+    others so we split on "\\n" and let the JSON decoder ignore the whitespace.
+    Documents split across chunk boundaries are held until the rest arrives.
+    Each document is decoded with `loads`, see `ufaas_dockerapi.codec`.
+    """
+    def __init__(self,
+                 max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE,
+                 loads: Callable[[bytes], Any] = json.loads) -> None:
+        self._buf = bytearray()
+        self._max_message_size = max_message_size
+        self._loads = loads
+
+    def feed(self, data: bytes) -> List['JsonDict']:
+        """
+        Feed a chunk of the stream to the decoder, returning the documents that
+        were completed by it.
+        """
+        if self._buf:
+            if b"\n" not in data:
+                # Still in the middle of a message, nothing to decode yet.
+                self._buf += data
+                self._check_size(len(self._buf))
+                return []
+            buf: bytes = bytes(self._buf) + data
+        else:
+            # Fast path for the common case of chunks ending on a message
+            # boundary, avoids copying the chunk into the buffer.
+            buf = data
+
+        out = []
+        start = 0
+        while True:
+            idx = buf.find(b"\n", start)
+            if idx == -1:
+                break
+            line = buf[start:idx].strip()
+            if line:
+                out.append(self._decode(line))
+            start = idx + 1
+
+        tail = len(buf) - start
+        self._check_size(tail)
+        self._buf = bytearray(buf[start:]) if tail else bytearray()
+        return out
+
+    def flush(self) -> List['JsonDict']:
+        """
+        Decode whatever remains in the buffer once the stream has ended.
+        """
+        line = bytes(self._buf).strip()
+        self._buf = bytearray()
+        if line:
+            return [self._decode(line)]
+        return []
+
+    def _check_size(self, size: int) -> None:
+        if size > self._max_message_size:
+            raise DockerStreamException(
+                "Streamed message exceeds %d bytes." % self._max_message_size)
+
+    def _decode(self, line: bytes) -> 'JsonDict':
+        try:
+            msg: 'JsonDict' = self._loads(line)
+        except ValueError as e:
+            raise DockerStreamException(
+                "Invalid JSON in stream: %s" % e) from e
+        return msg
+
+
+class StreamDemuxer:
+    """
+    Splits Docker's multiplexed stream format, used for exec and attach output
+    when the container has no TTY, into `(stream_id, payload)` frames.
+
+    Payloads are sliced straight out of the chunk they arrived in, only frames
+    split across chunks are assembled in a buffer which is reused for every
+    frame that isn't unusually large. A frame larger than `max_frame_size`
+    raises `DockerStreamException`. With `tty` the stream is not multiplexed
+    and everything is stdout.
+    """
+    def __init__(self, tty: bool = False,
+                 max_frame_size: int = DEFAULT_MAX_FRAME_SIZE) -> None:
+        self._tty = tty
+        self._max_frame_size = max_frame_size
+        self._header = bytearray()
+        self._payload = bytearray()
+        self._filled = 0
+        self._stream_id = STDOUT
+        self._remaining = 0
+
+    def feed(self, data: bytes) -> List[Frame]:
+        """
+        Feed a chunk of the stream to the demuxer, returning the frames that
+        were completed by it.
+        """
+        if self._tty:
+            return [(STDOUT, data)] if data else []
+
+        frames = []
+        view = memoryview(data)
+        end = len(view)
+        pos = 0
+        while pos < end:
+            if self._remaining == 0:
+                if self._header or end - pos < _FRAME_HEADER.size:
+                    # The header itself is split across chunks.
+                    take = min(_FRAME_HEADER.size - len(self._header),
+                               end - pos)
+                    self._header += view[pos:pos + take]
+                    pos += take
+                    if len(self._header) < _FRAME_HEADER.size:
+                        break
+                    stream_id, size = _FRAME_HEADER.unpack(self._header)
+                    self._header.clear()
+                else:
+                    stream_id, size = _FRAME_HEADER.unpack_from(view, pos)
+                    pos += _FRAME_HEADER.size
+                if size > self._max_frame_size:
+                    raise DockerStreamException(
+                        "Stream frame of %d bytes exceeds %d bytes." % (
+                            size, self._max_frame_size))
+
+                if end - pos >= size:
+                    # Whole payload is in this chunk.
+                    frames.append((stream_id, bytes(view[pos:pos + size])))
+                    pos += size
+                    continue
+                self._stream_id = stream_id
+                self._remaining = size
+                self._filled = 0
+                if len(self._payload) < size:
+                    self._payload.extend(bytes(size - len(self._payload)))
+
+            take = min(self._remaining, end - pos)
+            self._payload[self._filled:self._filled + take] = \
+                view[pos:pos + take]
+            self._filled += take
+            self._remaining -= take
+            pos += take
+            if self._remaining == 0:
+                with memoryview(self._payload) as payload:
+                    frames.append((self._stream_id,
+                                   bytes(payload[:self._filled])))
+                if len(self._payload) > _REUSED_PAYLOAD_SIZE:
+                    self._payload = bytearray()
+        return frames
+
+    @property
+    def pending(self) -> bool:
+        """
+        True if the demuxer holds the start of an incomplete frame.
+        """
+        return bool(self._header) or self._remaining > 0
+
+
+class RingBuffer:
+    """
+    Keeps the most recent `max_bytes` of a container's output, for example
+    to show what a failed invocation printed. Older output is dropped, the
+    oldest frame kept may have lost its beginning.
+    """
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._frames: Deque[Frame] = deque()
+        self._size = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, stream_id: int, data: bytes) -> None:
+        if not data:
+            return
+        if len(data) >= self.max_bytes:
+            self.dropped += self._size + len(data) - self.max_bytes
+            self._frames.clear()
+            data = data[len(data) - self.max_bytes:]
+            self._size = 0
+        self._frames.append((stream_id, data))
+        self._size += len(data)
+        excess = self._size - self.max_bytes
+        while excess > 0:
+            oldest_id, oldest = self._frames[0]
+            if len(oldest) <= excess:
+                self._frames.popleft()
+                dropped = len(oldest)
+            else:
+                self._frames[0] = (oldest_id, oldest[excess:])
+                dropped = excess
+            self._size -= dropped
+            self.dropped += dropped
+            excess -= dropped
+
+    def frames(self) -> List[Frame]:
+        return list(self._frames)
+
+    def getvalue(self, stream_id: Optional[int] = None) -> bytes:
+        """
+        The retained output, of a single stream if `stream_id` is given.
+        """
+        return b"".join(data for sid, data in self._frames
+                        if stream_id is None or sid == stream_id)
+
+    def clear(self) -> None:
+        self._frames.clear()
+        self._size = 0
+
+
+# Items passed from the pump to the stdout/stderr iterators. None marks the
+# end of the stream.
+_QueueItem = Union[bytes, BaseException, None]
+
+
+class DemuxedStream(ABC):
+    """
+    Output in Docker's multiplexed stream format, read incrementally as it
+    arrives from a connection.
+
+    Iterate over the stream itself to get `(stream_id, payload)` frames in the
+    order they were written, or use `stdout()` and `stderr()` to get separate
+    iterators for each. When using the separate iterators both should be
+    requested before reading from either and both should be consumed, at most
+    `queue_size` frames are buffered for the slower reader.
+
+    If a `buffer` is given every frame read is also kept in it.
+    """
+    def __init__(self, tty: bool = False, queue_size: int = 64,
+                 buffer: Optional[RingBuffer] = None) -> None:
+        self._demuxer = StreamDemuxer(tty=tty)
+        self._buffer = buffer
+        self._queue_size = queue_size
+        self._queues: Dict[int, 'asyncio.Queue[_QueueItem]'] = {}
+        self._pump: Optional['asyncio.Task[None]'] = None
+
+    @abstractmethod
+    def _chunks(self) -> AsyncIterator[bytes]:
+        """
+        Yield raw chunks of the stream as they arrive.
+        """
+
+    @abstractmethod
+    def _release(self) -> None:
+        """
+        Called once the stream has been read to the end, or reading stopped.
+        """
+
+    @abstractmethod
+    def _abort(self) -> None:
+        """
+        Close the connection without reading the rest of the stream.
+        """
+
+    async def __aenter__(self) -> 'DemuxedStream':
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        tb: Optional[TracebackType]) -> None:
+        self.close()
+
+    def __aiter__(self) -> AsyncIterator[Frame]:
+        return self.frames()
+
+    async def frames(self) -> AsyncIterator[Frame]:
+        """
+        Yield `(stream_id, payload)` frames as they arrive.
+        """
+        buffer = self._buffer
+        try:
+            async for chunk in self._chunks():
+                for frame in self._demuxer.feed(chunk):
+                    if buffer is not None:
+                        buffer.append(*frame)
+                    yield frame
+        finally:
+            self._release()
+
+    def stdout(self) -> AsyncIterator[bytes]:
+        """
+        Iterate over the payloads written to stdout.
+        """
+        return self._subscribe(STDOUT)
+
+    def stderr(self) -> AsyncIterator[bytes]:
+        """
+        Iterate over the payloads written to stderr.
+        """
+        return self._subscribe(STDERR)
+
+    async def read(self) -> Tuple[bytes, bytes]:
+        """
+        Read the stream until it ends and return `(stdout, stderr)`.
+        """
+        out: Dict[int, List[bytes]] = {STDOUT: [], STDERR: []}
+        async for stream_id, payload in self.frames():
+            out.setdefault(stream_id, []).append(payload)
+        return b"".join(out[STDOUT]), b"".join(out[STDERR])
+
+    def close(self) -> None:
+        """
+        Stop reading and close the connection.
+        """
+        if self._pump is not None:
+            self._pump.cancel()
+        self._abort()
+
+    def _subscribe(self, stream_id: int) -> AsyncIterator[bytes]:
+        queue: 'asyncio.Queue[_QueueItem]' = asyncio.Queue(
+            maxsize=self._queue_size)
+        self._queues[stream_id] = queue
+        if self._pump is None:
+            self._pump = asyncio.ensure_future(self._run_pump())
+            self._pump.add_done_callback(self._pump_done)
+        return self._drain(queue)
+
+    def _pump_done(self, pump: 'asyncio.Task[None]') -> None:
+        if not pump.cancelled():
+            return
+        # Closed, possibly before the pump even started. The consumers end
+        # now, without the output they haven't read, so that a full queue
+        # can't keep them waiting.
+        for queue in self._queues.values():
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def _run_pump(self) -> None:
+        end: _QueueItem = None
+        try:
+            async for stream_id, payload in self.frames():
+                queue = self._queues.get(stream_id)
+                if queue is not None:
+                    await queue.put(payload)
+        except Exception as e:
+            end = e
+        for queue in self._queues.values():
+            await queue.put(end)
+
+    @staticmethod
+    async def _drain(queue: 'asyncio.Queue[_QueueItem]'
+                     ) -> AsyncIterator[bytes]:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class MultiplexedStream(DemuxedStream):
+    """
+    The output of an exec instance or an attached container, read from the
+    body of an HTTP response, see `DemuxedStream`.
+    """
+    def __init__(self, resp: 'ClientResponse', tty: bool = False,
+                 queue_size: int = 64,
+                 buffer: Optional[RingBuffer] = None) -> None:
+        super().__init__(tty=tty, queue_size=queue_size, buffer=buffer)
+        self._resp = resp
+
+    async def __aenter__(self) -> 'MultiplexedStream':
+        return self
+
+    def _chunks(self) -> AsyncIterator[bytes]:
+        return self._resp.content.iter_any()
+
+    def _release(self) -> None:
+        self._resp.release()
+
+    def _abort(self) -> None:
+        self._resp.close()
+
+
+class HijackedStream(DemuxedStream):
+    """
+    A raw bidirectional connection taken over from an HTTP request with
+    `Upgrade: tcp`, as Docker does for exec and attach. Output is read as a
+    `DemuxedStream` and input is written with `write`.
+    """
+    def __init__(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter, tty: bool = False,
+                 queue_size: int = 64, read_size: int = 64 * 1024) -> None:
+        super().__init__(tty=tty, queue_size=queue_size)
+        self._reader = reader
+        self._writer = writer
+        self._read_size = read_size
+
+    async def __aenter__(self) -> 'HijackedStream':
+        return self
+
+    async def write(self, data: bytes) -> None:
+        """
+        Write `data` to the process' stdin, waiting if Docker isn't keeping
+        up with it.
+        """
+        self._writer.write(data)
+        await self._writer.drain()
+
+    async def close_stdin(self) -> None:
+        """
+        Close the process' stdin, output can still be read afterwards.
+        """
+        if self._writer.can_write_eof():
+            self._writer.write_eof()
+        await self._writer.drain()
+
+    async def _chunks(self) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await self._reader.read(self._read_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def _release(self) -> None:
+        self._writer.close()
+
+    def _abort(self) -> None:
+        self._writer.close()
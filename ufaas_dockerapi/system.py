@@ -1,8 +1,10 @@
+import json
 from abc import ABC
-from typing import TYPE_CHECKING
+from typing import (AsyncIterator, Dict, List, Optional, TYPE_CHECKING,
+                    Union)
 
-from ufaas_dockerapi.types import DockerJSONResponse
-from ufaas_dockerapi.utils import api_get
+from ufaas_dockerapi.types import DockerJSONResponse, JsonDict
+from ufaas_dockerapi.utils import STREAM_TIMEOUT, api_get, api_stream
 
 if TYPE_CHECKING:
     from ufaas_dockerapi.client import DockerClient
@@ -23,10 +25,38 @@ class SystemAPI(SystemAPIBase):
     """
     def __init__(self, client: 'DockerClient') -> None:
         super().__init__(client)
-        self._baseuri = "http://1.25"
+        self._baseuri = client._base_url
 
     async def version(self) -> DockerJSONResponse:
         """
         Retrieve Docker version information.
         """
         return await api_get(self._client, "%s/version" % self._baseuri)
+
+    async def events(self, since: Optional[Union[float, str]] = None,
+                     until: Optional[Union[float, str]] = None,
+                     filters: Optional[Dict[str, List[str]]] = None
+                     ) -> AsyncIterator[JsonDict]:
+        """
+        Yield events from Docker as they happen. `since` and `until` are Unix
+        timestamps, with `since` events that have already happened are
+        replayed first and with `until` the stream ends at that time.
+        Otherwise the stream only ends when the connection does.
+
+        `filters` limit the events to those matching, for example
+        `{"type": ["container"], "event": ["start", "die"]}`.
+
+        `https://docs.docker.com/engine/api/v1.39/#operation/SystemEvents`
+        """
+        d: JsonDict = {}
+        if since is not None:
+            d["since"] = str(since)
+        if until is not None:
+            d["until"] = str(until)
+        if filters:
+            d["filters"] = json.dumps(filters)
+
+        async for event in api_stream(self._client, "GET",
+                                      "%s/events" % self._baseuri, params=d,
+                                      timeout=STREAM_TIMEOUT):
+            yield event
@@ -1,20 +1,182 @@
-from abc import ABC
+import asyncio
+import os
+import ssl
+from abc import ABC, abstractmethod
+from typing import Any, Optional, Tuple, Union
+from urllib.parse import urlsplit
 
-from aiohttp import BaseConnector, UnixConnector
+from aiohttp import BaseConnector, TCPConnector, UnixConnector
 
 
 class TransportBase(ABC):
     """
     Base Class for Container API versions.
+
+    `limit` is the maximum number of simultaneous connections to Docker, 0
+    means no limit. Idle connections are closed after `keepalive_timeout`
+    seconds. If `stream_limit` is given long-lived streams (pulls, attaches,
+    etc) get their own pool of that size so that they can't starve ordinary
+    requests of connections.
+
+    `api_version` is the API version negotiated with the daemon by the first
+    client to ask, which later clients reuse.
     """
+    def __init__(self, limit: int = 100,
+                 keepalive_timeout: float = 15.0,
+                 stream_limit: Optional[int] = None) -> None:
+        self._limit = limit
+        self._keepalive_timeout = keepalive_timeout
+        self._stream_limit = stream_limit
+        self.api_version: Optional[Tuple[int, int]] = None
+
+    @property
+    @abstractmethod
+    def base_url(self) -> str:
+        """
+        The URL that API paths are appended to.
+        """
+
+    @abstractmethod
+    def _connector(self, limit: int,
+                   keepalive_timeout: float) -> BaseConnector:
+        pass
+
+    def create_connection(self, limit: Optional[int] = None,
+                          keepalive_timeout: Optional[float] = None
+                          ) -> BaseConnector:
+        """
+        Create a connection pool, the arguments override the transport's
+        settings.
+        """
+        if limit is None:
+            limit = self._limit
+        if keepalive_timeout is None:
+            keepalive_timeout = self._keepalive_timeout
+        return self._connector(limit, keepalive_timeout)
+
+    def create_stream_connection(self, limit: Optional[int] = None
+                                 ) -> Optional[BaseConnector]:
+        """
+        Create the separate connection pool for long-lived streams, or return
+        None if streams should share the ordinary pool.
+        """
+        if limit is None:
+            limit = self._stream_limit
+        if limit is None:
+            return None
+        return self.create_connection(limit=limit)
+
+    @abstractmethod
+    async def open_connection(self) -> Tuple[asyncio.StreamReader,
+                                             asyncio.StreamWriter]:
+        """
+        Open a raw connection to Docker outside of any pool, for requests
+        which take the connection over such as hijacked execs.
+        """
 
 
 class DockerSock(TransportBase):
     """
-    Docker Unix Socket transport.
+    Docker Unix Socket transport, see `TransportBase` for the pool settings.
     """
-    def __init__(self, path: str = "/var/run/docker.sock") -> None:
+    def __init__(self, path: str = "/var/run/docker.sock",
+                 limit: int = 100,
+                 keepalive_timeout: float = 15.0,
+                 stream_limit: Optional[int] = None) -> None:
+        super().__init__(limit, keepalive_timeout, stream_limit)
         self._socket_path = path
 
-    def create_connection(self) -> BaseConnector:
-        return UnixConnector(path=self._socket_path)
+    @property
+    def base_url(self) -> str:
+        # The host is ignored, as the connection is to the socket.
+        return "http://docker"
+
+    @property
+    def path(self) -> str:
+        return self._socket_path
+
+    def _connector(self, limit: int,
+                   keepalive_timeout: float) -> BaseConnector:
+        return UnixConnector(path=self._socket_path, limit=limit,
+                             keepalive_timeout=keepalive_timeout)
+
+    async def open_connection(self) -> Tuple[asyncio.StreamReader,
+                                             asyncio.StreamWriter]:
+        return await asyncio.open_unix_connection(self._socket_path)
+
+
+class DockerTCP(TransportBase):
+    """
+    Docker over TCP to `host` on `port`, using TLS if `ssl_context` is
+    given, see `tls_context`. See `TransportBase` for the pool settings.
+    """
+    def __init__(self, host: str, port: int = 2375,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 limit: int = 100,
+                 keepalive_timeout: float = 15.0,
+                 stream_limit: Optional[int] = None) -> None:
+        super().__init__(limit, keepalive_timeout, stream_limit)
+        self._host = host
+        self._port = port
+        self._ssl = ssl_context
+
+    @property
+    def base_url(self) -> str:
+        host = "[%s]" % self._host if ":" in self._host else self._host
+        return "%s://%s:%d" % ("https" if self._ssl else "http", host,
+                               self._port)
+
+    @property
+    def host(self) -> str:
+        return self._host
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    def _connector(self, limit: int,
+                   keepalive_timeout: float) -> BaseConnector:
+        return TCPConnector(limit=limit, keepalive_timeout=keepalive_timeout,
+                            ssl=self._ssl if self._ssl is not None else False)
+
+    async def open_connection(self) -> Tuple[asyncio.StreamReader,
+                                             asyncio.StreamWriter]:
+        return await asyncio.open_connection(self._host, self._port,
+                                             ssl=self._ssl)
+
+
+def tls_context(cert_path: Optional[str] = None,
+                verify: bool = True) -> ssl.SSLContext:
+    """
+    A TLS context for a daemon protected as in Docker's documentation, from
+    the ca.pem, cert.pem and key.pem in `cert_path`, by default
+    `DOCKER_CERT_PATH` or ~/.docker. The daemon's certificate is checked
+    against ca.pem unless `verify` is False.
+    """
+    if cert_path is None:
+        cert_path = os.environ.get("DOCKER_CERT_PATH",
+                                   os.path.expanduser("~/.docker"))
+    ctx = ssl.create_default_context(
+        cafile=os.path.join(cert_path, "ca.pem") if verify else None)
+    if not verify:
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    ctx.load_cert_chain(os.path.join(cert_path, "cert.pem"),
+                        os.path.join(cert_path, "key.pem"))
+    return ctx
+
+
+def transport_from_url(url: str, ssl_context: Optional[ssl.SSLContext] = None,
+                       **kwargs: Any) -> Union[DockerSock, DockerTCP]:
+    """
+    The transport for a `DOCKER_HOST` style URL, "unix:///path/to/sock" or
+    "tcp://host:port". `kwargs` are the pool settings.
+    """
+    parts = urlsplit(url)
+    if parts.scheme == "unix":
+        return DockerSock(parts.path, **kwargs)
+    if parts.scheme == "tcp" and parts.hostname:
+        default_port = 2376 if ssl_context is not None else 2375
+        return DockerTCP(parts.hostname, parts.port or default_port,
+                         ssl_context=ssl_context, **kwargs)
+    raise ValueError("Unsupported Docker host: %s" % url)
@@ -1,5 +1,6 @@
 # flake8: noqa
-from typing import Any, Dict, List, Tuple, Union
+import importlib
+from typing import Any, Dict, List, TYPE_CHECKING, Tuple, Union
 
 JsonDict = Dict[str, Any]
 
@@ -7,17 +8,38 @@ DockerJSON = Union[List[JsonDict], JsonDict]
 # Docker sometimes returns streamed JSON. We also want the HTTP code as int.
 DockerJSONResponse = Tuple[int, DockerJSON]
 
-from ufaas_dockerapi.config import ConfigBase
-from ufaas_dockerapi.container import ContainerAPIBase
-from ufaas_dockerapi.exec import ExecAPIBase
-from ufaas_dockerapi.image import ImageAPIBase
-from ufaas_dockerapi.system import SystemAPIBase
-from ufaas_dockerapi.transports import DockerSock
+from ufaas_dockerapi.transports import DockerSock, DockerTCP
 
-TransportType = Union[DockerSock]
+TransportType = Union[DockerSock, DockerTCP]
 
-ContainerAPIType = ContainerAPIBase
-ImageAPIType = ImageAPIBase
-ExecAPIType = ExecAPIBase
-SystemAPIType = SystemAPIBase
-ConfigType = ConfigBase
\ No newline at end of file
+# The configs and API modules are only imported when first used, see
+# `DockerClient`, and so are these names at runtime.
+_LAZY = {
+    "ContainerAPIType": ("ufaas_dockerapi.container", "ContainerAPIBase"),
+    "ImageAPIType": ("ufaas_dockerapi.image", "ImageAPIBase"),
+    "ExecAPIType": ("ufaas_dockerapi.exec", "ExecAPIBase"),
+    "SystemAPIType": ("ufaas_dockerapi.system", "SystemAPIBase"),
+    "ConfigType": ("ufaas_dockerapi.config", "ConfigBase"),
+}
+
+if TYPE_CHECKING:
+    from ufaas_dockerapi.config import ConfigBase
+    from ufaas_dockerapi.container import ContainerAPIBase
+    from ufaas_dockerapi.exec import ExecAPIBase
+    from ufaas_dockerapi.image import ImageAPIBase
+    from ufaas_dockerapi.system import SystemAPIBase
+
+    ContainerAPIType = ContainerAPIBase
+    ImageAPIType = ImageAPIBase
+    ExecAPIType = ExecAPIBase
+    SystemAPIType = SystemAPIBase
+    ConfigType = ConfigBase
+else:
+    def __getattr__(name: str) -> Any:
+        if name not in _LAZY:
+            raise AttributeError("module %r has no attribute %r" % (
+                __name__, name))
+        module, attr = _LAZY[name]
+        value = getattr(importlib.import_module(module), attr)
+        globals()[name] = value
+        return value
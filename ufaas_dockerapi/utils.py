@@ -1,48 +1,428 @@
-import json
-from typing import List, Optional, TYPE_CHECKING
+import asyncio
+import time
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, Iterable,
+                    Optional, TYPE_CHECKING, Tuple, TypeVar)
+from urllib.parse import urlsplit
 
-from aiohttp import ClientWebSocketResponse
+from aiohttp import (ClientConnectionError, ClientResponse,
+                     ClientResponseError, ClientSession, ClientTimeout,
+                     ClientWebSocketResponse)
 
+import async_timeout
+
+from ufaas_dockerapi.codec import JSONCodec, loads_yielding
 from ufaas_dockerapi.exceptions import DockerAPIException
+from ufaas_dockerapi.limiter import (IDEMPOTENT_METHODS, OVERLOAD_STATUSES,
+                                     latency_signal, remaining)
+from ufaas_dockerapi.metrics import RequestTrace, current_trace
+from ufaas_dockerapi.streams import JSONStreamDecoder
 from ufaas_dockerapi.types import DockerJSONResponse, JsonDict
 
 if TYPE_CHECKING:
+    from aiohttp.client import _RequestContextManager
+
     from ufaas_dockerapi.client import DockerClient
 
+# For streams that can be quiet for any length of time, such as events and
+# followed logs, which mustn't be cut off by the session's timeouts.
+STREAM_TIMEOUT = ClientTimeout(total=None, sock_read=None)
+# Size of the reads and writes made when streaming files to or from Docker.
+FILE_CHUNK_SIZE = 1024 * 1024
 
-async def api_call(client: 'DockerClient', method: str, uri: str,
-                   params: Optional[JsonDict] = None,
-                   json_body: Optional[JsonDict] = None,
-                   streaming: bool = False) -> DockerJSONResponse:
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def _request(session: ClientSession, codec: JSONCodec, method: str, uri: str,
+             params: Optional[JsonDict] = None,
+             json_body: Optional[JsonDict] = None,
+             trace: Optional[RequestTrace] = None,
+             **kwargs: Any) -> '_RequestContextManager':
     """
-    Helper method to perform a HTTP requests and handle responses from the
-    Docker API.
+    Returns the request context manager for the HTTP verb `method`, with
+    `json_body` encoded by `codec`. `kwargs` are passed on to aiohttp.
     """
+    if json_body is not None:
+        kwargs["data"] = codec.dumps(json_body)
+        kwargs["headers"] = {"Content-Type": "application/json"}
     if method.upper() == "GET":
-        sess = client._session.get(uri, params=params, json=json_body)
+        return session.get(uri, params=params, trace_request_ctx=trace,
+                           **kwargs)
     elif method.upper() == "PUT":
-        sess = client._session.put(uri, params=params, json=json_body)
+        return session.put(uri, params=params, trace_request_ctx=trace,
+                           **kwargs)
     elif method.upper() == "POST":
-        sess = client._session.post(uri, params=params, json=json_body)
+        return session.post(uri, params=params, trace_request_ctx=trace,
+                            **kwargs)
     elif method.upper() == "DELETE":
-        sess = client._session.delete(uri, params=params, json=json_body)
+        return session.delete(uri, params=params, trace_request_ctx=trace,
+                              **kwargs)
     else:
         raise Exception("Unknown HTTP verb: %s" % method)
-    async with sess as resp:
-        if resp.status in (200, 201, 204):
-            if streaming:
-                statuses: List[str] = (await resp.text()).split("\r\n")
-                return (resp.status, [json.loads(i)
-                        for i in statuses if i != ""])
-            else:
-                if 'CONTENT-TYPE' in resp.headers:
-                    # Responses that have a body.
-                    return (resp.status, await resp.json())
-                else:
-                    # Responses without a body can't have JSON.
-                    return (resp.status, {"message": "No body in response."})
+
+
+async def decode_json(client: 'DockerClient', data: bytes) -> Any:
+    """
+    Decode a response body with the client's codec. Bodies larger than the
+    client's `decode_threshold` are decoded in the default executor, see
+    `codec.loads_yielding`, so that the event loop isn't held up.
+    """
+    if len(data) > client._decode_threshold:
+        return await asyncio.get_event_loop().run_in_executor(
+            None, loads_yielding, client._codec, data)
+    return client._codec.loads(data)
+
+
+async def _read_error(client: 'DockerClient',
+                      resp: ClientResponse) -> DockerAPIException:
+    return DockerAPIException(resp.status,
+                              client._codec.loads(await resp.read()))
+
+
+async def _read_response(client: 'DockerClient', resp: ClientResponse,
+                         streaming: bool) -> DockerJSONResponse:
+    # 304 is returned when starting a running container, or stopping a
+    # stopped one, which isn't an error.
+    if resp.status in (200, 201, 204, 304):
+        if streaming:
+            statuses = (await resp.read()).split(b"\r\n")
+            return (resp.status, [client._codec.loads(i)
+                    for i in statuses if i != b""])
         else:
-            raise DockerAPIException(resp.status, await resp.json())
+            if 'CONTENT-TYPE' in resp.headers:
+                # Responses that have a body.
+                return (resp.status,
+                        await decode_json(client, await resp.read()))
+            else:
+                # Responses without a body can't have JSON.
+                return (resp.status, {"message": "No body in response."})
+    else:
+        raise await _read_error(client, resp)
+
+
+async def versioned(client: 'DockerClient', uri: str) -> str:
+    """
+    `uri` with the client's API version after the base URL, negotiating the
+    version first if it isn't known yet, see `DockerClient.api_version`.
+    """
+    prefix = client._prefix
+    if prefix is None:
+        await client.api_version()
+        prefix = client._prefix
+        assert prefix is not None
+    base = client._base_url
+    if not uri.startswith(base):
+        return uri
+    return base + prefix + uri[len(base):]
+
+
+async def _api_call_once(client: 'DockerClient', method: str, uri: str,
+                         params: Optional[JsonDict],
+                         json_body: Optional[JsonDict],
+                         streaming: bool) -> DockerJSONResponse:
+    metrics = client._metrics
+    if metrics is None:
+        async with _request(client._session, client._codec, method, uri,
+                            params=params, json_body=json_body) as resp:
+            return await _read_response(client, resp, streaming)
+
+    trace = RequestTrace(method, uri)
+    async with _request(client._session, client._codec, method, uri,
+                        params=params, json_body=json_body,
+                        trace=trace) as resp:
+        try:
+            return await _read_response(client, resp, streaming)
+        finally:
+            metrics.record(trace.finish(resp.status))
+
+
+async def _api_call_limited(client: 'DockerClient', method: str, uri: str,
+                            params: Optional[JsonDict],
+                            json_body: Optional[JsonDict],
+                            streaming: bool) -> DockerJSONResponse:
+    retry = client._retry
+    timed = latency_signal(method, uri)
+    timeout = None
+    if retry is not None and timed:
+        timeout = retry.attempt_timeout
+    if client._limits is None:
+        async with async_timeout.timeout(timeout):
+            return await _api_call_once(client, method, uri, params,
+                                        json_body, streaming)
+
+    limiter = client._limits.get(method, uri)
+    started = await limiter.acquire()
+    overloaded = False
+    try:
+        async with async_timeout.timeout(timeout):
+            return await _api_call_once(client, method, uri, params,
+                                        json_body, streaming)
+    except (asyncio.TimeoutError, ClientConnectionError):
+        overloaded = True
+        raise
+    except DockerAPIException as e:
+        overloaded = e.http_status in OVERLOAD_STATUSES
+        raise
+    finally:
+        limiter.release(started, overloaded, timed=timed)
+
+
+async def api_call(client: 'DockerClient', method: str, uri: str,
+                   params: Optional[JsonDict] = None,
+                   json_body: Optional[JsonDict] = None,
+                   streaming: bool = False,
+                   idempotent: Optional[bool] = None) -> DockerJSONResponse:
+    """
+    Helper method to perform a HTTP requests and handle responses from the
+    Docker API.
+
+    If the client has `limits` the request waits for a slot in its class of
+    endpoint first. If it has a `retry` policy and the request is
+    `idempotent`, by default only if it's a GET, it is retried when dockerd
+    can't be reached, is overloaded or too slow. The whole call is limited
+    to the client's `call_timeout` and the current `limiter.deadline`. See
+    `ufaas_dockerapi.limiter`.
+    """
+    uri = await versioned(client, uri)
+    retry = client._retry
+    timeout = remaining(client._call_timeout)
+    if client._limits is None and retry is None and timeout is None:
+        return await _api_call_once(client, method, uri, params, json_body,
+                                    streaming)
+
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    attempts = retry.attempts if retry is not None and idempotent else 1
+    attempt = 1
+    async with async_timeout.timeout(timeout):
+        while True:
+            try:
+                return await _api_call_limited(client, method, uri, params,
+                                               json_body, streaming)
+            except DockerAPIException as e:
+                if (attempt == attempts or
+                        e.http_status not in OVERLOAD_STATUSES):
+                    raise
+            except (asyncio.TimeoutError, ClientConnectionError):
+                if attempt == attempts:
+                    raise
+            assert retry is not None
+            await asyncio.sleep(retry.delay(attempt))
+            attempt += 1
+
+
+async def api_open(client: 'DockerClient', method: str, uri: str,
+                   params: Optional[JsonDict] = None,
+                   json_body: Optional[JsonDict] = None,
+                   trace: Optional[RequestTrace] = None,
+                   timeout: Optional[ClientTimeout] = None,
+                   data: Optional[AsyncIterator[bytes]] = None,
+                   content_type: Optional[str] = None) -> ClientResponse:
+    """
+    Helper method to perform a HTTP request for a long-lived stream and return
+    the response without reading the body. The caller must release the
+    response once done with it. `timeout` overrides the session's timeouts,
+    which streams that may go quiet for a long time need to.
+
+    Instead of `json_body` the request body can be streamed from `data`, as
+    `content_type`, see `read_file`.
+
+    If the client has a metrics sink the request is recorded once the headers
+    have arrived, unless a `trace` is passed in which case the caller records
+    it once the body has been read.
+    """
+    uri = await versioned(client, uri)
+    metrics = client._metrics
+    kwargs: Dict[str, Any] = {}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    if data is not None:
+        kwargs["data"] = data
+        kwargs["headers"] = {
+            "Content-Type": content_type or "application/octet-stream"}
+    if metrics is not None and trace is None:
+        own_trace = RequestTrace(method, uri)
+        resp = await _request(client._stream_session, client._codec,
+                              method, uri, params=params, json_body=json_body,
+                              trace=own_trace, **kwargs)
+        metrics.record(own_trace.finish(resp.status, body=False))
+    else:
+        resp = await _request(client._stream_session, client._codec,
+                              method, uri, params=params, json_body=json_body,
+                              trace=trace, **kwargs)
+    if resp.status not in (200, 201, 204):
+        try:
+            raise await _read_error(client, resp)
+        finally:
+            resp.release()
+    return resp
+
+
+async def api_stream(client: 'DockerClient', method: str, uri: str,
+                     params: Optional[JsonDict] = None,
+                     json_body: Optional[JsonDict] = None,
+                     timeout: Optional[ClientTimeout] = None,
+                     data: Optional[AsyncIterator[bytes]] = None,
+                     content_type: Optional[str] = None
+                     ) -> AsyncIterator[JsonDict]:
+    """
+    Helper method to perform a HTTP request and yield each JSON message of a
+    streamed response as soon as it has arrived, rather than waiting for the
+    whole body like `api_call` does. `data` and `content_type` are passed on
+    to `api_open`.
+    """
+    metrics = client._metrics
+    trace = RequestTrace(method, uri) if metrics is not None else None
+    status = 0
+    try:
+        resp = await api_open(client, method, uri, params=params,
+                              json_body=json_body, trace=trace,
+                              timeout=timeout, data=data,
+                              content_type=content_type)
+        status = resp.status
+        try:
+            decoder = JSONStreamDecoder(loads=client._codec.loads)
+            async for chunk in resp.content.iter_any():
+                if trace is not None:
+                    trace.bytes_in += len(chunk)
+                for msg in decoder.feed(chunk):
+                    yield msg
+            for msg in decoder.flush():
+                yield msg
+        finally:
+            resp.release()
+    except DockerAPIException as e:
+        status = e.http_status
+        raise
+    finally:
+        if metrics is not None and trace is not None:
+            metrics.record(trace.finish(status))
+
+
+async def api_upload(client: 'DockerClient', method: str, uri: str,
+                     data: AsyncIterator[bytes], content_type: str,
+                     params: Optional[JsonDict] = None) -> DockerJSONResponse:
+    """
+    Helper method to perform a HTTP request with a body streamed from `data`
+    and handle the response like `api_call` does. There is no time limit, as
+    large bodies can take any time to send.
+    """
+    resp = await api_open(client, method, uri, params=params,
+                          timeout=STREAM_TIMEOUT, data=data,
+                          content_type=content_type)
+    try:
+        return await _read_response(client, resp, False)
+    finally:
+        resp.release()
+
+
+async def read_file(path: str, chunk_size: int = FILE_CHUNK_SIZE
+                    ) -> AsyncIterator[bytes]:
+    """
+    Yield the contents of a file in chunks of `chunk_size` bytes, read in the
+    default executor so the event loop isn't blocked on disk. The next chunk
+    is read while the current one is being sent, and at most two are in
+    memory at once however large the file.
+    """
+    loop = asyncio.get_event_loop()
+    with open(path, "rb") as f:
+        pending = loop.run_in_executor(None, f.read, chunk_size)
+        try:
+            while True:
+                # Shielded so that being cancelled doesn't cancel the wait
+                # for the read below.
+                chunk = await asyncio.shield(pending)
+                if not chunk:
+                    break
+                pending = loop.run_in_executor(None, f.read, chunk_size)
+                yield chunk
+        finally:
+            # The file mustn't be closed under a read that's still running.
+            await asyncio.wait([pending])
+
+
+async def write_file(resp: ClientResponse, path: str,
+                     chunk_size: int = FILE_CHUNK_SIZE) -> int:
+    """
+    Write the body of a response to a file as it arrives, in writes of about
+    `chunk_size` bytes made in the default executor. Returns the number of
+    bytes written.
+    """
+    loop = asyncio.get_event_loop()
+    written = 0
+    buf = bytearray()
+    with open(path, "wb") as f:
+        async for data in resp.content.iter_any():
+            buf += data
+            if len(buf) >= chunk_size:
+                chunk, buf = buf, bytearray()
+                await loop.run_in_executor(None, f.write, chunk)
+                written += len(chunk)
+        if buf:
+            await loop.run_in_executor(None, f.write, buf)
+            written += len(buf)
+    return written
+
+
+async def api_hijack(client: 'DockerClient', method: str, uri: str,
+                     json_body: Optional[JsonDict] = None
+                     ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """
+    Helper method to perform a HTTP request with `Upgrade: tcp` on a new
+    connection and, once Docker has accepted it, return the connection for
+    use as a raw bidirectional stream. The caller must close the writer.
+    """
+    uri = await versioned(client, uri)
+    metrics = client._metrics
+    trace = RequestTrace(method, uri) if metrics is not None else None
+    codec = client._codec
+    body = codec.dumps(json_body) if json_body is not None else b""
+    parts = urlsplit(uri)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    head = ("%s %s HTTP/1.1\r\n"
+            "Host: docker\r\n"
+            "Content-Type: application/json\r\n"
+            "Content-Length: %d\r\n"
+            "Connection: Upgrade\r\n"
+            "Upgrade: tcp\r\n\r\n" % (method.upper(), path, len(body)))
+    request = head.encode() + body
+
+    status = 0
+    reader, writer = await client._transport.open_connection()
+    try:
+        writer.write(request)
+        await writer.drain()
+        status_line, _, header_block = (
+            await reader.readuntil(b"\r\n\r\n")).partition(b"\r\n")
+        status = int(status_line.split(None, 2)[1])
+        if trace is not None:
+            trace.headers_at = time.perf_counter()
+            trace.bytes_out = len(request)
+            trace.bytes_in = len(status_line) + len(header_block) + 2
+        # Docker answers 101 to an upgrade, older versions hijack the
+        # connection with a 200.
+        if status not in (101, 200):
+            headers = {}
+            for line in header_block.decode("latin-1").split("\r\n"):
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            if "content-length" in headers:
+                data = await reader.readexactly(
+                    int(headers["content-length"]))
+            else:
+                data = await reader.read()
+            try:
+                message = codec.loads(data)
+            except ValueError:
+                message = {"message": data.decode(errors="replace")}
+            raise DockerAPIException(status, message)
+    except BaseException:
+        writer.close()
+        raise
+    finally:
+        if metrics is not None and trace is not None:
+            metrics.record(trace.finish(status, body=False))
+    return reader, writer
 
 
 async def api_get(client: 'DockerClient', uri: str,
@@ -59,12 +439,15 @@ async def api_get(client: 'DockerClient', uri: str,
 async def api_post(client: 'DockerClient', uri: str,
                    params: Optional[JsonDict] = None,
                    json_body: Optional[JsonDict] = None,
-                   streaming: bool = False) -> DockerJSONResponse:
+                   streaming: bool = False,
+                   idempotent: bool = False) -> DockerJSONResponse:
     """
     Helper method to perform a POST and handle responses from the Docker API.
+    POSTs are only retried if `idempotent`.
     """
     return await api_call(client, "POST", uri, params=params,
-                          json_body=json_body, streaming=streaming)
+                          json_body=json_body, streaming=streaming,
+                          idempotent=idempotent)
 
 
 async def api_delete(client: 'DockerClient', uri: str,
@@ -85,8 +468,23 @@ async def get_websocket(client: 'DockerClient',
     If you want query params you must build them and add them to the URI.
     Extra parameters to ws_connect other than uri shouldn't be needed...
     """
-    session = client._session
-    return await session.ws_connect(uri)
+    uri = await versioned(client, uri)
+    session = client._stream_session
+    metrics = client._metrics
+    if metrics is None:
+        return await session.ws_connect(uri)
+
+    trace = RequestTrace("GET", uri)
+    token = current_trace.set(trace)
+    status = 101
+    try:
+        return await session.ws_connect(uri)
+    except ClientResponseError as e:
+        status = e.status
+        raise
+    finally:
+        current_trace.reset(token)
+        metrics.record(trace.finish(status))
 
 
 def convert_bool(d: JsonDict) -> JsonDict:
@@ -111,3 +509,45 @@ def strip_nulls(d: JsonDict) -> JsonDict:
     are not needlessly added to the URI parameters.
     """
     return {k: v for k, v in d.items() if v is not None}
+
+
+async def bounded_map(fn: Callable[[T], Awaitable[R]], items: Iterable[T],
+                      concurrency: int
+                      ) -> AsyncIterator[Tuple[T, Optional[R],
+                                               Optional[Exception]]]:
+    """
+    Call `fn` on every item with at most `concurrency` calls in flight,
+    yielding `(item, result, exception)` as each call finishes. A failed call
+    doesn't stop the others, its exception is yielded instead of a result.
+    `items` is consumed lazily so it may be a generator.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1.")
+    remaining = iter(items)
+    pending: Dict['asyncio.Future[R]', T] = {}
+
+    def fill() -> None:
+        for item in remaining:
+            pending[asyncio.ensure_future(fn(item))] = item
+            if len(pending) >= concurrency:
+                return
+
+    fill()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            finished = [(pending.pop(fut), fut) for fut in done]
+            # Keep dockerd busy while the caller handles the results.
+            fill()
+            for item, fut in finished:
+                exc = fut.exception()
+                if exc is None:
+                    yield (item, fut.result(), None)
+                elif isinstance(exc, Exception):
+                    yield (item, None, exc)
+                else:
+                    raise exc
+    finally:
+        for fut in pending:
+            fut.cancel()
@@ -0,0 +1,87 @@
+"""
+Negotiation of the Docker Engine API version requests are made with.
+
+A client that isn't given a version asks Docker for its own with `/_ping`,
+or `/version` if the ping doesn't say, before its first request and then
+uses the highest version both support, prefixing every path with it. The
+result is remembered by the transport so that later clients of the same
+daemon skip the round trip.
+"""
+
+from typing import Optional, TYPE_CHECKING, Tuple
+
+import async_timeout
+
+from ufaas_dockerapi.exceptions import APIVersionError, DockerAPIException
+from ufaas_dockerapi.limiter import remaining
+
+if TYPE_CHECKING:
+    from ufaas_dockerapi.client import DockerClient
+
+APIVersion = Tuple[int, int]
+
+# The range of API versions the client can speak.
+MIN_API_VERSION: APIVersion = (1, 25)
+MAX_API_VERSION: APIVersion = (1, 39)
+
+
+def parse_version(text: str) -> APIVersion:
+    """
+    A version such as "1.39" as a tuple of ints.
+    """
+    major, _, minor = text.strip().lstrip("v").partition(".")
+    try:
+        return int(major), int(minor or 0)
+    except ValueError:
+        raise ValueError("Invalid API version: %r" % text) from None
+
+
+def format_version(version: APIVersion) -> str:
+    return "%d.%d" % version
+
+
+def choose_version(server_max: APIVersion,
+                   server_min: Optional[APIVersion] = None,
+                   client_min: APIVersion = MIN_API_VERSION,
+                   client_max: APIVersion = MAX_API_VERSION) -> APIVersion:
+    """
+    The highest version supported by both the client and Docker. Raises
+    `APIVersionError` if there isn't one.
+    """
+    version = min(server_max, client_max)
+    if version < client_min or (server_min is not None and
+                                version < server_min):
+        raise APIVersionError(
+            "No API version in common, Docker supports %s to %s and the "
+            "client %s to %s." % (
+                format_version(server_min) if server_min else "?",
+                format_version(server_max), format_version(client_min),
+                format_version(client_max)))
+    return version
+
+
+async def negotiate(client: 'DockerClient') -> APIVersion:
+    """
+    Ask Docker which API versions it supports and choose one, see
+    `choose_version`. The client's `call_timeout` applies.
+    """
+    session = client._session
+    base = client._base_url
+    async with async_timeout.timeout(remaining(client._call_timeout)):
+        async with session.get("%s/_ping" % base) as resp:
+            if resp.status != 200:
+                raise DockerAPIException(resp.status,
+                                         {"message": await resp.text()})
+            header = resp.headers.get("API-Version")
+        if header:
+            return choose_version(parse_version(header))
+
+        async with session.get("%s/version" % base) as resp:
+            data = await resp.read()
+            if resp.status != 200:
+                raise DockerAPIException(
+                    resp.status, {"message": data.decode(errors="replace")})
+        info = client.codec.loads(data)
+    server_min = info.get("MinAPIVersion")
+    return choose_version(parse_version(info["ApiVersion"]),
+                          parse_version(server_min) if server_min else None)
@@ -0,0 +1,291 @@
+"""
+Futures for container exits, all resolved from a single shared events
+subscription, so that waiting on thousands of containers uses one connection
+rather than holding a `/containers/{id}/wait` request open for each.
+
+    futures = client.container.wait_many(["fn-1", "fn-2"], timeout=30)
+    status = await futures["fn-1"]
+    print(status.exit_code, status.oom_killed)
+
+The subscription is opened by the first wait and closed once nothing is
+being waited on. The containers are listed when their waits start, and again
+whenever the subscription is reconnected, so that exits which happened
+before or in between aren't missed. Exit codes the die event doesn't give
+are read with an inspect.
+
+Event timestamps are the daemon's clock, which needn't agree with ours, so
+events aren't told apart by time. A die event from before a container was
+listed as running may be of an earlier exit, so it only leads to an inspect
+of the container, which resolves the wait if it's still not running.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, TYPE_CHECKING, cast
+
+from ufaas_dockerapi.exceptions import DockerAPIException
+from ufaas_dockerapi.state import StateCache
+from ufaas_dockerapi.utils import bounded_map
+
+if TYPE_CHECKING:
+    from ufaas_dockerapi.client import DockerClient
+    from ufaas_dockerapi.container import ContainerAPI
+    from ufaas_dockerapi.system import SystemAPI
+    from ufaas_dockerapi.types import JsonDict
+
+# Number of simultaneous inspects made for exit codes.
+INSPECT_CONCURRENCY = 16
+
+# Docker's states of containers that have exited.
+_EXITED = ("exited", "dead")
+
+
+class ExitStatus(NamedTuple):
+    """
+    How a container exited.
+    """
+    exit_code: int
+    oom_killed: bool
+
+
+class _Wait:
+    def __init__(self, container: str,
+                 future: 'asyncio.Future[ExitStatus]') -> None:
+        self.container = container
+        self.future = future
+        self.id: Optional[str] = None
+        # Whether the container has been listed as not having exited, after
+        # which its die events are of exits since the wait started.
+        self.listed = False
+        # Whether a die event came before then.
+        self.died = False
+        self.oom_killed = False
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class ExitWaiter:
+    """
+    Hands out futures for the exits of containers, see `wait`. The events
+    subscription is reconnected after `reconnect_delay` seconds if it drops.
+
+    A client has one, used by `ContainerAPI.wait_many` and
+    `Container.wait`, which is closed with the client.
+    """
+    def __init__(self, client: 'DockerClient',
+                 reconnect_delay: float = 1.0) -> None:
+        self._client = client
+        self._reconnect_delay = reconnect_delay
+        self._pending: Set[_Wait] = set()
+        # Pending waits by the name or ID they were made with, and by the
+        # container's ID once it is known.
+        self._waits: Dict[str, Set[_Wait]] = {}
+        # Waits whose container is to be listed, or inspected.
+        self._unlisted: List[_Wait] = []
+        self._uninspected: List[_Wait] = []
+        self._task: Optional['asyncio.Task[None]'] = None
+        self._checker: Optional['asyncio.Task[None]'] = None
+        # Number of times the events stream has been opened.
+        self.subscriptions = 0
+        # Why the events stream last failed, if it has.
+        self.last_error: Optional[Exception] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def subscribed(self) -> bool:
+        """
+        Whether the events subscription is open, or being reconnected.
+        """
+        return self._task is not None
+
+    def wait(self, container: str, timeout: Optional[float] = None
+             ) -> 'asyncio.Future[ExitStatus]':
+        """
+        A future resolved with the exit status of a container, by name or
+        ID, once it exits. A container that has already exited resolves with
+        its last exit status, one that has been created but not started is
+        waited on until it exits.
+
+        The future fails with `asyncio.TimeoutError` after `timeout` seconds,
+        and with `DockerAPIException` if the container doesn't exist. It can
+        be cancelled to stop waiting.
+        """
+        loop = asyncio.get_event_loop()
+        future: 'asyncio.Future[ExitStatus]' = loop.create_future()
+        wait = _Wait(container, future)
+        self._pending.add(wait)
+        self._index(container, wait)
+        if timeout is not None:
+            wait.timer = loop.call_later(timeout, self._timeout, wait,
+                                         timeout)
+        future.add_done_callback(lambda _: self._forget(wait))
+
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run(time.time() - 1))
+            self._task.add_done_callback(self._finished)
+        self._unlisted.append(wait)
+        self._check_later()
+        return future
+
+    async def close(self) -> None:
+        """
+        Stop following events and cancel the pending waits.
+        """
+        for wait in list(self._pending):
+            wait.future.cancel()
+        for task in (self._task, self._checker):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._checker = None
+
+    def apply(self, event: 'JsonDict') -> None:
+        """
+        Resolve the waits on the container of a die event, or note that
+        it ran out of memory for an oom event.
+        """
+        action = event.get("Action")
+        if event.get("Type") != "container" or action not in ("die", "oom"):
+            return
+        actor = event.get("Actor", {})
+        cid = actor.get("ID", "")
+        attrs = actor.get("Attributes", {})
+        waits = (self._waits.get(cid, set()) |
+                 self._waits.get(attrs.get("name", ""), set()))
+
+        code = attrs.get("exitCode")
+        for wait in waits:
+            if wait.future.done():
+                continue
+            if not wait.listed:
+                # Left to the listing, an inspect reads OOMKilled.
+                wait.died = wait.died or action == "die"
+            elif action == "oom":
+                wait.oom_killed = True
+            elif code is not None:
+                wait.future.set_result(ExitStatus(int(code),
+                                                  wait.oom_killed))
+            else:
+                wait.id = cid
+                self._uninspected.append(wait)
+                self._check_later()
+
+    def _index(self, key: str, wait: _Wait) -> None:
+        self._waits.setdefault(key, set()).add(wait)
+
+    def _finished(self, task: 'asyncio.Task[None]') -> None:
+        # Let the next wait subscribe again, should the task end.
+        if self._task is task:
+            self._task = None
+
+    def _timeout(self, wait: _Wait, timeout: float) -> None:
+        if not wait.future.done():
+            wait.future.set_exception(asyncio.TimeoutError(
+                "Container %s didn't exit within %s seconds." % (
+                    wait.container, timeout)))
+
+    def _forget(self, wait: _Wait) -> None:
+        if wait.timer is not None:
+            wait.timer.cancel()
+        self._pending.discard(wait)
+        for key in (wait.container, wait.id):
+            if key is not None and key in self._waits:
+                self._waits[key].discard(wait)
+                if not self._waits[key]:
+                    del self._waits[key]
+        if not self._pending and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _check_later(self) -> None:
+        if self._checker is None:
+            self._checker = asyncio.ensure_future(self._check())
+
+    async def _check(self) -> None:
+        try:
+            while self._unlisted or self._uninspected:
+                # Let the waits started together share a list.
+                await asyncio.sleep(0)
+                waits = [w for w in self._unlisted if not w.future.done()]
+                self._unlisted = []
+                if waits:
+                    await self._list(waits)
+                waits = [w for w in self._uninspected if not w.future.done()]
+                self._uninspected = []
+                async for wait, _, error in bounded_map(
+                        self._inspect, waits, INSPECT_CONCURRENCY):
+                    if error is not None and not wait.future.done():
+                        wait.future.set_exception(error)
+        finally:
+            self._checker = None
+
+    async def _list(self, waits: List[_Wait]) -> None:
+        api = cast('ContainerAPI', self._client.container)
+        try:
+            _, res = await api.list(all=True, use_cache=False)
+        except Exception as e:
+            for wait in waits:
+                if not wait.future.done():
+                    wait.future.set_exception(e)
+            return
+        # Containers are looked up by name, ID or ID prefix like Docker does.
+        states = StateCache(self._client)
+        states.load(res)  # type: ignore
+        for wait in waits:
+            state = states.get(wait.container)
+            if wait.future.done():
+                continue
+            if state is None:
+                wait.future.set_exception(DockerAPIException(404, {
+                    "message": "No such container: %s" % wait.container}))
+            elif state.status in _EXITED:
+                wait.id = state.id
+                self._uninspected.append(wait)
+            else:
+                wait.id = state.id
+                wait.listed = True
+                self._index(state.id, wait)
+                if wait.died:
+                    self._uninspected.append(wait)
+
+    async def _inspect(self, wait: _Wait) -> None:
+        api = cast('ContainerAPI', self._client.container)
+        _, info = await api.inspect(wait.id or wait.container,
+                                    use_cache=False)
+        assert isinstance(info, dict)
+        state = info["State"]
+        if wait.died and state.get("Status") not in _EXITED:
+            # The die event was of an earlier exit.
+            wait.died = False
+            return
+        if not wait.future.done():
+            wait.future.set_result(ExitStatus(
+                int(state.get("ExitCode", 0)),
+                bool(state.get("OOMKilled")) or wait.oom_killed))
+
+    async def _run(self, since: float) -> None:
+        system = cast('SystemAPI', self._client.system)
+        while True:
+            try:
+                self.subscriptions += 1
+                async for event in system.events(
+                        since=since,
+                        filters={"type": ["container"],
+                                 "event": ["die", "oom"]}):
+                    self.apply(event)
+            except Exception as e:
+                # Timeouts from the client's `call_timeout` or retry policy
+                # included, so that the waits are never left unfollowed.
+                self.last_error = e
+            # Events missed while reconnecting are replayed, but dockerd
+            # only keeps so many, so the containers are listed again too.
+            since = time.time() - 1
+            await asyncio.sleep(self._reconnect_delay)
+            self._unlisted.extend(self._pending)
+            self._check_later()